@@ -0,0 +1,224 @@
+"""
+Bulk maintenance of the room store, spread over a process pool.
+
+    python admin.py scan                       # rooms per phase, schema and player count
+    python admin.py validate                   # list rooms that don't load or don't add up
+    python admin.py migrate [--dry-run]        # rewrite rooms stored in an older schema or encoding
+    python admin.py export --output scores.csv # every player's score, one CSV row per player
+    python admin.py compact                    # fold event logs into snapshots / vacuum SQLite
+
+Rooms are handed to the workers in chunks and read with the same loader as
+load_game_state, so results match what the app sees; only one chunk per
+worker is in memory at a time. Every finished chunk is appended to a
+checkpoint file, and --resume picks an interrupted run up where it stopped.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from typing import Dict, Iterator, List
+
+import codec
+import config
+import storage
+from game_logic import SCHEMA_VERSION, Game
+
+COMMANDS = ('scan', 'validate', 'migrate', 'export', 'compact')
+EXPORT_FIELDS = ('room_code', 'phase', 'player', 'is_host', 'score')
+
+
+def _init_worker(backend: str) -> None:
+    storage.set_store(storage.create_store(backend))
+
+
+def _problems(room_code: str, game: Game) -> List[str]:
+    """Ways a loaded room contradicts itself"""
+    problems = []
+    names = {player.name for player in game.players}
+    if game.room_code != room_code:
+        problems.append(f"stored under {room_code} but its code is {game.room_code}")
+    if game.phase not in codec.PHASES:
+        problems.append(f"unknown phase {game.phase!r}")
+    if len(names) != len(game.players):
+        problems.append("duplicate player names")
+    if game.players and not any(player.is_host for player in game.players):
+        problems.append("no host")
+    if game.phase not in ("lobby", "round_setup") and game.imposter is None:
+        problems.append(f"no imposter in phase {game.phase}")
+    for voter, voted_for in game.votes.items():
+        if voter not in names or voted_for not in names:
+            problems.append(f"vote {voter} -> {voted_for} names someone not in the room")
+    return problems
+
+
+def _needs_rewrite(store: storage.RoomStore, room_code: str, data: Dict) -> bool:
+    """Whether a room is stored in an older schema or encoding than this version writes"""
+    if data.get('schema', 1) < SCHEMA_VERSION:
+        return True
+    if isinstance(store, storage.RoomFileStore):
+        return not os.path.exists(store.path(room_code))
+    if isinstance(store, storage.SqliteStore):
+        row = store._connect().execute(
+            'SELECT typeof(data) FROM rooms WHERE room_code = ?', (room_code,)
+        ).fetchone()
+        return row is not None and row[0] == 'text'
+    return False
+
+
+def run_chunk(command: str, room_codes: List[str], dry_run: bool = False) -> Dict:
+    """Run one command over some rooms; the result is merged by the parent"""
+    store = storage.get_store()
+    counts, problems, rows = Counter(), [], []
+    for room_code in room_codes:
+        counts['rooms'] += 1
+        try:
+            data = store.load(room_code)
+            if data is None:
+                counts['vanished'] += 1  # deleted since the listing
+                continue
+            game = storage.game_from_dict(data)
+        except (ValueError, KeyError, TypeError) as e:
+            counts['unreadable'] += 1
+            problems.append(f"{room_code}: unreadable: {type(e).__name__}: {e}")
+            continue
+
+        if command == 'scan':
+            counts[f'phase {game.phase}'] += 1
+            counts[f'schema {data.get("schema", 1)}'] += 1
+            counts[f'{len(game.players)} players'] += 1
+        elif command == 'validate':
+            found = _problems(room_code, game)
+            counts['invalid' if found else 'valid'] += 1
+            problems.extend(f"{room_code}: {problem}" for problem in found)
+        elif command == 'migrate':
+            if not _needs_rewrite(store, room_code, data):
+                counts['current'] += 1
+            elif dry_run:
+                counts['would migrate'] += 1
+            else:
+                # A forced update rewrites the room in the current schema and encoding
+                storage.update_game_state(room_code, lambda g: True)
+                counts['migrated'] += 1
+        elif command == 'export':
+            rows.extend((game.room_code, game.phase, player.name, int(player.is_host), player.score)
+                        for player in game.players)
+            counts['players'] += len(game.players)
+        elif command == 'compact':
+            if isinstance(store, storage.EventLogStore) and os.path.exists(store.log_path(room_code)):
+                store.compact(room_code)
+                counts['compacted'] += 1
+    return {'room_codes': room_codes, 'counts': dict(counts), 'problems': problems, 'rows': rows}
+
+
+def _run_chunk_args(args) -> Dict:
+    return run_chunk(*args)
+
+
+def _chunks(room_codes: List[str], size: int) -> Iterator[List[str]]:
+    for start in range(0, len(room_codes), size):
+        yield room_codes[start:start + size]
+
+
+def _read_checkpoint(path: str):
+    """Rooms already done and the counts they added up to"""
+    done, counts = set(), Counter()
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn line from the interruption; that chunk runs again
+                done.update(entry['room_codes'])
+                counts.update(entry['counts'])
+    except FileNotFoundError:
+        pass
+    return done, counts
+
+
+def _progress(done: int, total: int, start: float) -> None:
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed else 0
+    sys.stderr.write(f"\r{done}/{total} rooms  {rate:,.0f}/s  ")
+    sys.stderr.flush()
+
+
+def _vacuum(store: storage.RoomStore) -> None:
+    conn = store._connect()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.execute('VACUUM')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=COMMANDS)
+    parser.add_argument('--store', choices=['json', 'binary', 'sqlite', 'eventlog', 'broker'],
+                        default=config.STORE_BACKEND)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk', type=int, default=256, help="rooms per task")
+    parser.add_argument('--output', default='scores.csv', help="export: CSV file to write")
+    parser.add_argument('--dry-run', action='store_true', help="migrate: only count rooms that need it")
+    parser.add_argument('--checkpoint', help="progress file (default .admin-<command>.checkpoint)")
+    parser.add_argument('--resume', action='store_true', help="skip rooms an interrupted run already did")
+    args = parser.parse_args()
+
+    store = storage.create_store(args.store)
+    checkpoint_path = args.checkpoint or f'.admin-{args.command}.checkpoint'
+    done, counts = _read_checkpoint(checkpoint_path) if args.resume else (set(), Counter())
+    room_codes = [room_code for room_code in store.room_codes() if room_code not in done]
+    total = len(done) + len(room_codes)
+    if done:
+        print(f"Resuming: {len(done)} of {total} rooms already done")
+
+    export_file = writer = None
+    if args.command == 'export':
+        resuming_export = args.resume and done and os.path.exists(args.output)
+        export_file = open(args.output, 'a' if resuming_export else 'w', newline='', encoding='utf-8')
+        writer = csv.writer(export_file)
+        if not resuming_export:
+            writer.writerow(EXPORT_FIELDS)
+
+    start = time.perf_counter()
+    ctx = multiprocessing.get_context('spawn')
+    tasks = ((args.command, chunk, args.dry_run) for chunk in _chunks(room_codes, args.chunk))
+    with open(checkpoint_path, 'a' if args.resume else 'w', encoding='utf-8') as checkpoint, \
+            ctx.Pool(args.workers, initializer=_init_worker, initargs=(args.store,)) as pool:
+        checkpoint.write('\n')  # ends a line torn by the interruption, if any
+        for result in pool.imap_unordered(_run_chunk_args, tasks):
+            for problem in result['problems']:
+                sys.stderr.write('\r')
+                print(problem)
+            if writer is not None:
+                writer.writerows(result['rows'])
+                export_file.flush()  # rows are on disk before the checkpoint says so
+            checkpoint.write(json.dumps({'room_codes': result['room_codes'], 'counts': result['counts']}) + '\n')
+            checkpoint.flush()
+            counts.update(result['counts'])
+            done.update(result['room_codes'])
+            _progress(len(done), total, start)
+    sys.stderr.write('\n')
+    if export_file is not None:
+        export_file.close()
+
+    if args.command == 'compact' and isinstance(store, storage.SqliteStore):
+        _vacuum(store)
+        counts['vacuumed'] = 1
+    store.close()
+    os.remove(checkpoint_path)
+
+    print(f"{args.command}: {total} rooms in {time.perf_counter() - start:.2f}s")
+    for key, count in sorted(counts.items()):
+        if key != 'rooms':
+            print(f"  {key:<24}{count:>8}")
+    if args.command == 'export':
+        print(f"  written to {args.output}")
+    if args.command == 'validate' and (counts['invalid'] or counts['unreadable']):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+"""
+Headless JSON and WebSocket API for bots, native clients and kiosk screens.
+
+One asyncio event loop serves every connection; room reads and writes go
+through the same storage functions as the Streamlit app, on a small thread
+pool, so both front ends can share rooms.
+
+    POST /rooms                       {"name"}                   create a room, hosted by name
+    POST /rooms/<CODE>/join           {"name"}
+    POST /rooms/<CODE>/vote           {"name", "voted_for"}
+    POST /rooms/<CODE>/guess          {"name", "guess"}          the imposter's guess
+    POST /rooms/<CODE>/advance        {"name", "domain"?}        host: move the room to its next phase
+    GET  /rooms/<CODE>?name=<NAME>    the player's view of the room (the spectator view without a name)
+    GET  /rooms/<CODE>/events         WebSocket: {"room", "version", "phase"} on every change
+    GET  /health
+
+POST bodies may carry a "key": an update with a key already applied to the
+room is not applied again. Responses are the caller's view of the room
+(see views.py), or {"error": ...} with a 4xx status.
+
+    python api.py --address 0.0.0.0:8600
+"""
+import argparse
+import asyncio
+import base64
+import dataclasses
+import hashlib
+import json
+import logging
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import config
+import metrics
+import storage
+import views
+from broker import parse_address
+from data import get_catalog
+from game_logic import Game, Player
+from rooms import get_allocator
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_BODY = 64 * 1024
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+# What the host's "advance" does in each phase
+ADVANCE = {
+    "lobby": lambda g, body: g.start_round(),
+    "round_setup": lambda g, body: (g.set_domain(body.get('domain') or g.current_domain or next(iter(get_catalog()))),
+                                    g.select_item(), g.start_discussion()),
+    "discussion": lambda g, body: g.start_voting(),
+    "voting": lambda g, body: g.reveal_imposter(),
+    "reveal": lambda g, body: g.start_imposter_guess(),
+    "scores": lambda g, body: g.reset_round(),
+}
+
+
+class ApiError(Exception):
+    """Raised by request handlers to answer with an error status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def view_json(view: views.RoomView) -> Dict:
+    data = {f.name: getattr(view, f.name) for f in dataclasses.fields(view) if not f.name.startswith('_')}
+    data['players'] = [dataclasses.asdict(row) for row in view.players]
+    data['ranking'] = [row.name for row in view.ranking]
+    return data
+
+
+class RoomFeed:
+    """Room version changes fanned out to WebSocket subscribers on the event loop.
+
+    Saves made by this process arrive through a storage commit listener; rooms
+    with subscribers are also polled, once per WATCH_TICK each however many
+    subscribers they have, to pick up saves from other processes.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, executor: ThreadPoolExecutor):
+        self.loop = loop
+        self.executor = executor
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._versions: Dict[str, int] = {}
+
+    def committed(self, game: Game) -> None:
+        """Commit listener; runs on whichever thread saved or loaded the room"""
+        if game.room_code in self._subscribers:
+            self.loop.call_soon_threadsafe(self.publish, game.room_code, game.version, game.phase)
+
+    def publish(self, room_code: str, version: Optional[int], phase: Optional[str]) -> None:
+        seen = self._versions.get(room_code)
+        if version is not None and seen is not None and version <= seen:
+            return
+        self._versions[room_code] = version
+        message = {'room': room_code, 'version': version, 'phase': phase}
+        for queue in self._subscribers.get(room_code, ()):
+            if queue.full():
+                queue.get_nowait()  # a slow client only needs the latest version
+            queue.put_nowait(message)
+
+    def subscribe(self, room_code: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=16)
+        self._subscribers.setdefault(room_code, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, room_code: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(room_code)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[room_code]
+                self._versions.pop(room_code, None)
+
+    async def poll(self) -> None:
+        while True:
+            await asyncio.sleep(config.WATCH_TICK)
+            for room_code in list(self._subscribers):
+                game = await self.loop.run_in_executor(self.executor, storage.load_cached_game_state, room_code)
+                if game is None:
+                    self.publish(room_code, None, None)
+                else:
+                    self.publish(room_code, game.version, game.phase)
+
+
+class GameApi:
+    """Routes requests to room updates; blocking storage calls run on the executor"""
+
+    def __init__(self, threads: int = config.API_THREADS):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='api-store')
+        self.feed: Optional[RoomFeed] = None
+        self.address: Optional[Tuple[str, int]] = None
+        self.connections = 0
+
+    async def run(self, fn: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # Actions, run on the executor
+
+    def _update(self, room_code: str, name: str, key: Optional[str], check: Callable[[Game], None],
+                action: Callable[[Game], None]) -> Dict:
+        """Apply action if check passes on the current state; check raises ApiError to refuse"""
+        refused = []
+
+        def mutate(game):
+            refused.clear()  # mutate runs again if the room changed under it
+            try:
+                check(game)
+            except ApiError as e:
+                refused.append(e)
+                return False
+            action(game)
+
+        game = storage.update_game_state(room_code, mutate, key=key)
+        if game is None:
+            raise ApiError(404, f"Room {room_code} not found")
+        if refused:
+            raise refused[0]
+        return view_json(views.view_for(game, name))
+
+    @staticmethod
+    def _player(game: Game, name: str) -> None:
+        if game.get_player(name) is None:
+            raise ApiError(404, f"{name} is not in room {game.room_code}")
+
+    @staticmethod
+    def _phase(game: Game, phase: str) -> None:
+        if game.phase != phase:
+            raise ApiError(409, f"Room {game.room_code} is in {game.phase}, not {phase}")
+
+    def create(self, body: Dict) -> Dict:
+        name = _required(body, 'name')
+
+        def new_room(room_code):
+            game = Game(room_code)
+            game.add_player(Player(name, is_host=True))
+            return game
+        game = get_allocator().allocate(new_room)
+        return view_json(views.view_for(game, name))
+
+    def join(self, room_code: str, body: Dict) -> Dict:
+        name = _required(body, 'name')
+        return self._update(room_code, name, body.get('key'), lambda g: None,
+                            lambda g: g.add_player(Player(name)))
+
+    def vote(self, room_code: str, body: Dict) -> Dict:
+        name, voted_for = _required(body, 'name'), _required(body, 'voted_for')
+
+        def check(game):
+            self._phase(game, "voting")
+            self._player(game, name)
+            self._player(game, voted_for)
+            if voted_for == name:
+                raise ApiError(400, "Players can't vote for themselves")
+        return self._update(room_code, name, body.get('key'), check, lambda g: g.submit_vote(name, voted_for))
+
+    def guess(self, room_code: str, body: Dict) -> Dict:
+        name, guess = _required(body, 'name'), _required(body, 'guess')
+
+        def check(game):
+            self._phase(game, "imposter_guess")
+            if not game.is_player_imposter(name):
+                raise ApiError(403, "Only the imposter guesses the item")
+        return self._update(room_code, name, body.get('key'), check, lambda g: g.submit_imposter_guess(guess))
+
+    def advance(self, room_code: str, body: Dict) -> Dict:
+        name = _required(body, 'name')
+        expected = body.get('phase')  # lets a client say which phase it means to leave
+
+        def check(game):
+            if not game.is_player_host(name):
+                raise ApiError(403, "Only the host advances the game")
+            if expected is not None:
+                self._phase(game, expected)
+            if game.phase not in ADVANCE:
+                raise ApiError(409, f"Room {game.room_code} can't be advanced from {game.phase}")
+            if game.phase == "lobby" and len(game.players) < game.min_players:
+                raise ApiError(409, f"Need {game.min_players} players to start")
+            if game.phase == "round_setup" and body.get('domain') and body['domain'] not in get_catalog():
+                raise ApiError(400, f"Unknown domain {body['domain']!r}")
+        return self._update(room_code, name, body.get('key'), check, lambda g: ADVANCE[g.phase](g, body))
+
+    def view(self, room_code: str, name: Optional[str]) -> Dict:
+        game = storage.load_cached_game_state(room_code)
+        if game is None:
+            raise ApiError(404, f"Room {room_code} not found")
+        if name is None:
+            return view_json(views.project(game, views.SPECTATOR))
+        self._player(game, name)
+        return view_json(views.view_for(game, name))
+
+    # HTTP
+
+    async def route(self, method: str, path: str, query: Dict, body: Dict) -> Tuple[int, Dict]:
+        parts = [part for part in path.split('/') if part]
+        if parts == ['health']:
+            return 200, {'ok': True, 'ready': metrics.READY.is_set(), 'connections': self.connections}
+        if not parts or parts[0] != 'rooms' or len(parts) > 3:
+            raise ApiError(404, f"No such endpoint: {path}")
+        if len(parts) == 1:
+            if method != 'POST':
+                raise ApiError(405, "Use POST to create a room")
+            return 201, await self.run(self.create, body)
+        room_code = parts[1].upper()
+        if len(parts) == 2:
+            if method != 'GET':
+                raise ApiError(405, "Use GET to read a room")
+            return 200, await self.run(self.view, room_code, (query.get('name') or [None])[0])
+        action = {'join': self.join, 'vote': self.vote, 'guess': self.guess, 'advance': self.advance}.get(parts[2])
+        if action is None:
+            raise ApiError(404, f"No such endpoint: {path}")
+        if method != 'POST':
+            raise ApiError(405, f"Use POST for {parts[2]}")
+        return 200, await self.run(action, room_code, body)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """One client connection: keep-alive HTTP requests, or a WebSocket after an upgrade"""
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    header, _, value = line.decode('latin-1').partition(':')
+                    headers[header.strip().lower()] = value.strip()
+                url = urlsplit(target)
+
+                if headers.get('upgrade', '').lower() == 'websocket':
+                    await self.stream(url.path, headers, reader, writer)
+                    return
+
+                start = time.perf_counter()
+                status, payload = await self._respond(method, url, headers, reader)
+                data = json.dumps(payload, ensure_ascii=False).encode()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+                             f'Content-Type: application/json; charset=utf-8\r\n'
+                             f'Content-Length: {len(data)}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + data)
+                await writer.drain()
+                metrics.API_REQUESTS.observe(time.perf_counter() - start, method, str(status))
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            return
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _respond(self, method: str, url, headers: Dict, reader: asyncio.StreamReader) -> Tuple[int, Dict]:
+        try:
+            length = int(headers.get('content-length') or 0)
+            if length > MAX_BODY:
+                raise ApiError(413, "Request body too large")
+            body = {}
+            if length:
+                try:
+                    body = json.loads(await reader.readexactly(length))
+                except ValueError:
+                    raise ApiError(400, "Body must be JSON") from None
+                if not isinstance(body, dict):
+                    raise ApiError(400, "Body must be a JSON object")
+            return await self.route(method, url.path, parse_qs(url.query), body)
+        except ApiError as e:
+            return e.status, {'error': str(e)}
+        except storage.ConflictError as e:
+            return 409, {'error': str(e)}
+        except Exception:
+            logger.exception("%s %s failed", method, url.path)
+            return 500, {'error': "Internal error"}
+
+    # WebSocket
+
+    async def stream(self, path: str, headers: Dict, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Send the room's version and phase now and after every change, until either side closes"""
+        parts = [part for part in path.split('/') if part]
+        key = headers.get('sec-websocket-key')
+        if len(parts) != 3 or parts[0] != 'rooms' or parts[2] != 'events' or not key:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+            return
+        room_code = parts[1].upper()
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(f'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     f'Sec-WebSocket-Accept: {accept}\r\n\r\n'.encode())
+
+        queue = self.feed.subscribe(room_code)
+        game = await self.run(storage.load_cached_game_state, room_code)
+        await send_frame(writer, json.dumps({'room': room_code, 'version': game.version if game else None,
+                                             'phase': game.phase if game else None}).encode())
+        reading = asyncio.ensure_future(self._read_until_close(reader, writer))
+        try:
+            while game is not None:
+                waiting = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({waiting, reading}, return_when=asyncio.FIRST_COMPLETED)
+                if reading in done:
+                    waiting.cancel()
+                    return
+                message = waiting.result()
+                await send_frame(writer, json.dumps(message).encode())
+                if message['version'] is None:
+                    break  # the room was deleted
+            await send_frame(writer, b'', opcode=0x8)
+        finally:
+            reading.cancel()
+            self.feed.unsubscribe(room_code, queue)
+
+    async def _read_until_close(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer pings and return once the client closes; clients have nothing else to say"""
+        while True:
+            opcode, payload = await read_frame(reader)
+            if opcode == 0x8:
+                return
+            if opcode == 0x9:
+                await send_frame(writer, payload, opcode=0xA)
+
+
+async def send_frame(writer: asyncio.StreamWriter, payload: bytes, opcode: int = 0x1) -> None:
+    """One unmasked, unfragmented server frame"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('>BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+    writer.write(header + payload)
+    await writer.drain()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """One client frame as (opcode, unmasked payload); continuation frames are returned as they come"""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack('>H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('>Q', await reader.readexactly(8))
+    if length > MAX_BODY:
+        raise ValueError("WebSocket frame too large")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return first & 0x0F, payload
+
+
+def _required(body: Dict, field: str) -> str:
+    value = body.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise ApiError(400, f"'{field}' is required")
+    return value.strip()
+
+
+async def serve(address: str = config.API_ADDRESS, api: GameApi = None,
+                ready: Optional[threading.Event] = None) -> None:
+    """Serve the API until cancelled; ready is set once it listens, on api.address"""
+    api = api or GameApi()
+    loop = asyncio.get_running_loop()
+    api.feed = RoomFeed(loop, api.executor)
+    storage.add_commit_listener(api.feed.committed)
+    host, port = parse_address(address)
+    server = await asyncio.start_server(api.handle, host, port, backlog=4096, limit=MAX_BODY)
+    poller = asyncio.ensure_future(api.feed.poll())
+    api.address = server.sockets[0].getsockname()[:2]
+    logger.info("Game API listening on %s:%s", *api.address)
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        poller.cancel()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless JSON and WebSocket game API")
+    parser.add_argument('--address', default=config.API_ADDRESS, help="host:port to listen on")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # The same background services the Streamlit app starts
+    from scheduler import get_scheduler
+    from stats import get_stats
+    from sweeper import RoomSweeper
+    from warmup import ensure_warm
+    RoomSweeper().start()
+    if config.PHASE_TIMERS_ENABLED:
+        get_scheduler()
+    get_stats()
+    metrics.serve()
+    ensure_warm()  # listen only once the active rooms are loaded
+
+    try:
+        asyncio.run(serve(args.address))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
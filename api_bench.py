@@ -0,0 +1,274 @@
+"""
+Latency benchmark of the game API against the in-process path the Streamlit app takes.
+
+Rooms of bots play complete rounds twice against fresh stores:
+
+    api      every bot is a client with its own keep-alive HTTP connection to
+             api.py, reading its view after every action, and each room has a
+             WebSocket subscriber whose lag from write to change event is timed
+    session  the same actions as a Streamlit session runs them: update_game_state
+             then the player's view, in a thread per room (page rendering not included)
+
+    python api_bench.py --rooms 50 --players 6 --rounds 3
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import api
+import data
+import storage
+import views
+from game_logic import Game, Player
+from rooms import RoomCodeAllocator
+from simulator import LatencyRecorder, open_store
+
+
+class Client:
+    """One keep-alive HTTP connection speaking JSON"""
+
+    def __init__(self, address: Tuple[str, int]):
+        self.address = address
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: Optional[Dict] = None) -> Tuple[int, Dict]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(*self.address)
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.writer.write(f'{method} {path} HTTP/1.1\r\nHost: bench\r\n'
+                          f'Content-Length: {len(payload)}\r\n\r\n'.encode() + payload)
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode().partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def subscribe(address: Tuple[str, int], room_code: str):
+    """Open a WebSocket on a room's change feed"""
+    reader, writer = await asyncio.open_connection(*address)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write(f'GET /rooms/{room_code}/events HTTP/1.1\r\nHost: bench\r\nUpgrade: websocket\r\n'
+                 f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'.encode())
+    while await reader.readline() != b'\r\n':
+        pass
+    return reader, writer
+
+
+class ApiRoom:
+    """One room of bots playing through the API"""
+
+    def __init__(self, address: Tuple[str, int], players: int, recorder: LatencyRecorder, rng: random.Random):
+        self.address = address
+        self.recorder = recorder
+        self.rng = rng
+        self.names = [f'bot{i}' for i in range(players)]
+        self.clients = {name: Client(address) for name in self.names}
+        self.room_code = None
+        self.sent: Dict[int, float] = {}  # version -> when the write that made it was sent
+
+    async def call(self, operation: str, name: str, method: str, path: str, body: Optional[Dict] = None) -> Dict:
+        start = time.perf_counter()
+        status, view = await self.clients[name].request(method, path, body)
+        self.recorder.record(operation, time.perf_counter() - start)
+        if status >= 400:
+            raise RuntimeError(f"{method} {path}: {status} {view}")
+        return view
+
+    async def write(self, operation: str, name: str, action: str, **body) -> Dict:
+        start = time.perf_counter()
+        view = await self.call(operation, name, 'POST', f'/rooms/{self.room_code}/{action}', {'name': name, **body})
+        self.sent.setdefault(view['version'], start)
+        # The player's client rereads its view, as a rerun would
+        await self.call('get_view', name, 'GET', f'/rooms/{self.room_code}?name={name}')
+        return view
+
+    async def watch(self) -> None:
+        reader, writer = await subscribe(self.address, self.room_code)
+        try:
+            while True:
+                _, payload = await api.read_frame(reader)
+                event = json.loads(payload)
+                sent = self.sent.pop(event['version'], None)
+                if sent is not None:
+                    self.recorder.record('event_lag', time.perf_counter() - sent)
+        finally:
+            writer.close()
+
+    async def play(self, rounds: int) -> None:
+        host = self.names[0]
+        view = await self.call('create_room', host, 'POST', '/rooms', {'name': host})
+        self.room_code = view['room_code']
+        watcher = asyncio.ensure_future(self.watch())
+        for name in self.names[1:]:
+            await self.write('join', name, 'join')
+        await self.write('start_round', host, 'advance', phase='lobby')
+        for _ in range(rounds):
+            await self.write('select_item', host, 'advance', phase='round_setup',
+                             domain=self.rng.choice(list(data.get_catalog())))
+            await self.write('start_voting', host, 'advance', phase='discussion')
+            for voter in self.names:
+                choice = self.rng.choice([name for name in self.names if name != voter])
+                await self.write('submit_vote', voter, 'vote', voted_for=choice)
+            await self.write('reveal_imposter', host, 'advance', phase='voting')
+            view = await self.write('start_imposter_guess', host, 'advance', phase='reveal')
+            imposter = view['imposter']
+            options = (await self.call('get_view', imposter, 'GET',
+                                       f'/rooms/{self.room_code}?name={imposter}'))['guess_options']
+            await self.write('submit_imposter_guess', imposter, 'guess', guess=self.rng.choice(options))
+            await self.write('reset_round', host, 'advance', phase='scores')
+        await asyncio.sleep(0.05)  # let the last events arrive
+        watcher.cancel()
+        for client in self.clients.values():
+            client.close()
+
+
+class SessionRoom:
+    """One room of bots acting the way Streamlit sessions do, without the page"""
+
+    def __init__(self, allocator: RoomCodeAllocator, players: int, recorder: LatencyRecorder, rng: random.Random):
+        self.allocator = allocator
+        self.recorder = recorder
+        self.rng = rng
+        self.names = [f'bot{i}' for i in range(players)]
+
+    def timed(self, operation: str, action):
+        start = time.perf_counter()
+        try:
+            return action()
+        finally:
+            self.recorder.record(operation, time.perf_counter() - start)
+
+    def write(self, operation: str, name: str, mutate) -> views.RoomView:
+        view = self.timed(operation, lambda: views.view_for(storage.update_game_state(self.room_code, mutate), name))
+        self.timed('get_view', lambda: views.view_for(storage.load_cached_game_state(self.room_code), name))
+        return view
+
+    def play(self, rounds: int) -> None:
+        host = self.names[0]
+
+        def new_room(room_code):
+            game = Game(room_code)
+            game.add_player(Player(host, is_host=True))
+            return game
+        self.room_code = self.timed('create_room', lambda: self.allocator.allocate(new_room).room_code)
+        for name in self.names[1:]:
+            self.write('join', name, lambda g: g.add_player(Player(name)))
+        self.write('start_round', host, lambda g: g.start_round())
+        for _ in range(rounds):
+            domain = self.rng.choice(list(data.get_catalog()))
+            self.write('select_item', host, lambda g: (g.set_domain(domain), g.select_item(), g.start_discussion()))
+            self.write('start_voting', host, lambda g: g.start_voting())
+            for voter in self.names:
+                choice = self.rng.choice([name for name in self.names if name != voter])
+                self.write('submit_vote', voter, lambda g: g.submit_vote(voter, choice))
+            self.write('reveal_imposter', host, lambda g: g.reveal_imposter())
+            imposter = self.write('start_imposter_guess', host, lambda g: g.start_imposter_guess()).imposter
+            options = self.timed('get_view', lambda: views.view_for(
+                storage.load_cached_game_state(self.room_code), imposter)).guess_options
+            guess = self.rng.choice(options)
+            self.write('submit_imposter_guess', imposter, lambda g: g.submit_imposter_guess(guess))
+            self.write('reset_round', host, lambda g: g.reset_round())
+
+
+def run_api(backend: str, rooms: int, players: int, rounds: int, seed: int) -> Dict:
+    recorder = LatencyRecorder()
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        store = open_store(backend, directory)
+        storage.set_store(store)
+        server = api.GameApi()
+        ready = threading.Event()
+        loop = asyncio.new_event_loop()
+        serving = loop.create_task(api.serve('127.0.0.1:0', server, ready))
+
+        def run_server():
+            try:
+                loop.run_until_complete(serving)
+            except asyncio.CancelledError:
+                pass
+        thread = threading.Thread(target=run_server, daemon=True)
+        thread.start()
+        ready.wait()
+
+        async def play_all():
+            bot_rooms = [ApiRoom(server.address, players, recorder, random.Random(rng.random())) for _ in range(rooms)]
+            await asyncio.gather(*(room.play(rounds) for room in bot_rooms))
+
+        start = time.perf_counter()
+        asyncio.run(play_all())
+        elapsed = time.perf_counter() - start
+        loop.call_soon_threadsafe(serving.cancel)
+        thread.join()
+        server.executor.shutdown()
+        store.close()
+        storage.set_store(None)
+    return {'path': 'api', 'seconds': elapsed, 'latency': recorder.summary()}
+
+
+def run_sessions(backend: str, rooms: int, players: int, rounds: int, seed: int) -> Dict:
+    recorder = LatencyRecorder()
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        store = open_store(backend, directory)
+        storage.set_store(store)
+        allocator = RoomCodeAllocator(store)
+        bot_rooms = [SessionRoom(allocator, players, recorder, random.Random(rng.random())) for _ in range(rooms)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=rooms) as pool:
+            list(pool.map(lambda room: room.play(rounds), bot_rooms))
+        elapsed = time.perf_counter() - start
+        store.close()
+        storage.set_store(None)
+    return {'path': 'session', 'seconds': elapsed, 'latency': recorder.summary()}
+
+
+def print_reports(reports: List[Dict], rooms: int, rounds: int) -> None:
+    for report in reports:
+        print(f"{report['path']}: {rooms * rounds} rounds in {report['seconds']:.2f}s")
+    operations = sorted({name for report in reports for name in report['latency']})
+    header = ''.join(f"{report['path'] + ' p50':>14}{report['path'] + ' p99':>14}" for report in reports)
+    print(f"  {'operation (ms)':<24}{header}")
+    for name in operations:
+        cells = ''
+        for report in reports:
+            stats = report['latency'].get(name)
+            cells += f"{stats['p50'] * 1000:>14.3f}{stats['p99'] * 1000:>14.3f}" if stats else f"{'-':>14}{'-':>14}"
+        print(f"  {name:<24}{cells}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--store', choices=['json', 'binary', 'sqlite', 'eventlog'], default='json')
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--players', type=int, default=6)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    reports = [
+        run_api(args.store, args.rooms, args.players, args.rounds, args.seed),
+        run_sessions(args.store, args.rooms, args.players, args.rounds, args.seed),
+    ]
+    print_reports(reports, args.rooms, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
 import streamlit as st
-import random
 import time
-import json
-import os
-from streamlit_autorefresh import st_autorefresh
-from game_logic import Game, Player
-from data import DOMAINS, get_items_for_domain
+from game_logic import CORRECT_VOTE_POINTS, IMPOSTER_GUESS_POINTS, Game, Player
+from data import DOMAINS
+from storage import load_cached_game_state, update_game_state
+from notify import room_notifier
+from rooms import get_allocator
+from sweeper import RoomSweeper
+from scheduler import get_scheduler
+from assets import get_assets
+from stats import get_stats
+from spectate import get_spectators
+from warmup import ensure_warm
+import views
+import metrics
+import config
 
 # Page config
 st.set_page_config(
@@ -14,92 +22,171 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize session state
-if 'game' not in st.session_state:
-    st.session_state.game = None
-
-# Create a directory for storing game states if it doesn't exist
-os.makedirs('game_states', exist_ok=True)
-
-def save_game_state(game):
-    """Save game state to file"""
-    if game:
-        game_data = {
-            'room_code': game.room_code,
-            'phase': game.phase,
-            'players': [{'name': p.name, 'is_host': p.is_host, 'score': p.score} for p in game.players],
-            'min_players': game.min_players,
-            'current_domain': game.current_domain,
-            'current_item': game.current_item,
-            'imposter': game.imposter.name if game.imposter else None,
-            'discussion_end_time': game.discussion_end_time,
-            'votes': game.votes,
-            'most_voted_player': game.most_voted_player,
-            'imposter_guess': game.imposter_guess if hasattr(game, 'imposter_guess') else None,
-        }
-        with open(f'game_states/{game.room_code}.json', 'w') as f:
-            json.dump(game_data, f)
-
-def load_game_state(room_code):
-    """Load game state from file"""
-    try:
-        with open(f'game_states/{room_code}.json', 'r') as f:
-            data = json.load(f)
-            game = Game(data['room_code'])
-            game.phase = data['phase']
-            
-            # Recreate players
-            for p_data in data['players']:
-                player = Player(p_data['name'], p_data['is_host'])
-                player.score = p_data['score']
-                game.add_player(player)
-            
-            game.min_players = data['min_players']
-            game.current_domain = data['current_domain']
-            game.current_item = data['current_item']
-            
-            # Set imposter and their guess
-            if data['imposter']:
-                game.imposter = next((p for p in game.players if p.name == data['imposter']), None)
-            if 'imposter_guess' in data:
-                game.imposter_guess = data['imposter_guess']
-            
-            game.discussion_end_time = data['discussion_end_time']
-            game.votes = data['votes']
-            game.most_voted_player = data['most_voted_player']
-            
-            return game
-    except FileNotFoundError:
-        return None
+# Initialize session state; a session holds its projection of the room, never the Game itself
+if 'view' not in st.session_state:
+    st.session_state.view = None
+
+@st.cache_resource
+def start_room_sweeper():
+    """Start one background sweeper of idle rooms per server process"""
+    sweeper = RoomSweeper()
+    sweeper.start()
+    return sweeper
+
+start_room_sweeper()
+
+@st.cache_resource
+def start_phase_scheduler():
+    """End timed-out discussions and votes from one server-side timer thread"""
+    return get_scheduler() if config.PHASE_TIMERS_ENABLED else None
+
+start_phase_scheduler()
+
+@st.cache_resource
+def load_item_images():
+    """Match items to thumbnails once per server process; missing images are logged here"""
+    return get_assets()
+
+item_images = load_item_images()
+
+@st.cache_resource
+def start_stats():
+    """Record every finished round this process sees into the cross-room statistics"""
+    return get_stats()
+
+round_stats = start_stats()
+
+@st.cache_resource
+def start_spectators():
+    """One shared snapshot per watched room for every spectator in this process"""
+    return get_spectators()
+
+spectators = start_spectators()
+
+@st.cache_resource
+def start_metrics_exporters():
+    """Expose this process's metrics once, if they are switched on"""
+    return metrics.serve(), metrics.write_periodically()
+
+start_metrics_exporters()
+
+@st.cache_resource
+def start_warmup():
+    """Preload active rooms and content indexes before this process reports ready"""
+    return ensure_warm()
+
+start_warmup()
+
+def adopt(game):
+    """Keep this player's projection of a room version in the session"""
+    st.session_state.view = views.view_for(game, st.session_state.player_name)
+    return st.session_state.view
 
 def sync_game_state():
     """Sync game state with the stored state"""
-    if st.session_state.game and hasattr(st.session_state.game, 'room_code'):
-        stored_game = load_game_state(st.session_state.game.room_code)
+    if st.session_state.view:
+        stored_game = load_cached_game_state(st.session_state.view.room_code)
         if stored_game:
             # Check if there's any change in game state
-            current_phase = st.session_state.game.phase
+            current_phase = st.session_state.view.phase
+            if stored_game.version != st.session_state.view.version:
+                st.session_state.pop('poll_interval', None)
+                st.session_state.pop('next_poll', None)
             
             # Always update the game state to ensure synchronization
-            st.session_state.game = stored_game
+            adopt(stored_game)
             
             # Show update notification if something changed
             if current_phase != stored_game.phase:
                 st.toast(f"Game phase changed to: {stored_game.phase} 🔄")
 
+def update_game(mutate, action=None):
+    """Apply a mutation to the stored room and adopt the resulting view.
+
+    Button handlers name their action: keyed by the room version the player
+    clicked on, a double click or replayed rerun is applied only once.
+    """
+    key = None
+    if action:
+        key = f"{st.session_state.player_name}:{action}:{st.session_state.view.version}"
+    game = update_game_state(st.session_state.view.room_code, mutate, key=key)
+    if game is None:
+        leave_room()
+        return None
+    return adopt(game)
+
+def leave_room():
+    """Drop a room that no longer exists, e.g. expired by the sweeper, and go back to the login screen"""
+    st.session_state.view = None
+    st.query_params.pop('room', None)
+    st.query_params.pop('name', None)
+    st.error("Room not found! / الغرفة غير موجودة!")
+
+def phase_action(phase, action):
+    """Wrap a mutation so it is skipped once the room has left the given phase"""
+    def mutate(game):
+        if game.phase != phase:
+            return False
+        action(game)
+    return mutate
+
+def layout_key(view):
+    """What the page outside the fragments depends on"""
+    return (view.phase, len(view.players), view.min_players)
+
+def watch_interval(phase):
+    """Seconds between runs of a client's room watcher: the phase's shortest poll interval, at least WATCH_TICK"""
+    return max(config.WATCH_TICK, config.PHASE_POLL_INTERVALS.get(phase, (1, 5))[0])
+
+def watch_room():
+    """Run the room watcher at its phase's pace; a phase change reruns the page and so resets the pace"""
+    view = st.session_state.view
+    if view is None:
+        return
+    st.fragment(check_room, run_every=watch_interval(view.phase))()
+
+def check_room():
+    """Pick up new room versions, rerunning the whole page only when its layout changes"""
+    view = st.session_state.view
+    if view is None:
+        return
+
+    # Saves made by this process are pushed through the notifier; saves from
+    # other processes only show up in the store, so poll it with a per-phase backoff
+    now = time.time()
+    pushed = (room_notifier.version(view.room_code) or 0) > view.version
+    if not pushed and now < st.session_state.get('next_poll', 0):
+        return
+    stored_game = load_cached_game_state(view.room_code)
+    if stored_game is None or stored_game.version == view.version:
+        min_interval, max_interval = config.PHASE_POLL_INTERVALS.get(view.phase, (1, 5))
+        interval = st.session_state.get('poll_interval', min_interval / 2) * 2
+        st.session_state.poll_interval = min(max(interval, min_interval), max_interval)
+        st.session_state.next_poll = now + st.session_state.poll_interval
+        return
+
+    st.session_state.pop('poll_interval', None)
+    st.session_state.pop('next_poll', None)
+    new_view = adopt(stored_game)
+    if layout_key(new_view) != layout_key(view):
+        st.rerun()
+    # Same phase and players: the fragments pick up the new view on their next run
+
 def create_room():
     """Create a new game room"""
     if not st.session_state.get('player_name'):
         st.error("Please enter your name first")
         return
     
-    # Generate room code
-    room_code = ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=4))
-    game = Game(room_code)
-    game.add_player(Player(st.session_state.player_name, is_host=True))
-    st.session_state.game = game
-    save_game_state(game)
-    st.query_params['room'] = room_code
+    # Claim an unused room code
+    host_name = st.session_state.player_name
+    def new_room(room_code):
+        game = Game(room_code)
+        game.add_player(Player(host_name, is_host=True))
+        return game
+    game = get_allocator().allocate(new_room)
+    adopt(game)
+    st.query_params['room'] = game.room_code
     st.query_params['name'] = st.session_state.player_name
 
 def join_room():
@@ -109,38 +196,49 @@ def join_room():
         return
     
     room_code = st.session_state.room_code.upper()
-    game = load_game_state(room_code)
+    player_name = st.session_state.player_name
+    game = update_game_state(room_code, lambda g: g.add_player(Player(player_name)))
     
     if game is None:
         st.error("Room not found!")
         return
     
-    player = Player(st.session_state.player_name)
-    game.add_player(player)
-    st.session_state.game = game
-    save_game_state(game)
+    adopt(game)
     st.query_params['room'] = room_code
     st.query_params['name'] = st.session_state.player_name
 
 def main():
     st.title("Imposter / برّه السالفة 🎲")
+
+    # Spectators only ever read the shared snapshot; they never load or join the room
+    if 'watch' in st.query_params:
+        st.session_state.watching = st.query_params['watch'].upper()
+    if st.session_state.get('watching'):
+        spectator_view()
+        return
     
     # Get query parameters and sync state
     if 'room' in st.query_params and 'name' in st.query_params:
         st.session_state.room_code = st.query_params['room']
         st.session_state.player_name = st.query_params['name']
         
-        # Try to load existing game
-        if st.session_state.game is None:
-            stored_game = load_game_state(st.session_state.room_code)
-            if stored_game:
-                st.session_state.game = stored_game
+        # Try to load existing game, warm from the room cache after a restart
+        if st.session_state.view is None:
+            with metrics.FIRST_RERUN.time():
+                stored_game = load_cached_game_state(st.session_state.room_code)
+                if stored_game:
+                    adopt(stored_game)
     
-    # Keep auto-refresh for all phases
-    count = st_autorefresh(interval=2000, key="game_refresh")
     sync_game_state()
-    
-    if st.session_state.game is None:
+    watch_room()
+
+    phase = st.session_state.view.phase if st.session_state.view else "login"
+    with metrics.RENDER.time(phase):
+        render_page()
+
+def render_page():
+    """Render the login screen or the current phase of the game"""
+    if st.session_state.view is None:
         # Login screen with instructions
         st.write("### How to Play:")
         st.write("1. One player creates a room and becomes the host")
@@ -149,11 +247,11 @@ def main():
         st.divider()
 
         # Create tabs with Join Room as default
-        join_tab, create_tab = st.tabs(["🎮 Join Existing Room / الانضمام إلى غرفة", "🎲 Create New Room / إنشاء غرفة جديدة"])
+        join_tab, create_tab, watch_tab, leaderboard_tab = st.tabs(["🎮 Join Existing Room / الانضمام إلى غرفة", "🎲 Create New Room / إنشاء غرفة جديدة", "👀 Watch / مشاهدة", "🏅 Leaderboard / المتصدرون"])
         
         with join_tab:
             st.write("Choose this to join someone else's game / اختر هذا للانضمام إلى لعبة شخص آخر")
-            room_code = st.text_input("Room Code / رمز الغرفة:", key="join_room_code", placeholder="Enter 4-letter code / أدخل رمز من 4 أحرف", max_chars=4)
+            room_code = st.text_input("Room Code / رمز الغرفة:", key="join_room_code", placeholder="Enter room code / أدخل رمز الغرفة", max_chars=config.ROOM_CODE_MAX_LENGTH)
             player_name = st.text_input("Your Name / اسمك:", key="join_name", placeholder="Enter your name / أدخل اسمك")
             if st.button("👥 Join Room / انضم للغرفة", use_container_width=True):
                 st.session_state.player_name = player_name
@@ -166,9 +264,23 @@ def main():
             if st.button("� Create Room & Become Host / إنشاء غرفة وكن المضيف", use_container_width=True):
                 st.session_state.player_name = player_name
                 create_room()
+
+        with watch_tab:
+            st.write("Follow a game without playing / تابع لعبة بدون المشاركة")
+            watch_code = st.text_input("Room Code / رمز الغرفة:", key="watch_room_code", placeholder="Enter room code / أدخل رمز الغرفة", max_chars=config.ROOM_CODE_MAX_LENGTH)
+            if st.button("👀 Watch Room / شاهد الغرفة", use_container_width=True):
+                if watch_code:
+                    st.query_params['watch'] = watch_code.upper()
+                    st.session_state.watching = watch_code.upper()
+                    st.rerun()
+                else:
+                    st.error("Please enter a room code")
+
+        with leaderboard_tab:
+            leaderboard()
     
     else:
-        game = st.session_state.game
+        view = st.session_state.view
         
         # Create three columns - game info, main game area, and scoreboard
         info_col, main_col, score_col = st.columns([2, 5, 2])
@@ -176,282 +288,302 @@ def main():
         with info_col:
             # Game information in left column
             st.markdown("## ℹ️ Game Info / معلومات اللعبة")
-            st.write(f"### 🎯 رمز الغرفة: {game.room_code}")
-            st.write(f"### 👥 Players / اللاعبين: {len(game.players)}")
-            if game.current_domain:
-                st.write(f"### 🌍 المجال: {game.current_domain}")
+            st.write(f"### 🎯 رمز الغرفة: {view.room_code}")
+            st.write(f"### 👥 Players / اللاعبين: {len(view.players)}")
+            if view.domain:
+                st.write(f"### 🌍 المجال: {view.domain}")
             st.divider()
         
         with score_col:
-            # Scoreboard in right column with improved styling
-            st.markdown("## 🏆 Scoreboard / النتائج")
-            
-            # Sort players by score in descending order
-            sorted_players = sorted(game.players, key=lambda x: x.score, reverse=True)
-            
-            # Show your score prominently with custom styling
-            for i, player in enumerate(sorted_players):
-                rank_emoji = ["🥇", "🥈", "🥉"][i] if i < 3 else "•"
-                st.markdown(f"#### {rank_emoji} {player.name} : {player.score} ")
-        
+            scoreboard()
+
         with main_col:
-            # Game phases
-            if game.phase == "lobby":
-                st.subheader("Lobby / الغرفة")
-                st.divider()
-                st.markdown("### 👥 Players / اللاعبون في الغرفة")
-                for player in game.players:
-                    if player.name == st.session_state.player_name:
-                        st.markdown(f"## 👤 {player.name} {' 👑' if player.is_host else ''}")
-                    else:
-                        st.markdown(f"## {player.name} {' 👑' if player.is_host else ''}")
-                
-                # Show lobby status with larger numbers
-                st.markdown(f"### Players / اللاعبين: {len(game.players)}/{game.min_players}")
-                
-                # Host controls
-                if game.is_player_host(st.session_state.player_name):
-                    st.write("👑 You are the host / أنت المضيف")
-                    test_mode = st.checkbox("Enable Test Mode (2 players minimum) / تفعيل وضع الاختبار (لاعبين كحد أدنى)")
-                    if test_mode:
-                        game.min_players = 2
-                        save_game_state(game)
-                    
-                    if len(game.players) >= game.min_players:
-                        if st.button("▶️ Start Round / ابدأ الجولة"):
-                            game.start_round()
-                            save_game_state(game)
-                            st.rerun()
-                    else:
-                        st.warning(f"Need {game.min_players - len(game.players)} more players to start / نحتاج {game.min_players - len(game.players)} لاعب إضافي للبدء")
-                else:
-                    st.info("Waiting for the host to start the game... / بانتظار المضيف لبدء اللعبة...")
-        if game.phase == "lobby":
-            st.subheader("Lobby")
-            st.write("Players in the room:")
-            for player in game.players:
-                st.write(f"- {player.name} {'(Host)' if player.is_host else ''}")
-            
-            # Show lobby status
-            st.write(f"Number of players: {len(game.players)} (Minimum needed: {game.min_players})")
-            
-            # Host controls
-            if game.is_player_host(st.session_state.player_name):
-                st.write("👑 You are the host")
-                test_mode = st.checkbox("Enable Test Mode (2 players minimum)")
-                if test_mode:
-                    game.min_players = 2
-                    save_game_state(game)
-                
-                if len(game.players) >= game.min_players:
-                    if st.button("▶️ Start Round"):
-                        game.start_round()
-                        save_game_state(game)
-                        st.rerun()
-                else:
-                    st.warning(f"Need {game.min_players - len(game.players)} more players to start")
+            if view.phase == "discussion":
+                # Role and item on the left, countdown beside them
+                body_col, timer_col = st.columns([2, 1])
+                with body_col:
+                    phase_body()
+                with timer_col:
+                    discussion_timer()
             else:
-                st.info("Waiting for the host to start the game...")
+                phase_body()
+                if view.phase == "voting":
+                    vote_progress()
+
+@st.fragment(run_every=config.SPECTATOR_REFRESH)
+def spectator_view():
+    """Read-only view of a room, drawn from the snapshot all its spectators share"""
+    view = spectators.snapshot(st.session_state.watching)
+    if view is None:
+        st.error("Room not found!")
+    else:
+        st.caption("👀 Spectating / مشاهدة")
+        st.markdown(view.markdown)
+        if view.deadline:
+            st.markdown(f"⏱️ **{int(max(0, view.deadline - time.time()))}s**")
+    if st.button("⬅️ Leave / خروج", key="leave_spectating"):
+        st.session_state.watching = None
+        st.query_params.pop('watch', None)
+        st.rerun(scope="app")
+
+@st.fragment
+def leaderboard():
+    """All-time totals across rooms; each query reads only the rows it shows"""
+    rounds, players = round_stats.totals()
+    st.caption(f"{rounds} rounds played by {players} players / جولة ولاعب")
+    st.markdown("#### Top players / أفضل اللاعبين")
+    top = round_stats.top_players(10)
+    if not top:
+        st.write("No finished rounds yet / لا توجد جولات منتهية بعد")
+    for rank, player in enumerate(top, 1):
+        st.write(f"{rank}. **{player.name}** - {player.points} "
+                 f"({player.imposter_wins}/{player.imposter_rounds} as imposter, {player.correct_votes} correct votes)")
+    st.markdown("#### Imposter win rate by domain / نسبة فوز برّه السالفة حسب المجال")
+    for domain in round_stats.domains():
+        st.write(f"{domain.domain}: {domain.imposter_win_rate:.0%} of {domain.rounds} rounds")
+    if st.button("🔄 Refresh / تحديث", key="refresh_leaderboard"):
+        st.rerun(scope="fragment")
+
+@st.fragment
+def scoreboard():
+    """Scoreboard; scores and players only change along with the page layout"""
+    view = st.session_state.view
+    st.markdown("## 🏆 Scoreboard / النتائج")
+    for i, player in enumerate(view.ranking):
+        rank_emoji = ["🥇", "🥈", "🥉"][i] if i < 3 else "•"
+        st.markdown(f"#### {rank_emoji} {player.name} : {player.score} ")
+
+@st.fragment(run_every=1)
+def discussion_timer():
+    """Countdown, redrawn every second without rerunning the page"""
+    view = st.session_state.view
+    if view.phase != "discussion":
+        return
+    time_left = max(0, view.discussion_end_time - time.time())
+    st.markdown("#### ⏱️ Time / الوقت")
+    st.progress(time_left / view.discussion_duration)
+    minutes = int(time_left // 60)
+    seconds = int(time_left % 60)
+    st.markdown(f"**{minutes:02d}:{seconds:02d}** remaining / متبقي")
+
+@st.fragment(run_every=watch_interval("voting"))
+def vote_progress():
+    """Vote count, following other players' votes as watch_room picks them up"""
+    view = st.session_state.view
+    if view.phase != "voting":
+        return
+    total_votes = view.votes_cast
+    total_players = len(view.players)
+    st.progress(total_votes / total_players)
+    st.write(f"Votes: {total_votes}/{total_players}")
+    if config.PHASE_TIMERS_ENABLED and view.voting_end_time:
+        st.caption(f"⏱️ Voting closes in {int(max(0, view.voting_end_time - time.time()))}s")
+
+    if view.all_votes_submitted:
+        # Every client sees this; only the first one to get here reveals
+        def reveal_when_done(g):
+            if g.phase != "voting" or not g.all_votes_submitted():
+                return False
+            g.reveal_imposter()
+        update_game(reveal_when_done)
+        st.rerun()
+
+@st.fragment
+def phase_body():
+    """Main area for the current phase; its widgets rerun only this fragment"""
+    view = st.session_state.view
+    me = st.session_state.player_name
+
+    if view.phase == "lobby":
+        st.subheader("Lobby / الغرفة")
+        st.divider()
+        st.markdown("### 👥 Players / اللاعبون في الغرفة")
+        for player in view.players:
+            if player.name == me:
+                st.markdown(f"## 👤 {player.name} {' 👑' if player.is_host else ''}")
+            else:
+                st.markdown(f"## {player.name} {' 👑' if player.is_host else ''}")
+        
+        # Show lobby status with larger numbers
+        st.markdown(f"### Players / اللاعبين: {len(view.players)}/{view.min_players}")
         
-        elif game.phase == "round_setup":
-            st.subheader("👑 Host: Select Domain")
+        # Host controls
+        if view.is_host(me):
+            st.write("👑 You are the host / أنت المضيف")
+            test_mode = st.checkbox("Enable Test Mode (2 players minimum) / تفعيل وضع الاختبار (لاعبين كحد أدنى)")
+            if test_mode and view.min_players != 2:
+                view = update_game(lambda g: g.set_min_players(2))
+                if view is None:
+                    return
             
-            if game.is_player_host(st.session_state.player_name):
-                st.write("Choose a category for this round:")
-                domain = st.selectbox("Available domains:", DOMAINS, index=0)
-                if st.button("✅ Start Round with Selected Domain"):
-                    game.set_domain(domain)
-                    game.select_item()
-                    game.start_discussion()
-                    save_game_state(game)
+            if len(view.players) >= view.min_players:
+                if st.button("▶️ Start Round / ابدأ الجولة"):
+                    update_game(phase_action("lobby", lambda g: g.start_round()), "start_round")
                     st.rerun()
             else:
-                st.info("💭 Waiting for the host to select a domain...")
+                st.warning(f"Need {view.min_players - len(view.players)} more players to start / نحتاج {view.min_players - len(view.players)} لاعب إضافي للبدء")
+        else:
+            st.info("Waiting for the host to start the game... / بانتظار المضيف لبدء اللعبة...")
+    elif view.phase == "round_setup":
+        st.subheader("👑 Host: Select Domain")
         
-        elif game.phase == "discussion":
-            st.markdown("### 💬 Discussion Phase / مرحلة النقاش")
-            
-            # Create two columns for role and timer
-            role_col, timer_col = st.columns([2, 1])
-            
-            with role_col:
-                # Display role and item with improved styling
-                if game.is_player_imposter(st.session_state.player_name):
-                    st.error("🎭 You are the Imposter! / أنت برّه السالفة!")
-                else:
-                    st.success(f"✨ Regular Player / لاعب عادي\n### Item / العنصر: {game.current_item}")
-            
-            with timer_col:
-                # Timer with improved visualization
-                time_left = max(0, game.discussion_end_time - time.time())
-                st.markdown("#### ⏱️ Time / الوقت")
-                st.progress(time_left / game.discussion_duration)
-                minutes = int(time_left // 60)
-                seconds = int(time_left % 60)
-                st.markdown(f"**{minutes:02d}:{seconds:02d}** remaining / متبقي")
-            
-            if game.is_player_host(st.session_state.player_name):
-                if st.button("End Discussion & Open Voting"):
-                    game.start_voting()
-                    save_game_state(game)
-                    st.rerun()
+        if view.is_host(me):
+            st.write("Choose a category for this round:")
+            domain = st.selectbox("Available domains:", DOMAINS, index=0)
+            if st.button("✅ Start Round with Selected Domain"):
+                def start_with_domain(g):
+                    g.set_domain(domain)
+                    g.select_item()
+                    g.start_discussion()
+                update_game(phase_action("round_setup", start_with_domain), "start_with_domain")
+                st.rerun()
+        else:
+            st.info("💭 Waiting for the host to select a domain...")
+    
+    elif view.phase == "discussion":
+        st.markdown("### 💬 Discussion Phase / مرحلة النقاش")
         
-        elif game.phase == "voting":
-            st.markdown("### 🗳️ Voting Phase / مرحلة التصويت")
-            
-            vote_area, status_area = st.columns([3, 2])
-            
-            with vote_area:
-                if not game.has_player_voted(st.session_state.player_name):
-                    st.markdown("#### 🤔 Who is the Imposter? / من هو برّه السالفة؟")
-                    st.warning("🎯 +100 points for correct guess! / +100 نقطة للتخمين الصحيح!")
-                    
-                    # Create a grid of vote buttons
-                    player_chunks = [game.players[i:i+2] for i in range(0, len(game.players), 2)]
-                    for chunk in player_chunks:
-                        cols = st.columns(2)
-                        for i, player in enumerate(chunk):
-                            if player.name != st.session_state.player_name:
-                                with cols[i]:
-                                    if st.button(f"👤 Vote {player.name}", 
-                                               key=f"vote_{player.name}",
-                                               use_container_width=True):
-                                        game.submit_vote(st.session_state.player_name, player.name)
-                                        save_game_state(game)
-                                        st.rerun()
-                else:
-                    your_vote = game.votes.get(st.session_state.player_name)
-                    st.success(f"✅ You voted for: {your_vote} / لقد صوت ل")
-                    st.info("⌛ Waiting for others... / بانتظار الآخرين...")
-            
-            total_votes = len(game.votes)
-            total_players = len(game.players)
-            st.progress(total_votes / total_players)
-            st.write(f"Votes: {total_votes}/{total_players}")
-            
-            if game.all_votes_submitted():
-                game.reveal_imposter()
-                save_game_state(game)
+        # Display role and item with improved styling
+        if view.role == views.IMPOSTER:
+            st.error("🎭 You are the Imposter! / أنت برّه السالفة!")
+        else:
+            st.success(f"✨ Regular Player / لاعب عادي\n### Item / العنصر: {view.item}")
+        
+        if view.is_host(me):
+            if st.button("End Discussion & Open Voting"):
+                update_game(phase_action("discussion", lambda g: g.start_voting()), "start_voting")
                 st.rerun()
+    
+    elif view.phase == "voting":
+        st.markdown("### 🗳️ Voting Phase / مرحلة التصويت")
         
-        elif game.phase == "reveal":
-            st.subheader("Results")
-            st.write(f"The Imposter was: {game.imposter.name}")
-            
-            # Show individual results
-            st.write("\nVoting Results:")
-            correct_voters = []
-            for player in game.players:
-                if game.did_player_vote_correctly(player.name):
-                    correct_voters.append(player.name)
-                    if player.name == st.session_state.player_name:
-                        st.success(f"🎉 Excellent! You identified the Imposter correctly! +100 points")
-                    else:
-                        st.success(f"✅ {player.name} identified the Imposter correctly (+100 points)")
-                else:
-                    if player.name == st.session_state.player_name:
-                        if player.name in game.votes:
-                            voted_for = game.votes[player.name]
-                            st.error(f"❌ You guessed {voted_for}, but it was incorrect")
-                        else:
-                            st.warning("⚠️ You didn't vote")
-            
-            if game.is_player_host(st.session_state.player_name):
-                if st.button("Proceed to Imposter Guess"):
-                    game.start_imposter_guess()
-                    save_game_state(game)
-                    st.rerun()
+        vote_area, status_area = st.columns([3, 2])
         
-        elif game.phase == "imposter_guess":
-            st.markdown("### 🎯 Imposter's Guess / تخمين برّه السالفة")
-            
-            if game.is_player_imposter(st.session_state.player_name):
-                st.markdown("#### 🤔 What was everyone discussing? / ماذا كان الجميع يناقشون؟")
-                st.info("Choose carefully - you get 100 points for a correct guess! / اختر بعناية - تحصل على 100 نقطة للتخمين الصحيح!")
-                
-                # Store options and their order in session state to keep them stable
-                if 'imposter_options' not in st.session_state:
-                    st.session_state.imposter_options = game.get_guess_options()
-                    # Create a fixed order for the options
-                    st.session_state.options_order = list(range(len(st.session_state.imposter_options)))
-                
-                options = st.session_state.imposter_options
+        with vote_area:
+            row = view.player(me)
+            if row is None:
+                # Not in this room (stale link, or the code went to a new room): watch only
+                st.info("👀 You're not playing in this room / أنت لست لاعباً في هذه الغرفة")
+            elif not row.voted:
+                st.markdown("#### 🤔 Who is the Imposter? / من هو برّه السالفة؟")
+                st.warning(f"🎯 +{CORRECT_VOTE_POINTS} points for correct guess! / +{CORRECT_VOTE_POINTS} نقطة للتخمين الصحيح!")
                 
-                # Create a container for the grid
-                grid = st.container()
-                
-                # Calculate number of columns (3 items per row)
-                num_cols = 3
-                num_options = len(options)
-                num_rows = (num_options + num_cols - 1) // num_cols
-                
-                # Create the grid using the fixed order
-                for row in range(num_rows):
-                    cols = st.columns(num_cols)
-                    for col in range(num_cols):
-                        idx = row * num_cols + col
-                        if idx < num_options:
-                            option = options[st.session_state.options_order[idx]]
-                            with cols[col]:
-                                image_path = f"item_images/{option.lower().replace(' ', '_')}.png"
-                                if os.path.exists(image_path):
-                                    st.image(image_path, caption=option, width=200)
-                                
-                                if st.button(f"{option}", key=f"guess_{option}", use_container_width=True):
-                                    game.submit_imposter_guess(option)
-                                    game.imposter_guess = option  # Explicitly set the guess
-                                    if option == game.current_item:
-                                        st.success("🎯 You got it! +100 points")
-                                    else:
-                                        st.error(f"❌ Wrong! The correct item was: {game.current_item}")
-                                    # Clear the options from session state when done
-                                    if 'imposter_options' in st.session_state:
-                                        del st.session_state.imposter_options
-                                    if 'options_order' in st.session_state:
-                                        del st.session_state.options_order
-                                    game.show_scores()
-                                    save_game_state(game)
+                # Create a grid of vote buttons
+                player_chunks = [view.players[i:i+2] for i in range(0, len(view.players), 2)]
+                for chunk in player_chunks:
+                    cols = st.columns(2)
+                    for i, player in enumerate(chunk):
+                        if player.name != me:
+                            with cols[i]:
+                                if st.button(f"👤 Vote {player.name}", 
+                                           key=f"vote_{player.name}",
+                                           use_container_width=True):
+                                    voter, voted_for = me, player.name
+                                    update_game(phase_action("voting", lambda g: g.submit_vote(voter, voted_for)), f"vote_{voted_for}")
                                     st.rerun()
             else:
-                st.write("Waiting for the Imposter to make their guess...")
-                st.info(f"The item was: {game.current_item}")
-                image_path = f"item_images/{game.current_item.lower().replace(' ', '_')}.png"
-                if os.path.exists(image_path):
-                    st.image(image_path, caption=game.current_item, width=200)
+                st.success(f"✅ You voted for: {view.my_vote} / لقد صوت ل")
+                st.info("⌛ Waiting for others... / بانتظار الآخرين...")
         
-        elif game.phase == "scores":
-            st.subheader("Round Complete!")
-            
-            if game.imposter_guess == game.current_item:
-                st.success(f"🎯 The Imposter ({game.imposter.name}) won!")
-                st.write(f"Correctly guessed: {game.current_item}")
+    elif view.phase == "reveal":
+        st.subheader("Results")
+        st.write(f"The Imposter was: {view.imposter}")
+        
+        # Show individual results
+        st.write("\nVoting Results:")
+        for player in view.players:
+            if player.voted_correctly:
+                if player.name == me:
+                    st.success(f"🎉 Excellent! You identified the Imposter correctly! +{CORRECT_VOTE_POINTS} points")
+                else:
+                    st.success(f"✅ {player.name} identified the Imposter correctly (+{CORRECT_VOTE_POINTS} points)")
             else:
-                st.error(f"The Imposter ({game.imposter.name}) lost!")
-                st.write(f"The item was: {game.current_item}")
+                if player.name == me:
+                    if player.voted:
+                        st.error(f"❌ You guessed {player.vote}, but it was incorrect")
+                    else:
+                        st.warning("⚠️ You didn't vote")
+        
+        if view.is_host(me):
+            if st.button("Proceed to Imposter Guess"):
+                update_game(phase_action("reveal", lambda g: g.start_imposter_guess()), "start_imposter_guess")
+                st.rerun()
+    
+    elif view.phase == "imposter_guess":
+        st.markdown("### 🎯 Imposter's Guess / تخمين برّه السالفة")
+        
+        if view.role == views.IMPOSTER:
+            st.markdown("#### 🤔 What was everyone discussing? / ماذا كان الجميع يناقشون؟")
+            st.info(f"Choose carefully - you get {IMPOSTER_GUESS_POINTS} points for a correct guess! / اختر بعناية - تحصل على {IMPOSTER_GUESS_POINTS} نقطة للتخمين الصحيح!")
             
-            if game.is_player_host(st.session_state.player_name):
-                st.write("Host Controls:")
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button("Next Round (Same Domain)", key="same_domain"):
-                        current_domain = game.current_domain
-                        game.reset_round()
-                        game.current_domain = current_domain
-                        game.select_item()
-                        game.start_discussion()
-                        save_game_state(game)
-                        st.rerun()
-                
-                with col2:
-                    if st.button("Next Round (New Domain)", key="new_domain"):
-                        game.reset_round()
-                        save_game_state(game)
-                        st.rerun()
-                
-                if st.button("End Game", key="end_game"):
-                    game.reset_game()
-                    save_game_state(game)
+            # The imposter's view carries the options, in an order fixed for the round
+            options = view.guess_options
+            
+
+            # Calculate number of columns (3 items per row)
+            num_cols = 3
+            num_options = len(options)
+            num_rows = (num_options + num_cols - 1) // num_cols
+            
+            # Create the grid using the fixed order
+            for row in range(num_rows):
+                cols = st.columns(num_cols)
+                for col in range(num_cols):
+                    idx = row * num_cols + col
+                    if idx < num_options:
+                        option = options[idx]
+                        with cols[col]:
+                            image = item_images.thumbnail(option)
+                            if image:
+                                st.image(image, caption=option, width=config.THUMBNAIL_WIDTH)
+                            
+                            if st.button(f"{option}", key=f"guess_{option}", use_container_width=True):
+                                view = update_game(phase_action("imposter_guess", lambda g: g.submit_imposter_guess(option)), "guess")
+                                if view is None:
+                                    return
+                                if option == view.item:
+                                    st.success(f"🎯 You got it! +{IMPOSTER_GUESS_POINTS} points")
+                                else:
+                                    st.error(f"❌ Wrong! The correct item was: {view.item}")
+                                st.rerun()
+        else:
+            st.write("Waiting for the Imposter to make their guess...")
+            st.info(f"The item was: {view.item}")
+            image = item_images.thumbnail(view.item)
+            if image:
+                st.image(image, caption=view.item, width=config.THUMBNAIL_WIDTH)
+    
+    elif view.phase == "scores":
+        st.subheader("Round Complete!")
+        
+        if view.imposter_won:
+            st.success(f"🎯 The Imposter ({view.imposter}) won!")
+            st.write(f"Correctly guessed: {view.item}")
+        else:
+            st.error(f"The Imposter ({view.imposter}) lost!")
+            st.write(f"The item was: {view.item}")
+        
+        if view.is_host(me):
+            st.write("Host Controls:")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("Next Round (Same Domain)", key="same_domain"):
+                    def next_round_same_domain(g):
+                        # reset_round keeps the current domain
+                        g.reset_round()
+                        g.select_item()
+                        g.start_discussion()
+                    update_game(phase_action("scores", next_round_same_domain), "next_round")
                     st.rerun()
+            
+            with col2:
+                if st.button("Next Round (New Domain)", key="new_domain"):
+                    update_game(phase_action("scores", lambda g: g.reset_round()), "next_round")
+                    st.rerun()
+            
+            if st.button("End Game", key="end_game"):
+                update_game(phase_action("scores", lambda g: g.reset_game()), "end_game")
+                st.rerun()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,209 @@
+"""
+Item image manifest and thumbnail cache.
+
+item_images/ is scanned once: every item of the loaded content packs is
+matched to its image (the item, or just its English part, in lower case
+with spaces as underscores, as .png/.jpg/.jpeg/.webp), fixed-width
+thumbnails are generated under item_images/.thumbnails/<width>/, and the
+result is written to item_images/manifest.json. Renders then look items up in memory and get
+the thumbnail bytes, read from disk once per process.
+
+Thumbnails need Pillow; without it the original images are served.
+
+    python assets.py             # build the manifest and thumbnails, list items without an image
+    python assets.py --strict    # same, but exit non-zero if any image is missing
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails fall back to the original images
+    Image = None
+
+import config
+from data import get_catalog
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+MANIFEST_NAME = 'manifest.json'
+
+
+def image_stems(item: str) -> List[str]:
+    """File names an item's image may have, without the extension, most specific first.
+
+    Items are "English / Arabic", so besides the whole name (with "/" made
+    safe for a file name) the English part alone is accepted.
+    """
+    stems = [item.lower().replace(' ', '_').replace('/', '_')]
+    english = item.split(' / ')[0]
+    if english != item:
+        stems.append(english.lower().replace(' ', '_'))
+    return stems
+
+
+@dataclass
+class Manifest:
+    width: int
+    images: Dict[str, str]  # item -> thumbnail path, relative to the images directory
+    missing: List[str]  # items without an image
+
+
+class AssetCache:
+    """Item -> thumbnail bytes, built from one scan of the images directory"""
+
+    def __init__(self, images_dir: str = config.ITEM_IMAGES_DIR,
+                 width: int = config.THUMBNAIL_WIDTH):
+        self.images_dir = images_dir
+        self.width = width
+        self.manifest: Optional[Manifest] = None
+        self._bytes: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.images_dir, MANIFEST_NAME)
+
+    @property
+    def thumbnail_dir(self) -> str:
+        return os.path.join(self.images_dir, '.thumbnails', str(self.width))
+
+    def _scan(self) -> Dict[str, str]:
+        """Image stem -> file name, from one listing of the directory"""
+        try:
+            names = os.listdir(self.images_dir)
+        except FileNotFoundError:
+            return {}
+        sources = {}
+        for name in sorted(names):
+            stem, extension = os.path.splitext(name)
+            if extension.lower() in IMAGE_EXTENSIONS:
+                sources.setdefault(stem.lower(), name)
+        return sources
+
+    def _thumbnail(self, source_name: str) -> str:
+        """Thumbnail of one image, regenerated only when the source is newer"""
+        if Image is None:
+            return source_name
+        source = os.path.join(self.images_dir, source_name)
+        name = os.path.splitext(source_name)[0] + '.png'
+        target = os.path.join(self.thumbnail_dir, name)
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source):
+            os.makedirs(self.thumbnail_dir, exist_ok=True)
+            with Image.open(source) as image:
+                if image.width > self.width:
+                    height = round(image.height * self.width / image.width)
+                    image = image.resize((self.width, height), Image.LANCZOS)
+                image.save(target, optimize=True)
+        return os.path.relpath(target, self.images_dir)
+
+    def build(self, items: Iterable[str]) -> Manifest:
+        """Match every item to an image, make the thumbnails and write the manifest"""
+        sources = self._scan()
+        images, missing = {}, []
+        for item in dict.fromkeys(items):
+            source_name = next((sources[stem] for stem in image_stems(item) if stem in sources), None)
+            if source_name is None:
+                missing.append(item)
+                continue
+            try:
+                images[item] = self._thumbnail(source_name)
+            except OSError as e:
+                logger.warning("Could not make a thumbnail of %s: %s", source_name, e)
+                images[item] = source_name
+        manifest = Manifest(self.width, images, missing)
+        if os.path.isdir(self.images_dir):
+            with open(self.manifest_path, 'w', encoding='utf-8') as f:
+                json.dump({'width': manifest.width, 'images': manifest.images, 'missing': manifest.missing},
+                          f, ensure_ascii=False, indent=2)
+        return manifest
+
+    def _read_manifest(self, items: List[str]) -> Optional[Manifest]:
+        """The manifest written by an earlier build, if it still matches the directory and items"""
+        try:
+            if os.path.getmtime(self.manifest_path) < os.path.getmtime(self.images_dir):
+                return None  # images were added or removed since
+            with open(self.manifest_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        manifest = Manifest(data.get('width'), data.get('images', {}), data.get('missing', []))
+        if manifest.width != self.width or set(manifest.images) | set(manifest.missing) != set(items):
+            return None
+        return manifest
+
+    def load(self, items: Iterable[str]) -> Manifest:
+        """Use the prebuilt manifest if it is current, otherwise build it now"""
+        items = list(dict.fromkeys(items))
+        with self._lock:
+            self.manifest = self._read_manifest(items) or self.build(items)
+            self._bytes.clear()
+        if self.manifest.missing:
+            logger.warning("%d items have no image in %s: %s", len(self.manifest.missing), self.images_dir,
+                           ', '.join(self.manifest.missing[:10]) + (' ...' if len(self.manifest.missing) > 10 else ''))
+        return self.manifest
+
+    def thumbnail(self, item: Optional[str]) -> Optional[bytes]:
+        """Thumbnail bytes of an item's image, or None if it has none"""
+        data = self._bytes.get(item)
+        if data is not None or self.manifest is None:
+            return data
+        path = self.manifest.images.get(item)
+        if path is None:
+            return None
+        try:
+            with open(os.path.join(self.images_dir, path), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._bytes[item] = data
+        return data
+
+
+_assets: Optional[AssetCache] = None
+_assets_lock = threading.Lock()
+
+
+def all_items() -> List[str]:
+    return [item for domain in get_catalog().values() for item in domain.items]
+
+
+def get_assets() -> AssetCache:
+    """The process-wide asset cache, loaded for the current packs on first use"""
+    global _assets
+    if _assets is None:
+        with _assets_lock:
+            if _assets is None:
+                assets = AssetCache()
+                assets.load(all_items())
+                _assets = assets
+    return _assets
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the item image manifest and thumbnails")
+    parser.add_argument('--images-dir', default=config.ITEM_IMAGES_DIR)
+    parser.add_argument('--width', type=int, default=config.THUMBNAIL_WIDTH)
+    parser.add_argument('--strict', action='store_true', help="exit non-zero if any item has no image")
+    args = parser.parse_args()
+
+    if Image is None:
+        print("Pillow is not installed; the manifest will point at the original images")
+    assets = AssetCache(args.images_dir, args.width)
+    manifest = assets.build(all_items())
+    print(f"{len(manifest.images)} items with images, {len(manifest.missing)} without")
+    for item in manifest.missing:
+        print(f"  missing: {item} (expected {image_stems(item)[-1]}.png)")
+    if args.strict and manifest.missing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
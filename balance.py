@@ -0,0 +1,251 @@
+"""
+Monte Carlo balance simulator for room size, domain size and scoring.
+
+Plays millions of rounds at once as NumPy array operations, by the rules of
+game_logic.Game: the item and the imposter are drawn uniformly
+(select_item), the imposter picks from the item plus three distinct
+distractors of its domain (get_guess_options), every player votes for
+someone other than themselves, and points go out as in
+submit_imposter_guess. How players vote and guess is pluggable:
+
+    voters   uniform          everyone votes for a random other player
+             accurate:P       players who know the item find the imposter with probability P
+             skilled:P,P,...  the same, with an accuracy per seat
+    guesser  random           the imposter picks one of the four options at random
+             informed:P       the imposter knows the item with probability P, else picks at random
+
+For each player count and domain of the selected content packs it reports
+how often the imposter is guessing right and getting caught, the longest
+streaks per game, and the spread of final scores. Domains only matter
+through their size, so each size is simulated once per player count.
+Needs NumPy, which the app itself doesn't: pip install -r requirements-dev.txt
+
+    python balance.py --players 3-10 --games 20000 --rounds 10
+    python balance.py --voters accurate:0.5 --guesser informed:0.2 --imposter-points 150
+"""
+import argparse
+import time
+from typing import Callable, Dict, Iterator, List, Sequence
+
+import numpy as np
+
+from data import get_catalog
+from game_logic import CORRECT_VOTE_POINTS, IMPOSTER_GUESS_POINTS
+
+GUESS_OPTIONS = 4  # the item and three distractors
+CHUNK_CELLS = 4_000_000  # game x round x player cells simulated per batch, bounding memory
+
+# (rng, imposter[games, rounds], players) -> votes[games, rounds, players]
+VoterModel = Callable[[np.random.Generator, np.ndarray, int], np.ndarray]
+# (rng, options[games, rounds, 4], item[games, rounds]) -> guess[games, rounds]
+GuessModel = Callable[[np.random.Generator, np.ndarray, np.ndarray], np.ndarray]
+
+
+def _others(rng: np.random.Generator, shape: Sequence[int], excluded: Sequence[np.ndarray], n: int) -> np.ndarray:
+    """Uniform picks from range(n) avoiding the excluded values (distinct per cell), in O(len(excluded))"""
+    picks = rng.integers(n - len(excluded), size=shape)
+    # Shift past each excluded value, smallest first, like Domain.sample_distractors does for one
+    for skip in np.sort(np.stack(np.broadcast_arrays(*excluded)), axis=0):
+        picks += picks >= skip
+    return picks
+
+
+def _seats(imposter: np.ndarray, players: int) -> np.ndarray:
+    return np.broadcast_to(np.arange(players), imposter.shape + (players,))
+
+
+def uniform_voters(rng: np.random.Generator, imposter: np.ndarray, players: int) -> np.ndarray:
+    """Everyone votes for a random other player"""
+    seats = _seats(imposter, players)
+    return _others(rng, seats.shape, [seats], players)
+
+
+class AccurateVoters:
+    """Players who know the item vote for the imposter with their accuracy, else for a random innocent.
+
+    The imposter votes for a random other player. accuracy is one probability
+    for everyone or one per seat.
+    """
+
+    def __init__(self, accuracy):
+        self.accuracy = np.asarray(accuracy, dtype=float)
+
+    def __call__(self, rng: np.random.Generator, imposter: np.ndarray, players: int) -> np.ndarray:
+        seats = _seats(imposter, players)
+        accuracy = np.broadcast_to(self.accuracy if self.accuracy.ndim == 0 else self.accuracy[:players],
+                                   (players,))
+        suspects = imposter[..., None]
+        if players > 2:
+            misses = _others(rng, seats.shape, [seats, np.broadcast_to(suspects, seats.shape)], players)
+        else:
+            misses = np.broadcast_to(suspects, seats.shape)  # with two players the only other is the imposter
+        votes = np.where(rng.random(seats.shape) < accuracy, suspects, misses)
+        is_imposter = seats == suspects
+        votes[is_imposter] = _others(rng, (int(is_imposter.sum()),), [seats[is_imposter]], players)
+        return votes
+
+
+def random_guesser(rng: np.random.Generator, options: np.ndarray, item: np.ndarray) -> np.ndarray:
+    """The imposter picks one of the options at random"""
+    return np.take_along_axis(options, rng.integers(options.shape[-1], size=item.shape + (1,)), axis=-1)[..., 0]
+
+
+class InformedGuesser:
+    """The imposter worked the item out with probability p, else guesses at random"""
+
+    def __init__(self, p: float):
+        self.p = p
+
+    def __call__(self, rng: np.random.Generator, options: np.ndarray, item: np.ndarray) -> np.ndarray:
+        return np.where(rng.random(item.shape) < self.p, item, random_guesser(rng, options, item))
+
+
+def parse_voters(spec: str) -> VoterModel:
+    name, _, arg = spec.partition(':')
+    if name == 'uniform':
+        return uniform_voters
+    if name == 'accurate':
+        return AccurateVoters(float(arg))
+    if name == 'skilled':
+        return AccurateVoters([float(p) for p in arg.split(',')])
+    raise ValueError(f"Unknown voter model: {spec}")
+
+
+def parse_guesser(spec: str) -> GuessModel:
+    name, _, arg = spec.partition(':')
+    if name == 'random':
+        return random_guesser
+    if name == 'informed':
+        return InformedGuesser(float(arg))
+    raise ValueError(f"Unknown guess model: {spec}")
+
+
+def longest_run(flags: np.ndarray) -> np.ndarray:
+    """Length of the longest run of True along the last axis"""
+    steps = np.arange(flags.shape[-1])
+    last_false = np.maximum.accumulate(np.where(flags, -1, steps), axis=-1)
+    return (steps - last_false).max(axis=-1, initial=0)
+
+
+def play(rng: np.random.Generator, games: int, rounds: int, players: int, domain_size: int,
+         voters: VoterModel = uniform_voters, guesser: GuessModel = random_guesser,
+         imposter_points: int = IMPOSTER_GUESS_POINTS, vote_points: int = CORRECT_VOTE_POINTS) -> Dict[str, np.ndarray]:
+    """Play games of rounds in one room size and domain size; per-game and per-round outcome arrays"""
+    shape = (games, rounds)
+    item = rng.integers(domain_size, size=shape)
+    imposter = rng.integers(players, size=shape)
+
+    # Three distinct distractors besides the item, then the options in random order as the imposter sees them
+    distractors = []
+    for _ in range(GUESS_OPTIONS - 1):
+        distractors.append(_others(rng, shape, [item] + distractors, domain_size))
+    options = np.stack([item] + distractors, axis=-1)
+    options = np.take_along_axis(options, rng.random(options.shape).argsort(axis=-1), axis=-1)
+    guessed = guesser(rng, options, item) == item
+
+    votes = voters(rng, imposter, players)
+    correct = votes == imposter[..., None]
+    # Votes per player in every round, counted in one pass over the flattened rounds
+    cells = np.arange(games * rounds).reshape(shape)[..., None] * players
+    tally = np.bincount((cells + votes).ravel(), minlength=games * rounds * players).reshape(shape + (players,))
+    imposter_votes = np.take_along_axis(tally, imposter[..., None], axis=-1)[..., 0]
+    # Caught: the imposter has strictly the most votes; a tied leader isn't caught
+    is_imposter = np.arange(players) == imposter[..., None]
+    caught = imposter_votes > np.where(is_imposter, -1, tally).max(axis=-1)
+
+    points = correct * vote_points + is_imposter * (guessed * imposter_points)[..., None]
+    scores = points.sum(axis=1)
+    ranked = np.sort(scores, axis=-1)
+    return {
+        'guessed': guessed,
+        'caught': caught,
+        'correct_voters': correct.sum(axis=-1),
+        'imposter_points': guessed * imposter_points,
+        'round_points': points.sum(axis=-1),
+        'scores': scores,
+        'margin': ranked[:, -1] - ranked[:, -2],
+        'guess_streak': longest_run(guessed),
+        'imposter_streak': longest_run(imposter[:, 1:] == imposter[:, :-1]) + 1,
+    }
+
+
+def summarize(outcomes: List[Dict[str, np.ndarray]]) -> Dict[str, float]:
+    merged = {key: np.concatenate([o[key] for o in outcomes]) for key in outcomes[0]}
+    scores = merged['scores'].ravel()
+    return {
+        'guess_rate': merged['guessed'].mean(),
+        'caught_rate': merged['caught'].mean(),
+        'correct_voters': merged['correct_voters'].mean(),
+        'imposter_share': merged['imposter_points'].sum() / max(1, merged['round_points'].sum()),
+        'score_mean': scores.mean(),
+        'score_p10': np.percentile(scores, 10),
+        'score_p50': np.percentile(scores, 50),
+        'score_p90': np.percentile(scores, 90),
+        'margin': merged['margin'].mean(),
+        'guess_streak': merged['guess_streak'].mean(),
+        'guess_streak_p99': np.percentile(merged['guess_streak'], 99),
+        'imposter_streak_p99': np.percentile(merged['imposter_streak'], 99),
+    }
+
+
+def _batches(games: int, rounds: int, players: int) -> Iterator[int]:
+    per_batch = max(1, CHUNK_CELLS // (rounds * players))
+    for start in range(0, games, per_batch):
+        yield min(per_batch, games - start)
+
+
+def sweep(player_counts: Sequence[int], domain_sizes: Dict[str, int], games: int, rounds: int,
+          seed: int = 0, **rules) -> List[Dict]:
+    """One summary row per player count and domain"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for players in player_counts:
+        by_size = {}  # outcomes depend on the domain only through its size
+        for domain, size in domain_sizes.items():
+            if size not in by_size:
+                by_size[size] = summarize([play(rng, batch, rounds, players, size, **rules)
+                                           for batch in _batches(games, rounds, players)])
+            rows.append({'players': players, 'domain': domain, 'items': size, **by_size[size]})
+    return rows
+
+
+def _player_counts(spec: str) -> List[int]:
+    low, _, high = spec.partition('-')
+    return list(range(int(low), int(high or low) + 1))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', default='3-10', help="player count or range, e.g. 3-10")
+    parser.add_argument('--games', type=int, default=20000, help="games per player count and domain")
+    parser.add_argument('--rounds', type=int, default=10, help="rounds per game")
+    parser.add_argument('--voters', default='uniform', help="uniform, accurate:P or skilled:P,P,...")
+    parser.add_argument('--guesser', default='random', help="random or informed:P")
+    parser.add_argument('--imposter-points', type=int, default=IMPOSTER_GUESS_POINTS)
+    parser.add_argument('--vote-points', type=int, default=CORRECT_VOTE_POINTS)
+    parser.add_argument('--domain', action='append', help="only these domains (default: all of the packs)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    domain_sizes = {name: len(domain) for name, domain in get_catalog().items()
+                    if not args.domain or name in args.domain}
+    start = time.perf_counter()
+    rows = sweep(_player_counts(args.players), domain_sizes, args.games, args.rounds, args.seed,
+                 voters=parse_voters(args.voters), guesser=parse_guesser(args.guesser),
+                 imposter_points=args.imposter_points, vote_points=args.vote_points)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'players':>7}  {'domain':<28}{'items':>6}{'guess%':>8}{'caught%':>8}{'voters':>8}{'imp.pts%':>9}"
+          f"{'p10':>7}{'p50':>7}{'p90':>7}{'margin':>8}{'streak':>8}{'s.p99':>6}{'same.p99':>9}")
+    for row in rows:
+        print(f"{row['players']:>7}  {row['domain'][:27]:<28}{row['items']:>6}{row['guess_rate'] * 100:>8.1f}"
+              f"{row['caught_rate'] * 100:>8.1f}{row['correct_voters']:>8.2f}{row['imposter_share'] * 100:>9.1f}"
+              f"{row['score_p10']:>7.0f}{row['score_p50']:>7.0f}{row['score_p90']:>7.0f}{row['margin']:>8.0f}"
+              f"{row['guess_streak']:>8.2f}{row['guess_streak_p99']:>6.0f}{row['imposter_streak_p99']:>9.0f}")
+    total = len({(row['players'], row['items']) for row in rows}) * args.games * args.rounds
+    print(f"\n{total:,} rounds in {elapsed:.2f}s ({total / elapsed:,.0f} rounds/s); "
+          f"scores after {args.rounds} rounds, streaks are the longest per game")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+Networked room store and change feed, so several app workers can share rooms.
+
+The protocol is newline-delimited JSON over TCP: each request is
+{"op": ..., **args} and gets {"ok": true, "result": ...} or
+{"ok": false, "error": ...} back. A connection that sends "subscribe"
+instead receives one {"room": code, "version": n, "incarnation": id} line
+per saved room (version null once a room is deleted).
+
+The server here is a pure-Python stand-in that keeps rooms in memory. Any
+key-value service with compare-and-swap and pub/sub can take its place
+behind BrokerStore.
+
+    python broker.py --port 7400                         # start the stand-in broker
+    IMPOSTER_STORE=broker IMPOSTER_BROKER=127.0.0.1:7400 streamlit run app.py
+"""
+import argparse
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import config
+import metrics
+import storage
+from notify import room_notifier
+
+logger = logging.getLogger(__name__)
+
+
+class BrokerError(Exception):
+    """Raised when the broker rejects a request or cannot be reached"""
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class RoomTable:
+    """The broker's rooms: code -> (version, phase, updated_at, data)"""
+
+    def __init__(self):
+        self._rooms: Dict[str, Tuple[int, str, float, Dict]] = {}
+        self._lock = threading.Lock()
+        self._subscribers: List = []
+        self._subscribers_lock = threading.Lock()
+
+    def _put(self, room_code: str, data: Dict) -> int:
+        version = data.get('version', 0)
+        self._rooms[room_code] = (version, data.get('phase', ''), time.time(), data)
+        return version
+
+    def get(self, room_code: str) -> Optional[Dict]:
+        entry = self._rooms.get(room_code)
+        return entry[3] if entry else None
+
+    def version(self, room_code: str) -> Optional[Hashable]:
+        entry = self._rooms.get(room_code)
+        return storage.version_token(entry[3]) if entry else None
+
+    def save(self, room_code: str, data: Dict) -> None:
+        with self._lock:
+            version = self._put(room_code, data)
+        self.publish(room_code, version, data.get('incarnation'))
+
+    def create(self, room_code: str, data: Dict) -> bool:
+        with self._lock:
+            if room_code in self._rooms:
+                return False
+            version = self._put(room_code, data)
+        self.publish(room_code, version, data.get('incarnation'))
+        return True
+
+    def cas(self, room_code: str, expected_version: int, data: Dict) -> bool:
+        with self._lock:
+            entry = self._rooms.get(room_code)
+            if (entry is None or entry[0] != expected_version
+                    or entry[3].get('incarnation') != data.get('incarnation')):
+                return False
+            version = self._put(room_code, data)
+        self.publish(room_code, version, data.get('incarnation'))
+        return True
+
+    def delete(self, room_code: str) -> None:
+        with self._lock:
+            found = self._rooms.pop(room_code, None)
+        if found is not None:
+            self.publish(room_code, None)
+
+    def keys(self) -> List[str]:
+        return sorted(self._rooms)
+
+    def idle(self, cutoffs: Dict[str, float], default_cutoff: float) -> List[str]:
+        with self._lock:
+            entries = list(self._rooms.items())
+        return [room_code for room_code, (_, phase, updated_at, _) in entries
+                if updated_at < cutoffs.get(phase, default_cutoff)]
+
+    def delete_unchanged(self, versions: Dict[str, int]) -> List[str]:
+        deleted = []
+        with self._lock:
+            for room_code, version in versions.items():
+                entry = self._rooms.get(room_code)
+                if entry is not None and entry[0] == version:
+                    del self._rooms[room_code]
+                    deleted.append(room_code)
+        for room_code in deleted:
+            self.publish(room_code, None)
+        return deleted
+
+    def subscribe(self, wfile) -> None:
+        with self._subscribers_lock:
+            self._subscribers.append(wfile)
+
+    def publish(self, room_code: str, version: Optional[int], incarnation: Optional[str] = None) -> None:
+        line = (json.dumps({'room': room_code, 'version': version, 'incarnation': incarnation}) + '\n').encode()
+        with self._subscribers_lock:
+            for wfile in list(self._subscribers):
+                try:
+                    wfile.write(line)
+                    wfile.flush()
+                except OSError:
+                    self._subscribers.remove(wfile)
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        table: RoomTable = self.server.table
+        for line in self.rfile:
+            request = json.loads(line)
+            op = request.pop('op')
+            if op == 'subscribe':
+                table.subscribe(self.wfile)
+                # Push mode: hold the connection open until the client goes away
+                self.rfile.read()
+                return
+            try:
+                response = {'ok': True, 'result': getattr(table, op)(**request)}
+            except Exception as e:
+                response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+            self.wfile.write((json.dumps(response) + '\n').encode())
+            self.wfile.flush()
+
+
+class BrokerServer(socketserver.ThreadingTCPServer):
+    """Local stand-in broker, one thread per connection"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int] = ('127.0.0.1', 0)):
+        super().__init__(address, _BrokerHandler)
+        self.table = RoomTable()
+
+    @property
+    def address(self) -> str:
+        host, port = self.server_address[:2]
+        return f'{host}:{port}'
+
+    def start(self) -> 'BrokerServer':
+        """Serve on a daemon thread"""
+        threading.Thread(target=self.serve_forever, name='room-broker', daemon=True).start()
+        return self
+
+
+class BrokerClient:
+    """Request/response connection to the broker, one socket per thread"""
+
+    def __init__(self, address: str = config.BROKER_ADDRESS, timeout: float = 10):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+        return conn
+
+    def _drop(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+            self._local.conn = None
+
+    def call(self, op: str, **args):
+        request = (json.dumps({'op': op, **args}) + '\n').encode()
+        for attempt in range(2):
+            try:
+                sock, rfile = self._connect()
+                sock.sendall(request)
+                line = rfile.readline()
+                if not line:
+                    raise ConnectionError("broker closed the connection")
+                break
+            except OSError as e:
+                # Reconnect once, e.g. after the broker restarted
+                self._drop()
+                if attempt:
+                    raise BrokerError(f"Broker at {self.address[0]}:{self.address[1]} unreachable: {e}") from e
+        response = json.loads(line)
+        if not response['ok']:
+            raise BrokerError(response['error'])
+        return response['result']
+
+    def close(self) -> None:
+        self._drop()
+
+
+class BrokerStore(storage.RoomStore):
+    """Room store kept by the broker, shared by every worker that points at it.
+
+    A background subscription feeds saved versions into the local notifier,
+    so watchers in this worker wake up for saves made by any other worker,
+    and into a map of version tokens that lets version() skip the network.
+    """
+
+    name = 'broker'
+
+    def __init__(self, address: str = config.BROKER_ADDRESS):
+        self.client = BrokerClient(address)
+        self._versions: Dict[str, Tuple[Optional[str], int]] = {}  # room -> (incarnation, version)
+        self._versions_lock = threading.Lock()
+        self._subscribed = threading.Event()
+        self._closed = False
+        self._feed: Optional[socket.socket] = None
+        self._subscriber = threading.Thread(target=self._follow, name='broker-subscriber', daemon=True)
+        self._subscriber.start()
+        self._subscribed.wait(self.client.timeout)
+
+    def _follow(self) -> None:
+        """Apply the broker's change feed, reconnecting if it drops"""
+        while not self._closed:
+            try:
+                with socket.create_connection(self.client.address) as sock:
+                    self._feed = sock
+                    sock.sendall(b'{"op": "subscribe"}\n')
+                    with self._versions_lock:
+                        self._versions.clear()  # may have missed changes while disconnected
+                    self._subscribed.set()
+                    for line in sock.makefile('rb'):
+                        change = json.loads(line)
+                        self._seen(change['room'], change['version'], change.get('incarnation'))
+            except OSError as e:
+                logger.warning("Broker change feed lost: %s", e)
+            self._subscribed.clear()
+            if not self._closed:
+                time.sleep(1)
+
+    def _seen(self, room_code: str, version: Optional[int], incarnation: Optional[str] = None) -> None:
+        with self._versions_lock:
+            known = self._versions.get(room_code)
+            if version is None:
+                self._versions.pop(room_code, None)
+            elif known is None or known[0] != incarnation or version > known[1]:
+                self._versions[room_code] = (incarnation, version)
+            else:
+                return
+        if version is None:
+            room_notifier.forget(room_code)
+        else:
+            room_notifier.publish(room_code, version)
+
+    def _encode(self, data: Dict) -> Dict:
+        metrics.STORE_BYTES_WRITTEN.inc(self.name, amount=len(json.dumps(data)))
+        return data
+
+    def load(self, room_code: str) -> Optional[Dict]:
+        return self.client.call('get', room_code=room_code)
+
+    def save(self, room_code: str, data: Dict) -> Hashable:
+        self.client.call('save', room_code=room_code, data=self._encode(data))
+        self._seen(room_code, data.get('version', 0), data.get('incarnation'))
+        return storage.version_token(data)
+
+    def create(self, room_code: str, data: Dict) -> Optional[Hashable]:
+        if not self.client.call('create', room_code=room_code, data=self._encode(data)):
+            return None
+        self._seen(room_code, data.get('version', 0), data.get('incarnation'))
+        return storage.version_token(data)
+
+    def compare_and_swap(self, room_code: str, expected_version: int, data: Dict,
+                         events: List[Dict] = None) -> Optional[Hashable]:
+        # The broker keeps the room's own version number, so with its incarnation it makes the token
+        if not self.client.call('cas', room_code=room_code, expected_version=expected_version,
+                                data=self._encode(data)):
+            return None
+        self._seen(room_code, data.get('version', 0), data.get('incarnation'))
+        return storage.version_token(data)
+
+    def version(self, room_code: str) -> Optional[Hashable]:
+        if self._subscribed.is_set():
+            token = self._versions.get(room_code)
+            if token is not None:
+                return token
+        token = self.client.call('version', room_code=room_code)
+        if token is None:
+            return None
+        token = tuple(token)
+        if self._subscribed.is_set():
+            with self._versions_lock:
+                known = self._versions.get(room_code)
+                if known is None or known[0] != token[0] or token[1] > known[1]:
+                    self._versions[room_code] = token
+        return token
+
+    def delete(self, room_code: str) -> None:
+        self.client.call('delete', room_code=room_code)
+        self._seen(room_code, None)
+
+    def room_codes(self) -> List[str]:
+        return self.client.call('keys')
+
+    def idle_rooms(self, cutoffs: Dict[str, float], default_cutoff: float) -> List[str]:
+        return self.client.call('idle', cutoffs=cutoffs, default_cutoff=default_cutoff)
+
+    def delete_unchanged(self, versions: Dict[str, int]) -> List[str]:
+        deleted = self.client.call('delete_unchanged', versions=versions)
+        for room_code in deleted:
+            self._seen(room_code, None)
+        return deleted
+
+    def close(self) -> None:
+        self._closed = True
+        if self._feed is not None:
+            try:
+                self._feed.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in room broker")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=parse_address(config.BROKER_ADDRESS)[1])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = BrokerServer((args.host, args.port))
+    logger.info("Room broker listening on %s", server.address)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
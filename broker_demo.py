@@ -0,0 +1,136 @@
+"""
+Two app workers sharing rooms through the broker.
+
+Starts the stand-in broker, then runs worker processes that each own some of
+the players of one room. Every worker votes for its own players, waits for the
+other workers' votes through the broker's change feed, and records what it
+sees once the votes are revealed. All workers must agree on every round.
+
+    python broker_demo.py --workers 2 --players 8 --rounds 5
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+
+import storage
+from broker import BrokerServer, BrokerStore
+from data import DOMAINS
+from game_logic import Game, Player
+from notify import room_notifier
+
+ROOM_CODE = 'DEMO'
+
+
+def wait_for(predicate, timeout: float = 10) -> Game:
+    """Block on the change feed until the room satisfies predicate"""
+    deadline = time.time() + timeout
+    while True:
+        game = storage.load_cached_game_state(ROOM_CODE)
+        if predicate(game):
+            return game
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutError(f"Room stuck in {game.phase} at version {game.version}")
+        room_notifier.wait_for_change(ROOM_CODE, game.version, min(remaining, 0.5))
+
+
+def in_phase(phase, action):
+    def mutate(game):
+        if game.phase != phase:
+            return False
+        action(game)
+    return mutate
+
+
+def worker(index: int, workers: int, players: int, rounds: int, address: str, barrier, results) -> None:
+    storage.set_store(BrokerStore(address))
+    names = [f'p{i}' for i in range(players)]
+    mine = names[index::workers]
+
+    for round_number in range(rounds):
+        if index == 0:
+            def open_voting(g):
+                g.set_domain(g.current_domain or DOMAINS[0])
+                g.select_item()
+                g.start_discussion()
+                g.start_voting()
+            storage.update_game_state(ROOM_CODE, in_phase("round_setup", open_voting))
+
+        wait_for(lambda g: g.phase == "voting")
+        for name in mine:
+            voted_for = names[(names.index(name) + 1) % players]
+            storage.update_game_state(ROOM_CODE, in_phase("voting", lambda g: g.submit_vote(name, voted_for)))
+
+        # Whoever sees the last vote first reveals; the phase guard keeps it to one reveal
+        wait_for(lambda g: g.phase != "voting" or g.all_votes_submitted())
+
+        def reveal_when_done(g):
+            if g.phase != "voting" or not g.all_votes_submitted():
+                return False
+            g.reveal_imposter()
+        storage.update_game_state(ROOM_CODE, reveal_when_done)
+        game = wait_for(lambda g: g.phase == "reveal")
+        results.put((round_number, index, game.version, game.phase, tuple(sorted(game.votes.items())),
+                     game.imposter.name))
+
+        barrier.wait()
+        if index == 0:
+            def finish_round(g):
+                g.start_imposter_guess()
+                g.submit_imposter_guess(g.current_item)
+                g.reset_round()
+            storage.update_game_state(ROOM_CODE, in_phase("reveal", finish_round))
+        wait_for(lambda g: g.phase == "round_setup")
+        barrier.wait()  # everyone saw the round end before the next one opens
+    storage.get_store().close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--players', type=int, default=6)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    server = BrokerServer().start()
+    store = BrokerStore(server.address)
+    storage.set_store(store)
+    game = Game(ROOM_CODE)
+    for i in range(args.players):
+        game.add_player(Player(f'p{i}', is_host=(i == 0)))
+    game.start_round()
+    storage.create_game_state(game)
+
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(args.workers)
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(i, args.workers, args.players, args.rounds, server.address,
+                                          barrier, results))
+        for i in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    seen = [results.get(timeout=60) for _ in range(args.workers * args.rounds)]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    failures = 0
+    for round_number in range(args.rounds):
+        views = {tuple(view[2:]) for view in seen if view[0] == round_number}
+        votes = next(iter(views))[2]
+        if len(views) != 1 or len(votes) != args.players:
+            failures += 1
+            print(f"round {round_number}: workers disagree or votes missing: {views}")
+    print(f"{args.workers} workers, {args.players} players, {args.rounds} rounds in {elapsed:.2f}s: "
+          f"{'all workers agreed' if not failures else f'{failures} rounds diverged'}")
+    store.close()
+    server.shutdown()
+    sys.exit(1 if failures or any(p.exitcode for p in processes) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Compact, versioned binary encoding of room documents.
+
+    header  10 bytes: magic b'IMPR', format version, phase code, room version (uint32)
+    body    JSON array of the document's fields in FIELDS order, no keys or spaces
+
+Pollers that only need the room version or phase read the header with
+read_header() and never decode the body. decode() also accepts the older
+plain-JSON documents, so stored rooms can be migrated as they are read.
+"""
+import json
+import struct
+from typing import Dict, List, NamedTuple, Union
+
+MAGIC = b'IMPR'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('>4sBBI')
+
+PHASES = ("lobby", "round_setup", "discussion", "voting", "reveal", "imposter_guess", "scores")
+UNKNOWN_PHASE = 255  # the phase is always in the body too, so new phases still round-trip
+
+# Body layout of FORMAT_VERSION. New fields are only ever appended; decode()
+# fills fields missing from older bodies with None.
+FIELDS = ('room_code', 'phase', 'min_players', 'current_domain', 'current_item', 'imposter',
+          'imposter_guess', 'discussion_duration', 'discussion_end_time', 'voting_duration',
+          'voting_end_time', 'phase_started_at', 'players', 'schema', 'applied_keys',
+          'incarnation')
+PLAYER_FIELDS = ('name', 'is_host', 'score', 'vote')
+
+
+class FormatError(ValueError):
+    """Raised for data that is neither an encoded room nor a JSON room document"""
+
+
+class RoomHeader(NamedTuple):
+    version: int
+    phase: str
+
+
+def is_encoded(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+def read_header(data: bytes) -> RoomHeader:
+    """Room version and phase from the first HEADER.size bytes, without decoding the body"""
+    if len(data) < HEADER.size or not is_encoded(data):
+        raise FormatError("Not an encoded room")
+    _, _, phase_code, version = HEADER.unpack_from(data)
+    if phase_code == UNKNOWN_PHASE:
+        return RoomHeader(version, _body(data)[FIELDS.index('phase')])
+    return RoomHeader(version, PHASES[phase_code])
+
+
+def _dumps(value) -> bytes:
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def encode_player(player: Dict) -> List:
+    return [player.get(field) for field in PLAYER_FIELDS]
+
+
+def decode_player(row: List) -> Dict:
+    player = dict(zip(PLAYER_FIELDS, row))
+    player.setdefault('vote', None)
+    return player
+
+
+def pack_player(player: Dict) -> bytes:
+    """One player on its own, as the row it takes up in a room body"""
+    return _dumps(encode_player(player))
+
+
+def unpack_player(data: bytes) -> Dict:
+    return decode_player(json.loads(data))
+
+
+def encode(doc: Dict) -> bytes:
+    """Encode a room document (see Game.to_dict)"""
+    phase = doc['phase']
+    phase_code = PHASES.index(phase) if phase in PHASES else UNKNOWN_PHASE
+    # Votes live on the players, so the body doesn't repeat them
+    body = [[encode_player(player) for player in doc['players']] if field == 'players' else doc.get(field)
+            for field in FIELDS]
+    return HEADER.pack(MAGIC, FORMAT_VERSION, phase_code, doc.get('version', 0)) + _dumps(body)
+
+
+def _body(data: bytes) -> List:
+    _, format_version, _, _ = HEADER.unpack_from(data)
+    if format_version > FORMAT_VERSION:
+        raise FormatError(f"Room encoded with format {format_version}, newer than this server's {FORMAT_VERSION}")
+    try:
+        return json.loads(data[HEADER.size:])
+    except ValueError as e:
+        raise FormatError(f"Corrupt room body: {e}") from None
+
+
+def decode(data: Union[bytes, str]) -> Dict:
+    """Decode an encoded room, or parse a legacy JSON document as is"""
+    if isinstance(data, str) or not is_encoded(data):
+        try:
+            doc = json.loads(data)
+        except ValueError as e:
+            raise FormatError(f"Neither an encoded room nor JSON: {e}") from None
+        if not isinstance(doc, dict):
+            raise FormatError("Room JSON must be an object")
+        return doc
+    header = read_header(data)
+    body = _body(data)
+    body += [None] * (len(FIELDS) - len(body))
+    doc = dict(zip(FIELDS, body))
+    doc['version'] = header.version
+    doc['players'] = [decode_player(row) for row in doc['players'] or []]
+    doc['votes'] = {p['name']: p['vote'] for p in doc['players'] if p['vote'] is not None}
+    return doc
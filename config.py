@@ -0,0 +1,94 @@
+"""
+Server configuration, read from environment variables
+"""
+import os
+
+# Room state storage: "json" (one file per room), "sqlite" (single WAL database),
+# "eventlog" (per-room snapshot plus append-only event log) or "broker" (networked
+# store shared by several app workers, see broker.py)
+STORE_BACKEND = os.environ.get("IMPOSTER_STORE", "json")
+STATE_DIR = os.environ.get("IMPOSTER_STATE_DIR", "game_states")
+SQLITE_PATH = os.environ.get("IMPOSTER_SQLITE_PATH", "game_states.db")
+BROKER_ADDRESS = os.environ.get("IMPOSTER_BROKER", "127.0.0.1:7400")
+
+# Shortest time between runs of a client's room watcher, in seconds; it runs at
+# the shortest poll interval of the room's phase (PHASE_POLL_INTERVALS) but
+# never more often than this. Saves in this process are picked up on its next run.
+WATCH_TICK = float(os.environ.get("IMPOSTER_WATCH_TICK", "0.5"))
+
+# Spectators of a room share one snapshot per server process, checked against
+# the store at most this often, in seconds (see spectate.py)
+SPECTATOR_REFRESH = float(os.environ.get("IMPOSTER_SPECTATOR_REFRESH", "1.0"))
+
+# Headless JSON/WebSocket game API (see api.py): host:port to listen on, and the
+# threads that run its room reads and writes
+API_ADDRESS = os.environ.get("IMPOSTER_API", "127.0.0.1:8600")
+API_THREADS = int(os.environ.get("IMPOSTER_API_THREADS", "16"))
+
+# Fallback polling of the store for saves made by other processes: (min, max)
+# seconds per phase. The interval doubles while nothing changes.
+PHASE_POLL_INTERVALS = {
+    "lobby": (1, 10),
+    "round_setup": (1, 5),
+    "discussion": (1, 1),
+    "voting": (1, 4),
+    "reveal": (1, 5),
+    "imposter_guess": (1, 5),
+    "scores": (2, 30),
+}
+
+# Attempts made by storage.update_game_state before giving up on a busy room
+UPDATE_RETRIES = int(os.environ.get("IMPOSTER_UPDATE_RETRIES", "50"))
+
+# Updates of a room that arrive while this process is committing it go out
+# together in its next commit; the committer can also wait this many seconds
+# for more to join (default 0: no added latency, batches form under load only)
+GROUP_COMMIT_WINDOW = float(os.environ.get("IMPOSTER_GROUP_COMMIT_WINDOW", "0"))
+
+# Event log store: fold a room's log into a new snapshot once it grows past this many bytes
+EVENT_LOG_COMPACT_BYTES = int(os.environ.get("IMPOSTER_EVENT_LOG_COMPACT_BYTES", "16384"))
+
+# Room codes start at this many letters and get longer, up to the max, once more
+# than ROOM_CODE_GROW_OCCUPANCY of the codes of the current length are in use
+ROOM_CODE_LENGTH = int(os.environ.get("IMPOSTER_ROOM_CODE_LENGTH", "4"))
+ROOM_CODE_MAX_LENGTH = int(os.environ.get("IMPOSTER_ROOM_CODE_MAX_LENGTH", "6"))
+ROOM_CODE_GROW_OCCUPANCY = float(os.environ.get("IMPOSTER_ROOM_CODE_GROW_OCCUPANCY", "0.05"))
+
+# Rooms idle for longer than their phase's TTL (seconds) are archived and deleted
+# by the background sweeper, which runs every SWEEP_INTERVAL seconds (0 disables it)
+ROOM_TTLS = {
+    "lobby": float(os.environ.get("IMPOSTER_TTL_LOBBY", "3600")),
+    "scores": float(os.environ.get("IMPOSTER_TTL_SCORES", "1800")),
+}
+ROOM_TTL_DEFAULT = float(os.environ.get("IMPOSTER_TTL_DEFAULT", "10800"))
+SWEEP_INTERVAL = float(os.environ.get("IMPOSTER_SWEEP_INTERVAL", "300"))
+ARCHIVE_DIR = os.environ.get("IMPOSTER_ARCHIVE_DIR", "archive")
+
+# Server-side phase timers: discussion moves on to voting, and voting closes with
+# the votes cast so far, once their time is up (IMPOSTER_PHASE_TIMERS=0 leaves it to the host)
+PHASE_TIMERS_ENABLED = os.environ.get("IMPOSTER_PHASE_TIMERS", "1") not in ("0", "false", "no", "off")
+
+# Content packs (JSON or CSV files in PACKS_DIR) to load, comma separated
+PACKS_DIR = os.environ.get("IMPOSTER_PACKS_DIR", "packs")
+CONTENT_PACKS = [name.strip() for name in os.environ.get("IMPOSTER_PACKS", "default").split(",") if name.strip()]
+
+# Item images and the width of the thumbnails shown for them (see assets.py)
+ITEM_IMAGES_DIR = os.environ.get("IMPOSTER_IMAGES_DIR", "item_images")
+THUMBNAIL_WIDTH = int(os.environ.get("IMPOSTER_THUMBNAIL_WIDTH", "200"))
+
+# Cross-room statistics: round history, player and domain totals (see stats.py)
+STATS_PATH = os.environ.get("IMPOSTER_STATS_PATH", "stats.db")
+
+# Warm start (see warmup.py): at boot each server process loads the rooms that
+# are still active into its room cache on this many threads, skipping lobbies
+# idle for longer than WARMUP_LOBBY_IDLE seconds, before it reports ready
+WARMUP_ENABLED = os.environ.get("IMPOSTER_WARMUP", "1") not in ("0", "false", "no", "off")
+WARMUP_THREADS = int(os.environ.get("IMPOSTER_WARMUP_THREADS", "8"))
+WARMUP_LOBBY_IDLE = float(os.environ.get("IMPOSTER_WARMUP_LOBBY_IDLE", "600"))
+
+# Metrics: IMPOSTER_METRICS=0 turns all instrumentation off. Prometheus text is
+# served on 127.0.0.1:METRICS_PORT (0 disables) and/or written to METRICS_FILE.
+METRICS_ENABLED = os.environ.get("IMPOSTER_METRICS", "1") not in ("0", "false", "no", "off")
+METRICS_PORT = int(os.environ.get("IMPOSTER_METRICS_PORT", "9464"))
+METRICS_FILE = os.environ.get("IMPOSTER_METRICS_FILE", "")
+METRICS_FILE_INTERVAL = float(os.environ.get("IMPOSTER_METRICS_FILE_INTERVAL", "15"))
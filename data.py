@@ -1,79 +1,137 @@
 """
-Game data containing domains and items
+Game data containing domains and items, loaded from content packs.
+
+A content pack is a file in config.PACKS_DIR, either JSON
+({"name": ..., "domains": {domain: [item, ...]}}) or CSV with a
+"domain,item" header. Only the packs named in config.CONTENT_PACKS are
+read, on first use, and each is validated once.
 """
+import csv
+import json
+import os
+import random
+import threading
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import config
+
+# Every domain needs enough items for the imposter's 4-way guess
+MIN_ITEMS_PER_DOMAIN = 4
+
+
+class PackError(ValueError):
+    """Raised when a content pack is missing or malformed"""
+
+
+class Domain:
+    """Immutable item array of one domain, with an item -> index map"""
+
+    __slots__ = ('name', 'items', 'index')
+
+    def __init__(self, name: str, items: Sequence[str]):
+        self.name = name
+        self.items: Tuple[str, ...] = tuple(items)
+        self.index: Mapping[str, int] = MappingProxyType({item: i for i, item in enumerate(self.items)})
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, item: str) -> bool:
+        return item in self.index
+
+    def sample_distractors(self, exclude: str, k: int, rng: random.Random = random) -> List[str]:
+        """Pick k distinct items other than exclude, in O(k)"""
+        skip = self.index.get(exclude)
+        if skip is None:
+            return [self.items[i] for i in rng.sample(range(len(self.items)), k)]
+        # Sample from the array with the excluded slot cut out, then shift past it
+        picks = rng.sample(range(len(self.items) - 1), k)
+        return [self.items[i + 1 if i >= skip else i] for i in picks]
+
+
+def _read_pack(path: str) -> Dict[str, List[str]]:
+    if path.endswith('.csv'):
+        domains: Dict[str, List[str]] = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            if not reader.fieldnames or not {'domain', 'item'} <= set(reader.fieldnames):
+                raise PackError(f"{path}: CSV packs need a 'domain,item' header")
+            for row in reader:
+                domains.setdefault(row['domain'], []).append(row['item'])
+        return domains
+    with open(path, encoding='utf-8') as f:
+        try:
+            pack = json.load(f)
+        except ValueError as e:
+            raise PackError(f"{path}: {e}") from None
+    if not isinstance(pack, dict) or not isinstance(pack.get('domains'), dict):
+        raise PackError(f"{path}: JSON packs need a 'domains' object")
+    return pack['domains']
+
+
+def _validate(path: str, domains: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Clean up a pack's items and check every domain can be played"""
+    valid = {}
+    for name, items in domains.items():
+        if not isinstance(name, str) or not name.strip():
+            raise PackError(f"{path}: domain names must be non-empty strings")
+        if not isinstance(items, list) or not all(isinstance(i, str) for i in items):
+            raise PackError(f"{path}: items of {name!r} must be a list of strings")
+        # Drop blanks and duplicates, keeping the pack's order
+        cleaned = list(dict.fromkeys(i.strip() for i in items if i.strip()))
+        if len(cleaned) < MIN_ITEMS_PER_DOMAIN:
+            raise PackError(f"{path}: {name!r} has {len(cleaned)} items, needs at least {MIN_ITEMS_PER_DOMAIN}")
+        valid[name.strip()] = cleaned
+    return valid
+
+
+def _find_pack(name: str, packs_dir: str) -> str:
+    for extension in ('.json', '.csv'):
+        path = os.path.join(packs_dir, name + extension)
+        if os.path.exists(path):
+            return path
+    raise PackError(f"Content pack {name!r} not found in {packs_dir}")
+
+
+def load_packs(names: Sequence[str], packs_dir: str = config.PACKS_DIR) -> Dict[str, Domain]:
+    """Read and validate the named packs, merging domains that appear in several"""
+    merged: Dict[str, List[str]] = {}
+    for name in names:
+        path = _find_pack(name, packs_dir)
+        for domain, items in _validate(path, _read_pack(path)).items():
+            merged.setdefault(domain, []).extend(items)
+    return {name: Domain(name, dict.fromkeys(items)) for name, items in merged.items()}
+
+
+_catalog: Optional[Dict[str, Domain]] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> Dict[str, Domain]:
+    """The domains of the selected packs, loaded on first use"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = load_packs(config.CONTENT_PACKS)
+    return _catalog
+
+
+def get_domain(domain: str) -> Optional[Domain]:
+    return get_catalog().get(domain)
+
+
+def get_items_for_domain(domain: str) -> Sequence[str]:
+    """Get the items for a given domain"""
+    found = get_catalog().get(domain)
+    return found.items if found else ()
+
 
-DOMAINS = [
-    "Clothes / الملابس",
-    "Food / الطعام",
-    "Animals / الحيوانات",
-    "Sports / الرياضة",
-    "Jobs / المهن",
-    "Places / الأماكن"
-]
-
-ITEMS = {
-    "Clothes / الملابس": [
-        "Thobe / ثوب",
-        "Abaya / عباية",
-        "Ghutrah / غترة",
-        "Bisht / بشت",
-        "Sandals / نعال",
-        "Tarha / طرحة",
-        "Belt / حزام",
-        "Ring / خاتم"
-    ],
-    "Food / الطعام": [
-        "Kabsa / كبسة",
-        "Shawarma / شاورما",
-        "Hummus / حمص",
-        "Falafel / فلافل",
-        "Dates / تمر",
-        "Kunafa / كنافة",
-        "Coffee / قهوة",
-        "Tea / شاي"
-    ],
-    "Animals / الحيوانات": [
-        "Camel / جمل",
-        "Horse / حصان",
-        "Falcon / صقر",
-        "Lion / أسد",
-        "Cat / قط",
-        "Dog / كلب",
-        "Fish / سمك",
-        "Bird / طير"
-    ],
-    "Sports / الرياضة": [
-        "Football / كرة قدم",
-        "Basketball / كرة سلة",
-        "Swimming / سباحة",
-        "Running / جري",
-        "Tennis / تنس",
-        "Volleyball / كرة طائرة",
-        "Boxing / ملاكمة",
-        "Cycling / ركوب الدراجات"
-    ],
-    "Jobs / المهن": [
-        "Teacher / معلم",
-        "Doctor / طبيب",
-        "Engineer / مهندس",
-        "Pilot / طيار",
-        "Chef / طباخ",
-        "Driver / سائق",
-        "Police / شرطي",
-        "Nurse / ممرض"
-    ],
-    "Places / الأماكن": [
-        "Mosque / مسجد",
-        "Mall / مول",
-        "Beach / شاطئ",
-        "Desert / صحراء",
-        "Mountain / جبل",
-        "School / مدرسة",
-        "Hospital / مستشفى",
-        "Park / حديقة"
-    ]
-}
-
-def get_items_for_domain(domain: str) -> list:
-    """Get the list of items for a given domain"""
-    return ITEMS.get(domain, [])
+def __getattr__(name: str):
+    # DOMAINS and ITEMS are built from the packs the first time they are used
+    if name == 'DOMAINS':
+        return list(get_catalog())
+    if name == 'ITEMS':
+        return {domain.name: list(domain.items) for domain in get_catalog().values()}
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
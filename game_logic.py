@@ -1,19 +1,61 @@
 from dataclasses import dataclass
 import random
 import time
-from typing import List, Dict, Optional
+import uuid
+from typing import List, Dict, Optional, Set
 
-@dataclass
+import codec
+
+# Layout version of the room documents written by Game.to_dict. Documents
+# without a "schema" key are version 1, from before players carried their vote.
+SCHEMA_VERSION = 2
+
+# State the _on_ handlers report changing, named as in to_dict; votes are
+# covered by the players, who carry their vote
+TRACKED_FIELDS = ('phase', 'min_players', 'current_domain', 'current_item', 'imposter', 'imposter_guess',
+                  'discussion_end_time', 'voting_end_time', 'players', 'applied_keys')
+APPLIED_KEYS_KEPT = 32  # idempotency keys remembered per room
+
+# Points for the imposter guessing the item, and for each vote that found the imposter
+IMPOSTER_GUESS_POINTS = 100
+CORRECT_VOTE_POINTS = 100
+
+@dataclass(slots=True)
 class Player:
     name: str
     is_host: bool = False
     score: int = 0
     vote: Optional[str] = None
 
+    def to_dict(self) -> Dict:
+        return {'name': self.name, 'is_host': self.is_host, 'score': self.score, 'vote': self.vote}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Player':
+        return cls(data['name'], data.get('is_host', False), data.get('score', 0), data.get('vote'))
+
+    def to_bytes(self) -> bytes:
+        return codec.pack_player(self.to_dict())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Player':
+        return cls.from_dict(codec.unpack_player(data))
+
+def migrate_room_dict(data: Dict) -> Dict:
+    """Bring a stored room document up to SCHEMA_VERSION"""
+    if data.get('schema', 1) < 2:
+        votes = data.get('votes') or {}
+        data = dict(data, schema=2, players=[dict(p, vote=votes.get(p['name'])) for p in data['players']])
+        data.setdefault('imposter_guess', None)
+    return data
+
 class Game:
     def __init__(self, room_code: str):
         self.room_code = room_code
+        self.incarnation: Optional[str] = uuid.uuid4().hex  # tells a reused room code from the room it replaced
         self.players: List[Player] = []
+        self._players_by_name: Dict[str, Player] = {}
+        self.host: Optional[Player] = None
         self.phase = "lobby"
         self.min_players = 3
         self.current_domain = None
@@ -21,43 +63,182 @@ class Game:
         self.imposter = None
         self.discussion_duration = 120  # seconds
         self.discussion_end_time = None
+        self.voting_duration = 60  # seconds before voting closes with the votes cast so far
+        self.voting_end_time = None
         self.votes: Dict[str, str] = {}  # voter_name -> voted_for_name
+        self._voters_for: Dict[str, Set[str]] = {}  # voted_for_name -> voter names, kept in step with votes
         self.most_voted_player = None
         self.imposter_guess = None
+        self.version = 0  # bumped on every save of the room
+        self.phase_started_at = None  # when the room entered its current phase
+        self.events: List[Dict] = []  # mutations since the room was loaded, for the event log
+        self.dirty: Set[str] = set()  # TRACKED_FIELDS changed since the room was loaded
+        self._changed: Set[str] = set()  # TRACKED_FIELDS changed by the mutation being run
+        self.applied_keys: List[str] = []  # idempotency keys of recent updates, oldest first
+        self._ranking: Optional[List[Player]] = None  # players by score, rebuilt after the next mutation
+        self.projections: Dict[object, object] = {}  # per-role and per-voter views of this state (see views.py), dropped on mutation
+
+    def _apply(self, op: str, **args) -> None:
+        """Apply a mutation and record it as an event.
+
+        Anything random or time-dependent is resolved by the caller and passed
+        in args, so replaying the event later gives the same state.
+        """
+        at = time.time()
+        changed = self._run(op, args, at)
+        if not changed:
+            return  # a no-op leaves nothing to save or log
+        self.dirty |= changed
+        self.events.append({'op': op, 'at': at, **args})
+
+    def _set(self, **fields) -> None:
+        """Assign state fields, recording the ones whose value changes"""
+        for name, value in fields.items():
+            if getattr(self, name) != value:
+                setattr(self, name, value)
+                self._changed.add(name)
+
+    def mark_saved(self) -> None:
+        """Forget the changes recorded so far, once they are in the store"""
+        self.events.clear()
+        self.dirty.clear()
+
+    def mark_applied(self, key: str) -> None:
+        """Remember an idempotency key, so the update it names is not applied again"""
+        if key not in self.applied_keys:
+            self._apply('mark_applied', key=key)
+
+    def _on_mark_applied(self, key: str) -> None:
+        self.applied_keys.append(key)
+        self._changed.add('applied_keys')
+        del self.applied_keys[:-APPLIED_KEYS_KEPT]
+
+    def was_applied(self, key: str) -> bool:
+        return key in self.applied_keys
+
+    def apply_event(self, event: Dict) -> None:
+        """Replay an event recorded by _apply, without recording it again"""
+        args = dict(event)
+        op = args.pop('op')
+        self._run(op, args, args.pop('at', None))
+
+    def _run(self, op: str, args: Dict, at: Optional[float]) -> Set[str]:
+        """Run an op's handler; returns the TRACKED_FIELDS it changed, as the handler reports them"""
+        self._changed = set()
+        self._ranking = None
+        self.projections = {}
+        getattr(self, f'_on_{op}')(**args)
+        if 'phase' in self._changed:
+            self.phase_started_at = at
+        return self._changed
 
     def add_player(self, player: Player) -> None:
-        if not any(p.name == player.name for p in self.players):
-            self.players.append(player)
+        if player.name not in self._players_by_name:
+            self._apply('add_player', name=player.name, is_host=player.is_host, score=player.score)
+
+    def _on_add_player(self, name: str, is_host: bool, score: int) -> None:
+        if name in self._players_by_name:
+            return
+        player = Player(name, is_host, score)
+        self.players.append(player)
+        self._players_by_name[name] = player
+        if is_host and self.host is None:
+            self.host = player
+        self._changed.add('players')
+
+    def get_player(self, player_name: str) -> Optional[Player]:
+        return self._players_by_name.get(player_name)
 
     def is_player_host(self, player_name: str) -> bool:
-        return any(p.name == player_name and p.is_host for p in self.players)
+        player = self._players_by_name.get(player_name)
+        return player is not None and player.is_host
+
+    def set_min_players(self, min_players: int) -> None:
+        self._apply('set_min_players', min_players=min_players)
+
+    def _on_set_min_players(self, min_players: int) -> None:
+        self._set(min_players=min_players)
 
     def start_round(self) -> None:
+        self._apply('start_round')
+
+    def _on_start_round(self) -> None:
         if len(self.players) >= self.min_players:
-            self.phase = "round_setup"
+            self._set(phase="round_setup")
 
     def set_domain(self, domain: str) -> None:
-        self.current_domain = domain
+        self._apply('set_domain', domain=domain)
+
+    def _on_set_domain(self, domain: str) -> None:
+        self._set(current_domain=domain)
 
     def select_item(self) -> None:
-        from data import get_items_for_domain
-        items = get_items_for_domain(self.current_domain)
-        self.current_item = random.choice(items)
-        self.imposter = random.choice(self.players)
+        from data import get_domain
+        items = get_domain(self.current_domain).items
+        self._apply('select_item', item=random.choice(items), imposter=random.choice(self.players).name)
+
+    def _on_select_item(self, item: str, imposter: str) -> None:
+        self._set(current_item=item, imposter=self._players_by_name[imposter])
 
     def is_player_imposter(self, player_name: str) -> bool:
         return self.imposter and self.imposter.name == player_name
 
     def start_discussion(self) -> None:
-        self.phase = "discussion"
-        self.discussion_end_time = time.time() + self.discussion_duration
+        self._apply('start_discussion', end_time=time.time() + self.discussion_duration)
+
+    def _on_start_discussion(self, end_time: float) -> None:
+        self._set(phase="discussion", discussion_end_time=end_time)
 
     def start_voting(self) -> None:
-        self.phase = "voting"
-        self.votes.clear()
+        self._apply('start_voting', end_time=time.time() + self.voting_duration)
+
+    def _on_start_voting(self, end_time: Optional[float] = None) -> None:
+        self._set(phase="voting", voting_end_time=end_time)
+        self._clear_votes()
 
     def submit_vote(self, voter_name: str, voted_for: str) -> None:
+        self._apply('submit_vote', voter_name=voter_name, voted_for=voted_for)
+
+    def _on_submit_vote(self, voter_name: str, voted_for: str) -> None:
+        previous = self.votes.get(voter_name)
+        if previous == voted_for:
+            return
         self.votes[voter_name] = voted_for
+        if previous is not None:
+            self._voters_for[previous].discard(voter_name)
+        self._voters_for.setdefault(voted_for, set()).add(voter_name)
+        voter = self._players_by_name.get(voter_name)
+        if voter is not None:
+            voter.vote = voted_for
+            self._changed.add('players')
+
+        # Keep the leader up to date; only a changed vote that costs the leader
+        # a vote needs to look at the other candidates again
+        if self.most_voted_player is None or self.vote_count(voted_for) > self.vote_count(self.most_voted_player):
+            self.most_voted_player = voted_for
+        elif previous == self.most_voted_player:
+            self.most_voted_player = max(self._voters_for, key=self.vote_count)
+
+    def restore_votes(self, votes: Dict[str, str]) -> None:
+        """Load stored votes, rebuilding the tallies"""
+        self._clear_votes()
+        for voter_name, voted_for in votes.items():
+            self._on_submit_vote(voter_name, voted_for)
+
+    def _clear_votes(self) -> None:
+        if self.votes:
+            self._changed.add('players')
+        self.votes.clear()
+        self._voters_for.clear()
+        self.most_voted_player = None
+        for player in self.players:
+            player.vote = None
+
+    def vote_count(self, player_name: str) -> int:
+        return len(self._voters_for.get(player_name, ()))
+
+    def vote_tally(self) -> Dict[str, int]:
+        return {name: len(voters) for name, voters in self._voters_for.items() if voters}
 
     def has_player_voted(self, player_name: str) -> bool:
         return player_name in self.votes
@@ -66,55 +247,143 @@ class Game:
         return len(self.votes) == len(self.players)
 
     def reveal_imposter(self) -> None:
-        self.phase = "reveal"
-        # Set most_voted_player to None since we're not using group voting
-        self.most_voted_player = None
+        self._apply('reveal_imposter')
+
+    def _on_reveal_imposter(self) -> None:
+        self._set(phase="reveal")
 
     def did_player_vote_correctly(self, player_name: str) -> bool:
         return (player_name in self.votes and 
                 self.votes[player_name] == self.imposter.name)
 
+    def correct_voters(self) -> Set[str]:
+        return self._voters_for.get(self.imposter.name, set()) if self.imposter else set()
+
     def start_imposter_guess(self) -> None:
-        self.phase = "imposter_guess"
+        self._apply('start_imposter_guess')
 
-    def get_guess_options(self) -> List[str]:
-        from data import get_items_for_domain
-        items = get_items_for_domain(self.current_domain)
-        options = random.sample([i for i in items if i != self.current_item], 3)
+    def _on_start_imposter_guess(self) -> None:
+        self._set(phase="imposter_guess")
+
+    def get_guess_options(self, rng: random.Random = random) -> List[str]:
+        from data import get_domain
+        options = get_domain(self.current_domain).sample_distractors(self.current_item, 3, rng)
         options.append(self.current_item)
-        random.shuffle(options)
+        rng.shuffle(options)
         return options
 
     def submit_imposter_guess(self, guess: str) -> None:
-        self.imposter_guess = guess
+        self._apply('submit_imposter_guess', guess=guess)
+
+    def _on_submit_imposter_guess(self, guess: str) -> None:
+        self._set(imposter_guess=guess)
         # Award points
         if guess == self.current_item:
-            self.imposter.score += 100
+            self.imposter.score += IMPOSTER_GUESS_POINTS
+            self._changed.add('players')
         # Award points to correct voters
-        for player in self.players:
-            if self.did_player_vote_correctly(player.name):
-                player.score += 100
-        self.show_scores()
+        for voter_name in self.correct_voters():
+            voter = self._players_by_name.get(voter_name)
+            if voter is not None:
+                voter.score += CORRECT_VOTE_POINTS
+                self._changed.add('players')
+        self._on_show_scores()
 
     def show_scores(self) -> None:
-        self.phase = "scores"
+        self._apply('show_scores')
+
+    def _on_show_scores(self) -> None:
+        self._set(phase="scores")
 
     def get_scores(self) -> Dict[str, int]:
         return {player.name: player.score for player in self.players}
 
+    def phase_deadline(self) -> Optional[float]:
+        """When the current phase times out, if it has a time limit"""
+        if self.phase == "discussion":
+            return self.discussion_end_time
+        if self.phase == "voting":
+            return self.voting_end_time
+        return None
+
+    def to_dict(self) -> Dict:
+        """Plain dict of the whole room state, for storage"""
+        return {
+            'schema': SCHEMA_VERSION,
+            'room_code': self.room_code,
+            'version': self.version,
+            'phase': self.phase,
+            'players': [player.to_dict() for player in self.players],
+            'min_players': self.min_players,
+            'current_domain': self.current_domain,
+            'current_item': self.current_item,
+            'imposter': self.imposter.name if self.imposter else None,
+            'discussion_duration': self.discussion_duration,
+            'discussion_end_time': self.discussion_end_time,
+            'voting_duration': self.voting_duration,
+            'voting_end_time': self.voting_end_time,
+            'votes': dict(self.votes),
+            'most_voted_player': self.most_voted_player,
+            'imposter_guess': self.imposter_guess,
+            'phase_started_at': self.phase_started_at,
+            'applied_keys': list(self.applied_keys),
+            'incarnation': self.incarnation,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Game':
+        """Rebuild a room from to_dict output, migrating older documents"""
+        data = migrate_room_dict(data)
+        game = cls(data['room_code'])
+        game.version = data.get('version', 0)
+        game.phase = data['phase']
+        for p_data in data['players']:
+            game._on_add_player(p_data['name'], p_data['is_host'], p_data['score'])
+        game.min_players = data['min_players']
+        game.current_domain = data.get('current_domain')
+        game.current_item = data.get('current_item')
+        if data.get('imposter'):
+            game.imposter = game.get_player(data['imposter'])
+        game.imposter_guess = data.get('imposter_guess')
+        if data.get('discussion_duration') is not None:
+            game.discussion_duration = data['discussion_duration']
+        if data.get('voting_duration') is not None:
+            game.voting_duration = data['voting_duration']
+        game.discussion_end_time = data.get('discussion_end_time')
+        game.voting_end_time = data.get('voting_end_time')
+        game.phase_started_at = data.get('phase_started_at')
+        game.applied_keys = list(data.get('applied_keys') or [])
+        game.incarnation = data.get('incarnation')  # None for rooms created before incarnations
+        votes = {p['name']: p['vote'] for p in data['players'] if p.get('vote') is not None}
+        votes.update(data.get('votes') or {})
+        game.restore_votes(votes)
+        return game
+
+    def to_bytes(self) -> bytes:
+        """Compact encoding with a header carrying the room version and phase (see codec)"""
+        return codec.encode(self.to_dict())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Game':
+        """Decode to_bytes output, or a room stored as JSON by older versions"""
+        return cls.from_dict(codec.decode(data))
+
+    def ranked_players(self) -> List[Player]:
+        """Players by score, highest first, sorted once per state of the room"""
+        if self._ranking is None:
+            self._ranking = sorted(self.players, key=lambda p: p.score, reverse=True)
+        return self._ranking
+
     def reset_round(self) -> None:
-        self.phase = "round_setup"
-        self.current_item = None
-        self.imposter = None
-        self.votes.clear()
-        self.most_voted_player = None
-        self.imposter_guess = None
+        self._apply('reset_round')
+
+    def _on_reset_round(self) -> None:
+        self._set(phase="round_setup", current_item=None, imposter=None, imposter_guess=None)
+        self._clear_votes()
 
     def reset_game(self) -> None:
-        self.phase = "lobby"
-        self.current_domain = None
-        self.current_item = None
-        self.imposter = None
-        self.votes.clear()
-        self.most_voted_player = None
-        self.imposter_guess = None
+        self._apply('reset_game')
+
+    def _on_reset_game(self) -> None:
+        self._set(phase="lobby", current_domain=None, current_item=None, imposter=None, imposter_guess=None)
+        self._clear_votes()
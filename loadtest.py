@@ -0,0 +1,242 @@
+"""
+Concurrent-client load generator for the polling and sync path.
+
+Simulates many browser sessions spread over many rooms. Every client polls
+its room the way a rerun does (load_cached_game_state, or load_game_state
+with --no-cache), hosts drive their rooms through whole rounds, and every
+client votes and the imposter guesses as soon as their poll shows the
+phase, which gives the real mix of mostly reads plus write bursts.
+
+Writes go through update_game_state; --unsafe uses the old
+load_game_state + save_game_state pattern instead, to show lost updates.
+A lost update is a vote that a client saw committed but that is missing
+from a later version of the room.
+
+    python loadtest.py --clients 2000 --rooms 200 --duration 30
+    python loadtest.py --store sqlite --clients 500 --rooms 50 --unsafe
+"""
+import argparse
+import heapq
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import storage
+from data import get_catalog
+from game_logic import Game, Player
+from rooms import RoomCodeAllocator
+from simulator import LatencyRecorder, open_store
+
+
+def open_fds() -> Optional[int]:
+    """Open file descriptors of this process, where /proc is available"""
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+class LoadTest:
+    def __init__(self, clients: int, rooms: int, poll_interval: float, discussion_seconds: float,
+                 cached: bool = True, unsafe: bool = False):
+        self.poll_interval = poll_interval
+        self.discussion_seconds = discussion_seconds
+        self.cached = cached
+        self.unsafe = unsafe
+        self.recorder = LatencyRecorder()
+        self._lock = threading.Lock()
+        self.counts = {'reads': 0, 'writes': 0, 'lost_updates': 0, 'conflicts': 0, 'rounds': 0}
+        self.fd_samples: List[int] = []
+        self.domains = list(get_catalog())
+
+        allocator = RoomCodeAllocator(storage.get_store())
+        per_room = max(2, clients // rooms)
+        self.clients = []
+        for r in range(rooms):
+            names = [f'p{r}_{i}' for i in range(per_room)]
+
+            def new_room(room_code, host=names[0], players=per_room):
+                game = Game(room_code)
+                game.add_player(Player(host, is_host=True))
+                game.set_min_players(min(game.min_players, players))
+                return game
+
+            room_code = allocator.allocate(new_room).room_code
+            room = {'code': room_code, 'discussion_started': 0.0}
+            for i, name in enumerate(names):
+                if i:
+                    self.write(room_code, lambda g, name=name: g.add_player(Player(name)))
+                self.clients.append({'name': name, 'room': room, 'is_host': i == 0, 'vote_version': None})
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += n
+
+    def read(self, room_code: str) -> Optional[Game]:
+        start = time.perf_counter()
+        if self.cached:
+            game = storage.load_cached_game_state(room_code)
+        else:
+            game = storage.load_game_state(room_code)
+        self.recorder.record('read', time.perf_counter() - start)
+        self.count('reads')
+        return game
+
+    def write(self, room_code: str, mutate: Callable[[Game], Optional[bool]]) -> Optional[Game]:
+        start = time.perf_counter()
+        try:
+            if self.unsafe:
+                game = storage.load_game_state(room_code)
+                if game is not None and mutate(game) is not False:
+                    storage.save_game_state(game)
+            else:
+                game = storage.update_game_state(room_code, mutate)
+        except storage.ConflictError:
+            self.count('conflicts')
+            return None
+        finally:
+            self.recorder.record('write', time.perf_counter() - start)
+        self.count('writes')
+        return game
+
+    def in_phase(self, phase: str, action: Callable[[Game], None]) -> Callable[[Game], Optional[bool]]:
+        def mutate(game):
+            if game.phase != phase:
+                return False
+            action(game)
+        return mutate
+
+    def drive(self, client: Dict, game: Game) -> None:
+        """What the host's rerun does in each phase"""
+        room = client['room']
+        code = room['code']
+        if game.phase == "lobby":
+            self.write(code, self.in_phase("lobby", lambda g: g.start_round()))
+        elif game.phase == "round_setup":
+            domain = random.choice(self.domains)
+
+            def start_with_domain(g):
+                g.set_domain(domain)
+                g.select_item()
+                g.start_discussion()
+            self.write(code, self.in_phase("round_setup", start_with_domain))
+            room['discussion_started'] = time.time()
+        elif game.phase == "discussion":
+            if time.time() - room['discussion_started'] >= self.discussion_seconds:
+                self.write(code, self.in_phase("discussion", lambda g: g.start_voting()))
+        elif game.phase == "voting":
+            if game.all_votes_submitted():
+                self.write(code, self.in_phase("voting", lambda g: g.reveal_imposter()))
+        elif game.phase == "reveal":
+            self.write(code, self.in_phase("reveal", lambda g: g.start_imposter_guess()))
+        elif game.phase == "scores":
+            if self.write(code, self.in_phase("scores", lambda g: g.reset_round())) is not None:
+                self.count('rounds')
+
+    def tick(self, client: Dict) -> None:
+        """One poll of one client, and whatever its rerun would write"""
+        code = client['room']['code']
+        name = client['name']
+        game = self.read(code)
+        if game is None:
+            return
+        if client['is_host']:
+            self.drive(client, game)
+
+        if game.phase == "voting":
+            committed = client['vote_version']
+            if committed is not None and game.version >= committed and not game.has_player_voted(name):
+                # We saw our vote committed, and a newer version of the room lost it
+                self.count('lost_updates')
+                client['vote_version'] = None
+            if not game.has_player_voted(name) and client['vote_version'] is None:
+                others = [p.name for p in game.players if p.name != name]
+                voted_for = random.choice(others)
+                updated = self.write(code, self.in_phase("voting", lambda g: g.submit_vote(name, voted_for)))
+                if updated is not None:
+                    client['vote_version'] = updated.version
+        else:
+            client['vote_version'] = None
+
+        if game.phase == "imposter_guess" and game.is_player_imposter(name):
+            guess = random.choice(game.get_guess_options())
+            self.write(code, self.in_phase("imposter_guess", lambda g: g.submit_imposter_guess(guess)))
+
+    def worker(self, clients: List[Dict], deadline: float) -> None:
+        # Each worker owns a slice of the clients and runs their polls in time order
+        now = time.time()
+        queue = [(now + random.uniform(0, self.poll_interval), i) for i in range(len(clients))]
+        heapq.heapify(queue)
+        while queue:
+            due, i = heapq.heappop(queue)
+            if due >= deadline:
+                break
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.tick(clients[i])
+            heapq.heappush(queue, (due + self.poll_interval, i))
+
+    def run(self, duration: float, threads: int) -> Dict:
+        deadline = time.time() + duration
+        workers = [
+            threading.Thread(target=self.worker, args=(self.clients[i::threads], deadline), daemon=True)
+            for i in range(threads)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        while any(worker.is_alive() for worker in workers):
+            fds = open_fds()
+            if fds is not None:
+                self.fd_samples.append(fds)
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - start
+
+        return {
+            'seconds': elapsed,
+            'reads_per_second': self.counts['reads'] / elapsed,
+            'writes_per_second': self.counts['writes'] / elapsed,
+            'counts': dict(self.counts),
+            'max_open_fds': max(self.fd_samples, default=None),
+            'latency': self.recorder.summary(),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--store', choices=['json', 'binary', 'sqlite', 'eventlog', 'broker'], default='json')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--rooms', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=20, help="seconds to run")
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--poll-interval', type=float, default=2.0, help="seconds between a client's polls")
+    parser.add_argument('--discussion', type=float, default=2.0, help="seconds of discussion per round")
+    parser.add_argument('--no-cache', action='store_true', help="poll with load_game_state")
+    parser.add_argument('--unsafe', action='store_true', help="write with load + save instead of update")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        inner = open_store(args.store, directory)
+        storage.set_store(inner)
+        test = LoadTest(args.clients, args.rooms, args.poll_interval, args.discussion,
+                        cached=not args.no_cache, unsafe=args.unsafe)
+        report = test.run(args.duration, args.threads)
+        inner.close()
+        storage.set_store(None)
+
+    counts = report['counts']
+    print(f"{args.store}: {len(test.clients)} clients in {args.rooms} rooms for {report['seconds']:.1f}s")
+    print(f"  reads/s {report['reads_per_second']:.0f}   writes/s {report['writes_per_second']:.0f}   "
+          f"rounds {counts['rounds']}   max open fds {report['max_open_fds']}")
+    print(f"  lost updates {counts['lost_updates']}   conflicts {counts['conflicts']}")
+    for name, stats in sorted(report['latency'].items()):
+        print(f"  {name:<6} p50 {stats['p50'] * 1000:.3f}ms   p99 {stats['p99'] * 1000:.3f}ms   "
+              f"p99.9 {stats['p999'] * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Low-overhead counters and histograms, exposed in Prometheus text format.
+
+Metrics are served on http://127.0.0.1:<METRICS_PORT>/metrics and/or written
+to METRICS_FILE. With IMPOSTER_METRICS=0 every recording call returns
+immediately and nothing is served.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+ENABLED = config.METRICS_ENABLED
+
+# Latency buckets in seconds, from 50us to 10s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 90, 120, 180, 300, 600, 1800, 3600)
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}'] + self.samples()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f'{self.name}{_format_labels(self.labels, key)} {value}' for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *label_values) -> None:
+        if not ENABLED:
+            return
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][slot] += 1
+            entry[1] += value
+
+    def time(self, *label_values):
+        """Context manager observing the time spent inside it"""
+        if not ENABLED:
+            return nullcontext()
+        return self._timer(label_values)
+
+    @contextmanager
+    def _timer(self, label_values: Tuple):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_label = f'le="{le}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, bucket_label)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {cumulative}')
+        return lines
+
+
+class Gauge(Metric):
+    """A value read at scrape time from a callback returning {label values: value}"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], collect: Callable[[], Dict[Tuple, float]]):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labels, key)} {value}'
+                for key, value in sorted(self.collect().items())]
+
+
+REGISTRY: List[Metric] = []
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format"""
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/ready':
+            # Readiness probe: 503 until the process has warmed up (see warmup.py)
+            self.send_response(200 if READY.is_set() else 503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if path != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = config.METRICS_PORT, host: str = '127.0.0.1') -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on a daemon thread. Returns None if disabled or the port is taken."""
+    if not ENABLED or not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        # Another worker process on this host already serves the port
+        logger.warning("Metrics endpoint not started on port %d: %s", port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+def write_periodically(path: str = config.METRICS_FILE,
+                       interval: float = config.METRICS_FILE_INTERVAL) -> Optional[threading.Thread]:
+    """Rewrite the metrics file every interval seconds, for node-exporter style collection"""
+    if not ENABLED or not path:
+        return None
+
+    def run():
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        while True:
+            try:
+                with open(tmp_path, 'w') as f:
+                    f.write(render())
+                os.replace(tmp_path, path)
+            except Exception:
+                # A full disk or a removed directory; keep trying rather than let the file go stale silently
+                logger.exception("Metrics file %s not written", path)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='metrics-file', daemon=True)
+    thread.start()
+    return thread
+
+
+# Hot-path metrics shared by the storage layer and the app
+STORE_OPERATIONS = Histogram('imposter_store_operation_seconds',
+                             'Time spent in game state persistence calls', ['operation'])
+STORE_BYTES_WRITTEN = Counter('imposter_store_bytes_written_total',
+                              'Bytes of room state written to the store', ['store'])
+JSON_PARSE = Histogram('imposter_json_parse_seconds', 'Time spent parsing stored room JSON')
+CACHE_LOOKUPS = Counter('imposter_room_cache_lookups_total', 'Room cache lookups', ['result'])
+UPDATE_RETRIES = Counter('imposter_update_retries_total', 'Room updates retried after losing a race')
+GROUPED_UPDATES = Counter('imposter_grouped_updates_total', 'Room updates committed along with another update')
+PHASE_TRANSITIONS = Counter('imposter_phase_transitions_total', 'Room phase changes', ['from_phase', 'to_phase'])
+PHASE_DURATION = Histogram('imposter_phase_duration_seconds', 'Time rooms spent in a phase before leaving it',
+                           ['phase'], buckets=DURATION_BUCKETS)
+PHASE_TIMEOUTS = Counter('imposter_phase_timeouts_total', 'Phases ended by the server-side scheduler', ['phase'])
+RENDER = Histogram('imposter_render_seconds', 'Time to run one page rerun, by phase', ['phase'])
+WARMUP = Histogram('imposter_warmup_seconds', 'Time the boot warm-up took before the process reported ready',
+                   buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+FIRST_RERUN = Histogram('imposter_first_rerun_seconds', "Time to restore a reconnecting session's room")
+READY = threading.Event()
+Gauge('imposter_ready', 'Whether this process has warmed up and takes traffic', [],
+      lambda: {(): int(READY.is_set())})
+API_REQUESTS = Histogram('imposter_api_request_seconds', 'Time to answer one game API request',
+                         ['method', 'status'])
@@ -0,0 +1,55 @@
+"""
+In-process room change notifications, keyed by room code and version
+"""
+import threading
+from typing import Dict, Optional
+
+
+class RoomNotifier:
+    """Publishes the latest version of each room and lets callers block until it moves"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._conditions: Dict[str, threading.Condition] = {}
+
+    def _condition(self, room_code: str) -> threading.Condition:
+        cond = self._conditions.get(room_code)
+        if cond is None:
+            cond = self._conditions.setdefault(room_code, threading.Condition(self._lock))
+        return cond
+
+    def publish(self, room_code: str, version: int) -> None:
+        """Record a new room version and wake everyone waiting on the room"""
+        with self._lock:
+            if version <= self._versions.get(room_code, -1):
+                return
+            self._versions[room_code] = version
+            self._condition(room_code).notify_all()
+
+    def version(self, room_code: str) -> Optional[int]:
+        """Latest published version of a room, None if nothing was published yet"""
+        return self._versions.get(room_code)
+
+    def wait_for_change(self, room_code: str, known_version: int, timeout: float) -> Optional[int]:
+        """Long-poll: block until the room moves past known_version, or timeout.
+
+        Returns the new version, or None if nothing changed in time.
+        """
+        with self._lock:
+            cond = self._condition(room_code)
+            changed = cond.wait_for(
+                lambda: self._versions.get(room_code, known_version) > known_version, timeout
+            )
+            return self._versions[room_code] if changed else None
+
+    def forget(self, room_code: str) -> None:
+        """Drop a deleted room, waking any waiters so they can notice"""
+        with self._lock:
+            self._versions.pop(room_code, None)
+            cond = self._conditions.pop(room_code, None)
+            if cond is not None:
+                cond.notify_all()
+
+
+room_notifier = RoomNotifier()
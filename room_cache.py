@@ -0,0 +1,61 @@
+"""
+Process-wide cache of built Game objects, keyed by room code and store version
+"""
+import threading
+from collections import Counter
+from typing import Dict, Hashable, Optional, Tuple
+
+import metrics
+from game_logic import Game
+
+
+class RoomCache:
+    """Hands back an already-built Game while its room version is unchanged.
+
+    Cached games are shared by every session in the process, so callers
+    must treat them as read-only and mutate a freshly loaded copy.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[Hashable, Game]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, room_code: str, version: Hashable) -> Optional[Game]:
+        with self._lock:
+            entry = self._entries.get(room_code)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                metrics.CACHE_LOOKUPS.inc('hit')
+                return entry[1]
+            self.misses += 1
+            metrics.CACHE_LOOKUPS.inc('miss')
+            return None
+
+    def put(self, room_code: str, version: Hashable, game: Game) -> None:
+        with self._lock:
+            self._entries[room_code] = (version, game)
+
+    def invalidate(self, room_code: str) -> None:
+        with self._lock:
+            self._entries.pop(room_code, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def phase_counts(self) -> Dict[Tuple, int]:
+        """Number of cached rooms in each phase"""
+        with self._lock:
+            games = [game for _, game in self._entries.values()]
+        return {(phase,): count for phase, count in Counter(game.phase for game in games).items()}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+room_cache = RoomCache()
+
+metrics.Gauge('imposter_active_rooms', "Rooms in this process's room cache, by phase", ['phase'],
+              room_cache.phase_counts)
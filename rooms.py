@@ -0,0 +1,92 @@
+"""
+Room code allocation
+"""
+import random
+import string
+import threading
+from typing import Callable, Iterable, Optional, Set
+
+import config
+import storage
+from game_logic import Game
+
+
+class RoomCodeAllocator:
+    """Hands out room codes that are not in use, backed by an index of active codes.
+
+    The index makes availability checks O(1); the store's atomic create is
+    what actually claims a code, so several server processes can allocate at
+    the same time without taking over each other's rooms.
+    """
+
+    ALPHABET = string.ascii_uppercase
+
+    def __init__(self, store: storage.RoomStore,
+                 length: int = config.ROOM_CODE_LENGTH,
+                 max_length: int = config.ROOM_CODE_MAX_LENGTH,
+                 grow_occupancy: float = config.ROOM_CODE_GROW_OCCUPANCY):
+        self.store = store
+        self.length = length
+        self.max_length = max_length
+        self.grow_occupancy = grow_occupancy
+        self._lock = threading.Lock()
+        self._active: Optional[Set[str]] = None
+
+    def _index(self) -> Set[str]:
+        if self._active is None:
+            self._active = set(self.store.room_codes())
+        return self._active
+
+    def is_available(self, room_code: str) -> bool:
+        with self._lock:
+            return room_code not in self._index()
+
+    def code_length(self) -> int:
+        """Shortest code length whose occupancy is still under the threshold"""
+        with self._lock:
+            active = len(self._index())
+        length = self.length
+        while length < self.max_length and active > self.grow_occupancy * len(self.ALPHABET) ** length:
+            length += 1
+        return length
+
+    def allocate(self, build: Callable[[str], Game], attempts: int = 100) -> Game:
+        """Build a game for a free code and claim the code by creating the room"""
+        for _ in range(attempts):
+            room_code = ''.join(random.choices(self.ALPHABET, k=self.code_length()))
+            if not self.is_available(room_code):
+                continue
+            game = build(room_code)
+            created = storage.create_game_state(game)
+            with self._lock:
+                # Taken either way: by us, or by another process we didn't know about
+                self._index().add(room_code)
+            if created:
+                return game
+        raise RuntimeError(f"No free room code found after {attempts} attempts")
+
+    def release(self, room_code: str) -> None:
+        """Delete a room and return its code to the pool"""
+        storage.delete_game_state(room_code)
+        self.return_codes([room_code])
+
+    def return_codes(self, room_codes: Iterable[str]) -> None:
+        """Return the codes of rooms that were already deleted to the pool"""
+        with self._lock:
+            self._index().difference_update(room_codes)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index())
+
+
+_allocator: Optional[RoomCodeAllocator] = None
+
+
+def get_allocator() -> RoomCodeAllocator:
+    """Get the process-wide allocator for the current room store"""
+    global _allocator
+    store = storage.get_store()
+    if _allocator is None or _allocator.store is not store:
+        _allocator = RoomCodeAllocator(store)
+    return _allocator
@@ -0,0 +1,192 @@
+"""
+Server-side phase deadlines for every room, fired by a single timer thread
+
+    python scheduler.py    # run the scheduler on its own, e.g. next to several app workers
+"""
+import argparse
+import heapq
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+import storage
+from game_logic import Game
+
+logger = logging.getLogger(__name__)
+
+# What a room does when its phase runs out of time
+TIMEOUT_TRANSITIONS: Dict[str, Callable[[Game], None]] = {
+    "discussion": Game.start_voting,
+    "voting": Game.reveal_imposter,
+}
+
+# How long to wait before retrying a transition that lost to a busy room
+RETRY_DELAY = 1.0
+# How often a standalone scheduler rescans the store for rooms written by other processes
+RESCAN_INTERVAL = 5.0
+
+
+class PhaseScheduler:
+    """Min-heap of phase deadlines across all rooms.
+
+    Rooms are scheduled from every state the storage layer commits or loads,
+    so no client has to poll the clock. A deadline fires through
+    update_game_state with a phase guard, which makes the transition happen
+    exactly once even when several processes run a scheduler for the same room.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str, str]] = []  # (deadline, room code, phase)
+        self._pending: Dict[str, Tuple[str, float]] = {}  # room code -> live (phase, deadline)
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.fired = 0
+
+    def schedule(self, game: Game) -> None:
+        """Track the deadline of the room's current phase, replacing any older one"""
+        deadline = game.phase_deadline() if game.phase in TIMEOUT_TRANSITIONS else None
+        with self._cond:
+            if deadline is None:
+                self._pending.pop(game.room_code, None)
+                return
+            entry = (game.phase, deadline)
+            if self._pending.get(game.room_code) == entry:
+                return
+            self._pending[game.room_code] = entry
+            heapq.heappush(self._heap, (deadline, game.room_code, game.phase))
+            if self._heap[0][1] == game.room_code:
+                # New earliest deadline: wake the timer thread to shorten its wait
+                self._cond.notify()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _next_due(self) -> Optional[Tuple[float, str, str]]:
+        """Block until a live deadline is due, or return None once stopped"""
+        with self._cond:
+            while not self._stopping:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                deadline, room_code, phase = self._heap[0]
+                if self._pending.get(room_code) != (phase, deadline):
+                    heapq.heappop(self._heap)  # superseded by a newer phase or deadline
+                    continue
+                delay = deadline - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                del self._pending[room_code]
+                return deadline, room_code, phase
+            return None
+
+    def fire(self, room_code: str, phase: str) -> Optional[Game]:
+        """Apply the timeout transition if the room is still in that phase and past its deadline"""
+        applied = False
+
+        def mutate(game):
+            nonlocal applied
+            current = game.phase_deadline()
+            applied = game.phase == phase and current is not None and current <= time.time()
+            if not applied:
+                return False
+            TIMEOUT_TRANSITIONS[phase](game)
+
+        game = storage.update_game_state(room_code, mutate)
+        if applied:
+            self.fired += 1
+            metrics.PHASE_TIMEOUTS.inc(phase)
+        return game
+
+    def schedule_existing(self) -> int:
+        """Pick up deadlines of rooms already in the store, e.g. after a restart"""
+        store = storage.get_store()
+        for room_code in store.room_codes():
+            try:
+                # Most rooms have no running timer; the header is enough to skip them
+                header = storage.peek_game_state(room_code)
+                if header is None or header.phase not in TIMEOUT_TRANSITIONS:
+                    continue
+                game = storage.load_cached_game_state(room_code)
+            except ValueError:
+                continue  # corrupt rooms are left for the admin tools
+            if game is not None:
+                self.schedule(game)
+        return len(self)
+
+    def run(self) -> None:
+        while True:
+            due = self._next_due()
+            if due is None:
+                return
+            _, room_code, phase = due
+            try:
+                self.fire(room_code, phase)
+            except storage.ConflictError:
+                logger.warning("Room %s too busy to end %s, retrying", room_code, phase)
+                retry_at = time.time() + RETRY_DELAY
+                with self._cond:
+                    if room_code not in self._pending:
+                        self._pending[room_code] = (phase, retry_at)
+                        heapq.heappush(self._heap, (retry_at, room_code, phase))
+            except Exception:
+                logger.exception("Ending %s in room %s failed", phase, room_code)
+
+    def start(self) -> None:
+        """Watch every commit in this process and fire deadlines on a daemon thread"""
+        if self._thread is not None:
+            return
+        storage.add_commit_listener(self.schedule)
+
+        def run():
+            try:
+                self.schedule_existing()
+            except Exception:
+                logger.exception("Loading existing room deadlines failed")
+            self.run()
+
+        self._thread = threading.Thread(target=run, name='phase-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_scheduler: Optional[PhaseScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> PhaseScheduler:
+    """The process-wide scheduler, started on first use"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PhaseScheduler()
+            _scheduler.start()
+    return _scheduler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the phase scheduler on its own, next to several app workers")
+    parser.add_argument('--rescan-interval', type=float, default=RESCAN_INTERVAL,
+                        help="seconds between rescans of the store for rooms written by other processes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    scheduler = get_scheduler()
+    # Rooms written by other processes only show up in the store, so rescan it now and then
+    while True:
+        time.sleep(args.rescan_interval)
+        scheduler.schedule_existing()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Headless bot simulator and throughput benchmark for the game engine.
+
+Bots play complete rounds through the same persistence functions the app
+uses (create_game_state / update_game_state / load_game_state), against a
+fresh store in a temporary directory, and the run reports rounds per
+second plus p50/p99 latency of every transition and store call.
+
+    python simulator.py --rooms 20 --players 6 --rounds 10
+    python simulator.py --store json,sqlite,eventlog --repeat 3
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Hashable, List, Optional
+
+import data
+import storage
+from game_logic import Game, Player
+from rooms import RoomCodeAllocator
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class LatencyRecorder:
+    """Collects latency samples per operation name, thread-safe"""
+
+    def __init__(self):
+        self._samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(name, []).append(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+        return {
+            name: {
+                'count': len(values),
+                'p50': percentile(values, 0.50),
+                'p99': percentile(values, 0.99),
+                'p999': percentile(values, 0.999),
+            }
+            for name, values in samples.items()
+        }
+
+
+class TimedStore(storage.RoomStore):
+    """Wraps a store and records how long each call takes"""
+
+    def __init__(self, inner: storage.RoomStore, recorder: LatencyRecorder):
+        self.inner = inner
+        self.recorder = recorder
+
+    def timed(self, name, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.recorder.record(f'store.{name}', time.perf_counter() - start)
+
+    def load(self, room_code: str) -> Optional[Dict]:
+        return self.timed('load', self.inner.load, room_code)
+
+    def save(self, room_code: str, data: Dict) -> Hashable:
+        return self.timed('save', self.inner.save, room_code, data)
+
+    def create(self, room_code: str, data: Dict) -> Optional[Hashable]:
+        return self.timed('create', self.inner.create, room_code, data)
+
+    def compare_and_swap(self, room_code: str, expected_version: int, data: Dict,
+                         events: List[Dict] = None) -> Optional[Hashable]:
+        return self.timed('compare_and_swap', self.inner.compare_and_swap,
+                          room_code, expected_version, data, events)
+
+    def version(self, room_code: str) -> Optional[Hashable]:
+        return self.timed('version', self.inner.version, room_code)
+
+    def delete(self, room_code: str) -> None:
+        return self.timed('delete', self.inner.delete, room_code)
+
+    def room_codes(self) -> List[str]:
+        return self.inner.room_codes()
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+def open_store(backend: str, directory: str) -> storage.RoomStore:
+    """A fresh store of the given kind inside directory"""
+    if backend == 'json':
+        return storage.JsonFileStore(directory)
+    if backend == 'eventlog':
+        return storage.EventLogStore(directory)
+    if backend == 'binary':
+        return storage.RoomFileStore(directory)
+    if backend == 'sqlite':
+        return storage.SqliteStore(os.path.join(directory, 'rooms.db'))
+    if backend == 'broker':
+        # A stand-in broker in this process, reached over loopback TCP like a real one
+        from broker import BrokerServer, BrokerStore
+        return BrokerStore(BrokerServer().start().address)
+    raise ValueError(f"Unknown room store: {backend}")
+
+
+class BotRoom:
+    """One room of bots playing rounds through the store"""
+
+    def __init__(self, allocator: RoomCodeAllocator, players: int, recorder: LatencyRecorder,
+                 rng: random.Random):
+        self.recorder = recorder
+        self.rng = rng
+        self.names = [f'bot{i}' for i in range(players)]
+
+        def new_room(room_code):
+            game = Game(room_code)
+            for i, name in enumerate(self.names):
+                game.add_player(Player(name, is_host=(i == 0)))
+            game.set_min_players(min(game.min_players, players))
+            return game
+
+        self.room_code = self.timed('create_room', lambda: allocator.allocate(new_room).room_code)
+
+    def timed(self, name, action):
+        start = time.perf_counter()
+        try:
+            return action()
+        finally:
+            self.recorder.record(name, time.perf_counter() - start)
+
+    def _transition(self, name, mutate) -> Game:
+        return self.timed(name, lambda: storage.update_game_state(self.room_code, mutate))
+
+    def play_round(self) -> None:
+        """start_round -> select_item -> discussion -> voting -> reveal -> guess -> reset"""
+        domain = self.rng.choice(list(data.get_catalog()))
+        self._transition('start_round', lambda g: g.start_round())
+
+        def start_with_domain(g):
+            g.set_domain(domain)
+            g.select_item()
+            g.start_discussion()
+        self._transition('select_item', start_with_domain)
+        self._transition('start_voting', lambda g: g.start_voting())
+
+        for voter in self.names:
+            candidates = [name for name in self.names if name != voter]
+            choice = self.rng.choice(candidates)
+            self._transition('submit_vote', lambda g: g.submit_vote(voter, choice))
+            # Each bot's client syncs after voting, like a rerun would
+            self.timed('load_game_state', lambda: storage.load_game_state(self.room_code))
+
+        self._transition('reveal_imposter', lambda g: g.reveal_imposter())
+        game = self._transition('start_imposter_guess', lambda g: g.start_imposter_guess())
+        guess = self.rng.choice(game.get_guess_options())
+        self._transition('submit_imposter_guess', lambda g: g.submit_imposter_guess(guess))
+        self._transition('reset_round', lambda g: g.reset_round())
+
+
+def run(backend: str, rooms: int, players: int, rounds: int, threads: int = 1,
+        seed: int = 0) -> Dict:
+    """Play rounds in every room against a fresh store and return the report"""
+    recorder = LatencyRecorder()
+    rng = random.Random(seed)
+    random.seed(seed)  # Game itself picks items and imposters with the global generator
+    with tempfile.TemporaryDirectory() as directory:
+        inner = open_store(backend, directory)
+        storage.set_store(TimedStore(inner, recorder))
+        allocator = RoomCodeAllocator(storage.get_store())
+        bot_rooms = [BotRoom(allocator, players, recorder, random.Random(rng.random())) for _ in range(rooms)]
+
+        def play(room: BotRoom):
+            for _ in range(rounds):
+                room.timed('round', room.play_round)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(play, bot_rooms))
+        elapsed = time.perf_counter() - start
+        inner.close()
+        storage.set_store(None)
+
+    return {
+        'store': backend,
+        'rounds': rooms * rounds,
+        'seconds': elapsed,
+        'rounds_per_second': rooms * rounds / elapsed,
+        'latency': recorder.summary(),
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(f"\n{report['store']}: {report['rounds']} rounds in {report['seconds']:.2f}s "
+          f"= {report['rounds_per_second']:.1f} rounds/s")
+    print(f"  {'operation':<24}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, stats in sorted(report['latency'].items()):
+        print(f"  {name:<24}{stats['count']:>8}{stats['p50'] * 1000:>10.3f}{stats['p99'] * 1000:>10.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--store', default='json,binary,sqlite,eventlog',
+                        help="comma-separated stores to benchmark")
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--players', type=int, default=6)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=1, help="rooms played concurrently")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per store; the median run is reported")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for backend in args.store.split(','):
+        reports = [run(backend, args.rooms, args.players, args.rounds, args.threads, args.seed)
+                   for _ in range(args.repeat)]
+        median = statistics.median(r['rounds_per_second'] for r in reports)
+        print_report(min(reports, key=lambda r: abs(r['rounds_per_second'] - median)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Read-only spectator snapshots, shared by every viewer of a room.
+
+Spectators never join a room. Each server process keeps one snapshot per
+watched room: its spectator projection (see views.py) plus the rendered
+markdown, rebuilt once per room version. However many people watch, the
+store is checked at most once per SPECTATOR_REFRESH seconds per room, and
+saves made by this process replace the snapshot as they are committed.
+
+The secret item stays hidden until the imposter has made their guess.
+"""
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import config
+import storage
+import views
+from game_logic import Game
+from views import RoomView
+
+
+@dataclass(frozen=True)
+class SpectatorView:
+    room: RoomView  # the spectator projection of the room
+    markdown: str
+
+    @property
+    def version(self) -> int:
+        return self.room.version
+
+    @property
+    def deadline(self) -> Optional[float]:
+        return self.room.deadline
+
+
+def build_view(game: Game) -> SpectatorView:
+    """The spectator projection of a room, rendered once"""
+    room = views.project(game, views.SPECTATOR)
+    lines = [f"### 🎯 {room.room_code} · {room.phase.replace('_', ' ')}"]
+    if room.domain:
+        lines.append(f"**🌍 {room.domain}**")
+    if room.phase == "voting":
+        lines.append(f"🗳️ Votes / الأصوات: {room.votes_cast}/{len(room.players)}")
+    if room.imposter:
+        lines.append(f"🕵️ Imposter / برّه السالفة: **{room.imposter}**")
+        tally = Counter(row.vote for row in room.players if row.vote)
+        lines.extend(f"- {name}: {count} vote(s)" for name, count in tally.most_common())
+    if room.item:
+        lines.append(f"🎁 Item / العنصر: **{room.item}**")
+        if room.imposter_guess:
+            lines.append(f"🤔 Guess / التخمين: {room.imposter_guess} {'✅' if room.imposter_won else '❌'}")
+    lines.append("#### 🏆 Scoreboard / النتائج")
+    lines.extend(f"{rank}. {row.name}{' 👑' if row.is_host else ''} : {row.score}"
+                 for rank, row in enumerate(room.ranking, 1))
+    return SpectatorView(room, '\n\n'.join(lines))
+
+
+class SpectatorHub:
+    """Snapshots of the rooms this process has spectators for"""
+
+    def __init__(self, refresh: float = config.SPECTATOR_REFRESH):
+        self.refresh = refresh
+        self._snapshots: Dict[str, Tuple[float, Optional[SpectatorView]]] = {}  # room -> (checked_at, view)
+        self._lock = threading.Lock()
+        self._room_locks: Dict[str, threading.Lock] = {}
+
+    def snapshot(self, room_code: str) -> Optional[SpectatorView]:
+        """Latest view of a room, None if it doesn't exist"""
+        entry = self._snapshots.get(room_code)
+        if entry is not None and time.monotonic() - entry[0] < self.refresh:
+            return entry[1]
+        with self._lock:
+            room_lock = self._room_locks.setdefault(room_code, threading.Lock())
+        with room_lock:
+            # Viewers that queued up behind the refresh reuse its result
+            entry = self._snapshots.get(room_code)
+            if entry is not None and time.monotonic() - entry[0] < self.refresh:
+                return entry[1]
+            game = storage.load_cached_game_state(room_code)
+            if game is None:
+                self.forget(room_code)  # nothing to keep for a room that doesn't exist
+                return None
+            view = entry[1] if entry is not None else None
+            if view is None or view.version != game.version:
+                view = build_view(game)
+            self._snapshots[room_code] = (time.monotonic(), view)
+            return view
+
+    def committed(self, game: Game) -> None:
+        """Commit listener: rebuild the snapshot of a watched room as soon as it is saved"""
+        entry = self._snapshots.get(game.room_code)
+        if entry is not None and (entry[1] is None or entry[1].version < game.version):
+            self._snapshots[game.room_code] = (time.monotonic(), build_view(game))
+
+    def forget(self, room_code: str) -> None:
+        """Delete listener: drop the snapshot and lock of a room that is gone"""
+        self._snapshots.pop(room_code, None)
+        with self._lock:
+            self._room_locks.pop(room_code, None)
+
+
+_hub: Optional[SpectatorHub] = None
+_hub_lock = threading.Lock()
+
+
+def get_spectators() -> SpectatorHub:
+    """The process-wide spectator hub"""
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = SpectatorHub()
+            storage.add_commit_listener(_hub.committed)
+            storage.add_delete_listener(_hub.forget)
+    return _hub
@@ -0,0 +1,256 @@
+"""
+Cross-room statistics, updated incrementally as rounds finish.
+
+Every round that reaches the scores phase is recorded once in a SQLite
+database (config.STATS_PATH): a row of round history plus per-player and
+per-domain counters. The leaderboard is read through an index on points,
+so queries cost O(K) however many rounds have been played.
+
+    python stats.py              # print the leaderboard and domain win rates
+"""
+import argparse
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import config
+import storage
+from game_logic import CORRECT_VOTE_POINTS, IMPOSTER_GUESS_POINTS, Game
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PlayerStats:
+    name: str
+    rounds: int
+    points: int
+    imposter_rounds: int
+    imposter_wins: int
+    correct_votes: int
+
+
+@dataclass
+class DomainStats:
+    domain: str
+    rounds: int
+    imposter_wins: int
+
+    @property
+    def imposter_win_rate(self) -> float:
+        return self.imposter_wins / self.rounds if self.rounds else 0.0
+
+
+@dataclass
+class RoundRecord:
+    room_code: str
+    finished_at: float
+    domain: Optional[str]
+    item: Optional[str]
+    imposter: str
+    imposter_won: bool
+    players: int
+    correct_voters: int
+
+
+class StatsStore:
+    """Round history and running totals in one SQLite database"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rounds (
+            room_code TEXT NOT NULL,
+            finished_at REAL NOT NULL,
+            domain TEXT,
+            item TEXT,
+            imposter TEXT NOT NULL,
+            imposter_won INTEGER NOT NULL,
+            players INTEGER NOT NULL,
+            correct_voters INTEGER NOT NULL,
+            PRIMARY KEY (room_code, finished_at)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS rounds_finished ON rounds (finished_at);
+        CREATE TABLE IF NOT EXISTS player_stats (
+            name TEXT PRIMARY KEY,
+            rounds INTEGER NOT NULL DEFAULT 0,
+            points INTEGER NOT NULL DEFAULT 0,
+            imposter_rounds INTEGER NOT NULL DEFAULT 0,
+            imposter_wins INTEGER NOT NULL DEFAULT 0,
+            correct_votes INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS player_stats_points ON player_stats (points DESC, name);
+        CREATE TABLE IF NOT EXISTS domain_stats (
+            domain TEXT PRIMARY KEY,
+            rounds INTEGER NOT NULL DEFAULT 0,
+            imposter_wins INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS totals (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            rounds INTEGER NOT NULL,
+            players INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = config.STATS_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(self.SCHEMA)
+        # Databases from before the totals row count it up once
+        conn.execute('INSERT OR IGNORE INTO totals VALUES (0, '
+                     '(SELECT COALESCE(SUM(rounds), 0) FROM domain_stats), (SELECT COUNT(*) FROM player_stats))')
+        # Rounds this process already recorded, so repeat sightings skip the database
+        self._recorded: Dict[str, float] = {}
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stats-writer')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def round_key(game: Game) -> float:
+        """Identifies a finished round: when its room entered the scores phase"""
+        return game.phase_started_at if game.phase_started_at is not None else float(game.version)
+
+    def record_round(self, game: Game) -> bool:
+        """Add a finished round to the history and counters, unless it is already there"""
+        finished_at = self.round_key(game)
+        imposter = game.imposter.name
+        imposter_won = game.imposter_guess == game.current_item
+        correct = game.correct_voters()
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO rounds VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (game.room_code, finished_at, game.current_domain, game.current_item, imposter,
+                 int(imposter_won), len(game.players), len(correct)),
+            )
+            if cursor.rowcount == 0:
+                return False  # another process got here first
+            names = [player.name for player in game.players]
+            known = conn.execute(
+                f'SELECT COUNT(*) FROM player_stats WHERE name IN ({", ".join("?" * len(names))})', names
+            ).fetchone()[0]
+            conn.execute('UPDATE totals SET rounds = rounds + 1, players = players + ? WHERE id = 0',
+                         (len(names) - known,))
+            conn.executemany(
+                'INSERT INTO player_stats (name, rounds, points, imposter_rounds, imposter_wins, correct_votes) '
+                'VALUES (?, 1, ?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET '
+                'rounds = rounds + 1, points = points + excluded.points, '
+                'imposter_rounds = imposter_rounds + excluded.imposter_rounds, '
+                'imposter_wins = imposter_wins + excluded.imposter_wins, '
+                'correct_votes = correct_votes + excluded.correct_votes',
+                [
+                    (player.name,
+                     IMPOSTER_GUESS_POINTS * (player.name == imposter and imposter_won)
+                     + CORRECT_VOTE_POINTS * (player.name in correct),
+                     int(player.name == imposter), int(player.name == imposter and imposter_won),
+                     int(player.name in correct))
+                    for player in game.players
+                ],
+            )
+            conn.execute(
+                'INSERT INTO domain_stats (domain, rounds, imposter_wins) VALUES (?, 1, ?) '
+                'ON CONFLICT (domain) DO UPDATE SET rounds = rounds + 1, '
+                'imposter_wins = imposter_wins + excluded.imposter_wins',
+                (game.current_domain or '', int(imposter_won)),
+            )
+        return True
+
+    def observe(self, game: Game) -> None:
+        """Commit listener: queue rooms that just finished a round"""
+        if game.phase != "scores" or game.imposter is None:
+            return
+        key = self.round_key(game)
+        if self._recorded.get(game.room_code) == key:
+            return
+        self._recorded[game.room_code] = key
+        self._writer.submit(self._record_logged, game)
+
+    def _record_logged(self, game: Game) -> None:
+        try:
+            self.record_round(game)
+        except Exception:
+            logger.exception("Recording a round of room %s failed", game.room_code)
+
+    def top_players(self, k: int = 10) -> List[PlayerStats]:
+        rows = self._connect().execute(
+            'SELECT name, rounds, points, imposter_rounds, imposter_wins, correct_votes '
+            'FROM player_stats ORDER BY points DESC, name LIMIT ?', (k,)
+        ).fetchall()
+        return [PlayerStats(*row) for row in rows]
+
+    def player(self, name: str) -> Optional[PlayerStats]:
+        row = self._connect().execute(
+            'SELECT name, rounds, points, imposter_rounds, imposter_wins, correct_votes '
+            'FROM player_stats WHERE name = ?', (name,)
+        ).fetchone()
+        return PlayerStats(*row) if row else None
+
+    def domains(self) -> List[DomainStats]:
+        """Every played domain; there are only as many as the loaded packs have"""
+        rows = self._connect().execute(
+            'SELECT domain, rounds, imposter_wins FROM domain_stats ORDER BY rounds DESC, domain'
+        ).fetchall()
+        return [DomainStats(*row) for row in rows]
+
+    def recent_rounds(self, k: int = 10) -> List[RoundRecord]:
+        rows = self._connect().execute(
+            'SELECT room_code, finished_at, domain, item, imposter, imposter_won, players, correct_voters '
+            'FROM rounds ORDER BY finished_at DESC LIMIT ?', (k,)
+        ).fetchall()
+        return [RoundRecord(*row[:5], bool(row[5]), *row[6:]) for row in rows]
+
+    def totals(self) -> Tuple[int, int]:
+        """(rounds played, players seen), read from the counters row"""
+        return self._connect().execute('SELECT rounds, players FROM totals WHERE id = 0').fetchone()
+
+    def flush(self) -> None:
+        """Wait for queued rounds to be written"""
+        self._writer.submit(lambda: None).result()
+
+    def close(self) -> None:
+        self._writer.shutdown(wait=True)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_stats: Optional[StatsStore] = None
+_stats_lock = threading.Lock()
+
+
+def get_stats() -> StatsStore:
+    """The process-wide stats store, recording every round this process commits or loads"""
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = StatsStore()
+            storage.add_commit_listener(_stats.observe)
+    return _stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Print cross-room statistics")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+    stats = StatsStore()
+    rounds, players = stats.totals()
+    print(f"{rounds} rounds, {players} players")
+    for rank, player in enumerate(stats.top_players(args.top), 1):
+        print(f"{rank:>3}. {player.name:<24}{player.points:>8} pts  {player.rounds:>5} rounds")
+    for domain in stats.domains():
+        print(f"  {domain.domain:<32}{domain.rounds:>6} rounds  imposter wins {domain.imposter_win_rate:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,926 @@
+"""
+Room state storage backends
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import functools
+import gzip
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: rooms are only serialized within one process
+    fcntl = None
+
+import config
+import metrics
+import codec
+from codec import RoomHeader
+from game_logic import Game
+from notify import room_notifier
+from room_cache import room_cache
+
+
+def game_to_dict(game: Game) -> Dict:
+    """Convert a game into a plain dict for storage"""
+    return game.to_dict()
+
+
+def game_from_dict(data: Dict) -> Game:
+    """Rebuild a game from a stored dict, migrating documents written by older versions"""
+    return Game.from_dict(data)
+
+
+def _parse_json(text) -> Dict:
+    with metrics.JSON_PARSE.time():
+        return json.loads(text)
+
+
+def _decode(data) -> Dict:
+    """Decode a room stored either compactly (see codec) or as legacy JSON"""
+    with metrics.JSON_PARSE.time():
+        return codec.decode(data)
+
+
+def _timed(operation: str):
+    """Record a persistence function's latency, unless metrics are switched off"""
+    def decorate(func):
+        if not metrics.ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.STORE_OPERATIONS.time(operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def version_token(data: Dict) -> Hashable:
+    """Version token of a room document for stores that keep the room version number.
+
+    The number starts over when a deleted room's code is reused, so the
+    token carries the room's incarnation too, and a cache elsewhere can't
+    mistake the new room for the old one at the same version.
+    """
+    return data.get('incarnation'), data.get('version', 0)
+
+
+class ConflictError(Exception):
+    """Raised when a room update keeps losing the race to concurrent writers"""
+
+
+class RoomStore:
+    """Interface for a room state store, one document per room code"""
+
+    name = ''
+
+    def load(self, room_code: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def save(self, room_code: str, data: Dict) -> Hashable:
+        """Save data, returning the version token of what was written"""
+        raise NotImplementedError
+
+    def create(self, room_code: str, data: Dict) -> Optional[Hashable]:
+        """Save a new room, unless the code is already taken. Atomic across processes.
+
+        Returns the version token of the new room, or None if the code was taken.
+        """
+        raise NotImplementedError
+
+    def compare_and_swap(self, room_code: str, expected_version: int, data: Dict,
+                         events: List[Dict] = None) -> Optional[Hashable]:
+        """Save data only if the stored room is still at expected_version.
+
+        events are the Game events that produced data, for stores that log them.
+        Returns the version token of what was written, or None if the room had
+        moved on. The token is taken while the write is still exclusive, so it
+        can't belong to a later save by someone else.
+        """
+        raise NotImplementedError
+
+    def version(self, room_code: str) -> Optional[Hashable]:
+        """Cheap token that changes whenever the room is saved, None if missing"""
+        raise NotImplementedError
+
+    def peek(self, room_code: str) -> Optional[RoomHeader]:
+        """The room's version and phase, without building the rest of it where the store can"""
+        data = self.load(room_code)
+        return RoomHeader(data.get('version', 0), data['phase']) if data is not None else None
+
+    def delete(self, room_code: str) -> None:
+        raise NotImplementedError
+
+    def room_codes(self) -> List[str]:
+        raise NotImplementedError
+
+    def idle_rooms(self, cutoffs: Dict[str, float], default_cutoff: float) -> List[str]:
+        """Rooms last saved before the cutoff time for their phase"""
+        raise NotImplementedError
+
+    def delete_unchanged(self, versions: Dict[str, int]) -> List[str]:
+        """Delete the rooms still at the given versions, returning the deleted codes"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonFileStore(RoomStore):
+    """Stores each room as game_states/<CODE>.json"""
+
+    name = 'json'
+    extension = '.json'
+    LOCK_STRIPES = 64
+
+    def __init__(self, directory: str = config.STATE_DIR):
+        self.directory = directory
+        self.lock_directory = os.path.join(directory, '.locks')
+        os.makedirs(self.lock_directory, exist_ok=True)
+        # Rooms hash onto a fixed set of lock stripes, so lock files don't pile up
+        self._thread_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+    @contextmanager
+    def lock(self, room_code: str):
+        """Serialize writers of a room across threads and processes"""
+        stripe = zlib.crc32(room_code.encode()) % self.LOCK_STRIPES
+        with self._thread_locks[stripe]:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.lock_directory, f'{stripe}.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def path(self, room_code: str) -> str:
+        return os.path.join(self.directory, room_code + self.extension)
+
+    def _dump(self, data: Dict) -> bytes:
+        return json.dumps(data).encode()
+
+    def _parse(self, raw: bytes) -> Dict:
+        return _parse_json(raw)
+
+    def load(self, room_code: str) -> Optional[Dict]:
+        try:
+            with open(self.path(room_code), 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        return self._parse(raw)
+
+    def save(self, room_code: str, data: Dict) -> Hashable:
+        with self.lock(room_code):
+            self._write(room_code, data)
+            return self.version(room_code)
+
+    def create(self, room_code: str, data: Dict) -> Optional[Hashable]:
+        with self.lock(room_code):
+            if os.path.exists(self.path(room_code)):
+                return None
+            self._write(room_code, data)
+            return self.version(room_code)
+
+    def compare_and_swap(self, room_code: str, expected_version: int, data: Dict,
+                         events: List[Dict] = None) -> Optional[Hashable]:
+        with self.lock(room_code):
+            current = self.load(room_code)
+            if current is None or current.get('version', 0) != expected_version:
+                return None
+            self._write(room_code, data)
+            return self.version(room_code)
+
+    def _write(self, room_code: str, data: Dict) -> None:
+        # Write a temp file and rename it over the room, so readers never see a torn
+        # file and the stat-based version below can't miss a same-size rewrite
+        path = self.path(room_code)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        raw = self._dump(data)
+        with open(tmp_path, 'wb') as f:
+            f.write(raw)
+        os.replace(tmp_path, path)
+        metrics.STORE_BYTES_WRITTEN.inc(self.name, amount=len(raw))
+
+    def version(self, room_code: str) -> Optional[Hashable]:
+        # Reading the stored version would mean parsing the file, so fall back to stat
+        try:
+            st = os.stat(self.path(room_code))
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def delete(self, room_code: str) -> None:
+        with self.lock(room_code):
+            self._remove(room_code)
+
+    def _remove(self, room_code: str) -> None:
+        try:
+            os.remove(self.path(room_code))
+        except FileNotFoundError:
+            pass
+
+    def room_codes(self) -> List[str]:
+        size = len(self.extension)
+        return sorted(name[:-size] for name in os.listdir(self.directory) if name.endswith(self.extension))
+
+    def updated_at(self, room_code: str) -> Optional[float]:
+        try:
+            return os.stat(self.path(room_code)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def idle_rooms(self, cutoffs: Dict[str, float], default_cutoff: float) -> List[str]:
+        latest_cutoff = max(default_cutoff, *cutoffs.values())
+        idle = []
+        for room_code in self.room_codes():
+            updated_at = self.updated_at(room_code)
+            # Only rooms that are old enough for some phase are worth parsing
+            if updated_at is None or updated_at >= latest_cutoff:
+                continue
+            try:
+                header = self.peek(room_code)
+            except ValueError:
+                continue
+            if header is not None and updated_at < cutoffs.get(header.phase, default_cutoff):
+                idle.append(room_code)
+        return idle
+
+    def delete_unchanged(self, versions: Dict[str, int]) -> List[str]:
+        deleted = []
+        for room_code, version in versions.items():
+            with self.lock(room_code):
+                data = self.load(room_code)
+                if data is not None and data.get('version', 0) == version:
+                    self._remove(room_code)
+                    deleted.append(room_code)
+        return deleted
+
+
+class EventLogStore(JsonFileStore):
+    """Keeps a snapshot per room plus an append-only log of the updates since.
+
+    <CODE>.json is the last snapshot and <CODE>.events holds one JSON line per
+    committed update ({"version": n, "events": [...]}). Once the log grows past
+    compact_bytes a background thread folds it into a new snapshot and moves
+    the old segment to <CODE>.history.gz, which keeps the full audit trail.
+    """
+
+    name = 'eventlog'
+
+    def __init__(self, directory: str = config.STATE_DIR,
+                 compact_bytes: int = config.EVENT_LOG_COMPACT_BYTES):
+        super().__init__(directory)
+        self.compact_bytes = compact_bytes
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='room-compactor')
+        self._compacting = set()
+        self._compacting_lock = threading.Lock()
+
+    def log_path(self, room_code: str) -> str:
+        return os.path.join(self.directory, f'{room_code}.events')
+
+    def history_path(self, room_code: str) -> str:
+        return os.path.join(self.directory, f'{room_code}.history.gz')
+
+    def _read_log(self, room_code: str) -> List[Dict]:
+        try:
+            with open(self.log_path(room_code), 'rb') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return []
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                pass  # torn append from a crashed writer
+        return entries
+
+    def load(self, room_code: str) -> Optional[Dict]:
+        snapshot = super().load(room_code)
+        if snapshot is None:
+            return None
+        newer = [e for e in self._read_log(room_code) if e['version'] > snapshot.get('version', 0)]
+        if not newer:
+            return snapshot
+        game = game_from_dict(snapshot)
+        for entry in newer:
+            for event in entry['events']:
+                game.apply_event(event)
+            game.version = entry['version']
+        return game_to_dict(game)
+
+    def save(self, room_code: str, data: Dict) -> Hashable:
+        with self.lock(room_code):
+            self._write(room_code, data)
+            self._archive_log(room_code)
+            return self.version(room_code)
+
+    def compare_and_swap(self, room_code: str, expected_version: int, data: Dict,
+                         events: List[Dict] = None) -> Optional[Hashable]:
+        with self.lock(room_code):
+            current = self.load(room_code)
+            if current is None or current.get('version', 0) != expected_version:
+                return None
+            if events is None:
+                # No events to log, so fall back to a full snapshot
+                self._write(room_code, data)
+                self._archive_log(room_code)
+                return self.version(room_code)
+            line = json.dumps({'version': data['version'], 'events': events}).encode() + b'\n'
+            fd = os.open(self.log_path(room_code), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size and not self._ends_with_newline(room_code):
+                    line = b'\n' + line
+                os.write(fd, line)
+                metrics.STORE_BYTES_WRITTEN.inc(self.name, amount=len(line))
+                log_size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            token = self.version(room_code)
+        if log_size > self.compact_bytes:
+            self._schedule_compaction(room_code)
+        return token
+
+    def _ends_with_newline(self, room_code: str) -> bool:
+        with open(self.log_path(room_code), 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _schedule_compaction(self, room_code: str) -> None:
+        with self._compacting_lock:
+            if room_code in self._compacting:
+                return
+            self._compacting.add(room_code)
+        self._compactor.submit(self.compact, room_code)
+
+    def compact(self, room_code: str) -> None:
+        """Fold the room's event log into a new snapshot"""
+        try:
+            with self.lock(room_code):
+                data = self.load(room_code)
+                if data is not None:
+                    self._write(room_code, data)
+                    self._archive_log(room_code)
+        finally:
+            with self._compacting_lock:
+                self._compacting.discard(room_code)
+
+    def _archive_log(self, room_code: str) -> None:
+        # Every archived segment is its own gzip member; gzip reads them back as one stream
+        try:
+            with open(self.log_path(room_code), 'rb') as f:
+                segment = f.read()
+        except FileNotFoundError:
+            return
+        if segment:
+            with gzip.open(self.history_path(room_code), 'ab') as history:
+                history.write(segment if segment.endswith(b'\n') else segment + b'\n')
+        os.remove(self.log_path(room_code))
+
+    def history(self, room_code: str) -> Iterator[Dict]:
+        """Every logged update of the room, oldest first, for audits and replays"""
+        with self.lock(room_code):
+            archived = b''
+            if os.path.exists(self.history_path(room_code)):
+                with gzip.open(self.history_path(room_code), 'rb') as f:
+                    archived = f.read()
+            live = self._read_log(room_code)
+        for line in archived.splitlines():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                pass
+        yield from live
+
+    def version(self, room_code: str) -> Optional[Hashable]:
+        snapshot = super().version(room_code)
+        if snapshot is None:
+            return None
+        try:
+            log = os.stat(self.log_path(room_code))
+        except FileNotFoundError:
+            return snapshot
+        # The log only grows between compactions, so its size moves on every update
+        return snapshot + (log.st_size, log.st_ino)
+
+    def updated_at(self, room_code: str) -> Optional[float]:
+        snapshot = super().updated_at(room_code)
+        try:
+            return max(snapshot, os.stat(self.log_path(room_code)).st_mtime)
+        except (FileNotFoundError, TypeError):
+            return snapshot
+
+    def _remove(self, room_code: str) -> None:
+        super()._remove(room_code)
+        for path in (self.log_path(room_code), self.history_path(room_code)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        self._compactor.shutdown(wait=True)
+
+
+class RoomFileStore(JsonFileStore):
+    """Stores each room as game_states/<CODE>.room in the compact encoding (see codec).
+
+    Rooms left as <CODE>.json by the JSON store are read as they are and
+    replaced by a .room file on their next save, or all at once by
+    migrate_legacy().
+    """
+
+    name = 'binary'
+    extension = '.room'
+    legacy_extension = '.json'
+
+    def legacy_path(self, room_code: str) -> str:
+        return os.path.join(self.directory, room_code + self.legacy_extension)
+
+    def _dump(self, data: Dict) -> bytes:
+        return codec.encode(data)
+
+    def _parse(self, raw: bytes) -> Dict:
+        return _decode(raw)
+
+    def load(self, room_code: str) -> Optional[Dict]:
+        data = super().load(room_code)
+        if data is not None:
+            return data
+        try:
+            with open(self.legacy_path(room_code), 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        return self._parse(raw)
+
+    def peek(self, room_code: str) -> Optional[RoomHeader]:
+        try:
+            with open(self.path(room_code), 'rb') as f:
+                return codec.read_header(f.read(codec.HEADER.size))
+        except FileNotFoundError:
+            return super().peek(room_code)
+
+    def create(self, room_code: str, data: Dict) -> Optional[Hashable]:
+        if os.path.exists(self.legacy_path(room_code)):
+            return None
+        return super().create(room_code, data)
+
+    def _write(self, room_code: str, data: Dict) -> None:
+        super()._write(room_code, data)
+        # The .room file supersedes any legacy copy of the room
+        try:
+            os.remove(self.legacy_path(room_code))
+        except FileNotFoundError:
+            pass
+
+    def version(self, room_code: str) -> Optional[Hashable]:
+        token = super().version(room_code)
+        if token is not None:
+            return token
+        try:
+            st = os.stat(self.legacy_path(room_code))
+        except FileNotFoundError:
+            return None
+        return ('legacy', st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def updated_at(self, room_code: str) -> Optional[float]:
+        updated_at = super().updated_at(room_code)
+        if updated_at is None and os.path.exists(self.legacy_path(room_code)):
+            return os.stat(self.legacy_path(room_code)).st_mtime
+        return updated_at
+
+    def _remove(self, room_code: str) -> None:
+        super()._remove(room_code)
+        try:
+            os.remove(self.legacy_path(room_code))
+        except FileNotFoundError:
+            pass
+
+    def room_codes(self) -> List[str]:
+        size = len(self.legacy_extension)
+        legacy = {name[:-size] for name in os.listdir(self.directory) if name.endswith(self.legacy_extension)}
+        return sorted(legacy.union(super().room_codes()))
+
+    def migrate_legacy(self) -> int:
+        """Rewrite every legacy JSON room in the compact encoding, returning how many"""
+        migrated = 0
+        for room_code in self.room_codes():
+            with self.lock(room_code):
+                if os.path.exists(self.path(room_code)) or not os.path.exists(self.legacy_path(room_code)):
+                    continue
+                data = self.load(room_code)
+                if data is not None:
+                    self._write(room_code, Game.from_dict(data).to_dict())
+                    migrated += 1
+        return migrated
+
+
+class SqliteStore(RoomStore):
+    """Stores every room as one row of a SQLite database in WAL mode"""
+
+    name = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rooms (
+            room_code TEXT PRIMARY KEY,
+            phase TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            incarnation TEXT
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS rooms_phase_updated ON rooms (phase, updated_at);
+    """
+
+    def __init__(self, path: str = config.SQLITE_PATH):
+        self.path = path
+        # Streamlit runs every session in its own thread, so keep one connection per thread
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(self.SCHEMA)
+        if 'incarnation' not in {row[1] for row in conn.execute('PRAGMA table_info(rooms)')}:
+            # A database from before incarnations; its rooms keep a NULL one
+            try:
+                conn.execute('ALTER TABLE rooms ADD COLUMN incarnation TEXT')
+            except sqlite3.OperationalError:
+                pass  # another process added it first
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def load(self, room_code: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            'SELECT data FROM rooms WHERE room_code = ?', (room_code,)
+        ).fetchone()
+        # Rows written before the compact encoding hold JSON text; they are rewritten on the next save
+        return _decode(row[0]) if row else None
+
+    def _encode(self, data: Dict) -> bytes:
+        raw = codec.encode(data)
+        metrics.STORE_BYTES_WRITTEN.inc(self.name, amount=len(raw))
+        return raw
+
+    def save(self, room_code: str, data: Dict) -> Hashable:
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'INSERT INTO rooms (room_code, phase, version, data, updated_at, incarnation) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (room_code) DO UPDATE SET phase = excluded.phase, '
+                'version = excluded.version, data = excluded.data, updated_at = excluded.updated_at, '
+                'incarnation = excluded.incarnation',
+                (room_code, data.get('phase', ''), data.get('version', 0), self._encode(data), time.time(),
+                 data.get('incarnation')),
+            )
+        return version_token(data)
+
+    def create(self, room_code: str, data: Dict) -> Optional[Hashable]:
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO rooms (room_code, phase, version, data, updated_at, incarnation) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (room_code) DO NOTHING',
+                (room_code, data.get('phase', ''), data.get('version', 0), self._encode(data), time.time(),
+                 data.get('incarnation')),
+            )
+            # The incarnation and version columns are the token, so it is known without reading it back
+            return version_token(data) if cursor.rowcount == 1 else None
+
+    def compare_and_swap(self, room_code: str, expected_version: int, data: Dict,
+                         events: List[Dict] = None) -> Optional[Hashable]:
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                'UPDATE rooms SET phase = ?, version = ?, data = ?, updated_at = ? '
+                'WHERE room_code = ? AND version = ? AND incarnation IS ?',
+                (data.get('phase', ''), data.get('version', 0), self._encode(data), time.time(),
+                 room_code, expected_version, data.get('incarnation')),
+            )
+            return version_token(data) if cursor.rowcount == 1 else None
+
+    def version(self, room_code: str) -> Optional[Hashable]:
+        row = self._connect().execute(
+            'SELECT incarnation, version FROM rooms WHERE room_code = ?', (room_code,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def peek(self, room_code: str) -> Optional[RoomHeader]:
+        row = self._connect().execute(
+            'SELECT version, phase FROM rooms WHERE room_code = ?', (room_code,)
+        ).fetchone()
+        return RoomHeader(*row) if row else None
+
+    def delete(self, room_code: str) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM rooms WHERE room_code = ?', (room_code,))
+
+    def room_codes(self) -> List[str]:
+        rows = self._connect().execute('SELECT room_code FROM rooms ORDER BY room_code').fetchall()
+        return [row[0] for row in rows]
+
+    def idle_rooms(self, cutoffs: Dict[str, float], default_cutoff: float) -> List[str]:
+        conn = self._connect()
+        idle = []
+        for phase, cutoff in cutoffs.items():
+            rows = conn.execute(
+                'SELECT room_code FROM rooms WHERE phase = ? AND updated_at < ?', (phase, cutoff)
+            )
+            idle.extend(row[0] for row in rows)
+        placeholders = ', '.join('?' * len(cutoffs))
+        rows = conn.execute(
+            f'SELECT room_code FROM rooms WHERE phase NOT IN ({placeholders}) AND updated_at < ?',
+            (*cutoffs, default_cutoff),
+        )
+        idle.extend(row[0] for row in rows)
+        return idle
+
+    def delete_unchanged(self, versions: Dict[str, int]) -> List[str]:
+        conn = self._connect()
+        deleted = []
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for room_code, version in versions.items():
+                cursor = conn.execute(
+                    'DELETE FROM rooms WHERE room_code = ? AND version = ?', (room_code, version)
+                )
+                if cursor.rowcount:
+                    deleted.append(room_code)
+        return deleted
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def create_store(backend: str = None) -> RoomStore:
+    """Create the store selected by name, defaulting to config.STORE_BACKEND"""
+    backend = backend or config.STORE_BACKEND
+    if backend == 'json':
+        return JsonFileStore()
+    if backend == 'sqlite':
+        return SqliteStore()
+    if backend == 'eventlog':
+        return EventLogStore()
+    if backend == 'binary':
+        return RoomFileStore()
+    if backend == 'broker':
+        from broker import BrokerStore
+        return BrokerStore()
+    raise ValueError(f"Unknown room store: {backend}")
+
+
+_store: Optional[RoomStore] = None
+
+
+def get_store() -> RoomStore:
+    """Get the process-wide room store"""
+    global _store
+    if _store is None:
+        _store = create_store()
+    return _store
+
+
+def set_store(store: RoomStore) -> None:
+    """Replace the process-wide room store"""
+    global _store
+    _store = store
+    room_cache.clear()
+
+
+_commit_listeners: List[Callable[[Game], None]] = []
+
+
+def add_commit_listener(listener: Callable[[Game], None]) -> None:
+    """Call listener with every room state this process writes or first sees from another process.
+
+    The game passed in is the shared cached copy and must not be mutated.
+    """
+    _commit_listeners.append(listener)
+
+
+_delete_listeners: List[Callable[[str], None]] = []
+
+
+def add_delete_listener(listener: Callable[[str], None]) -> None:
+    """Call listener with the code of every room this process deletes, directly or by sweeping"""
+    _delete_listeners.append(listener)
+
+
+def forget_room(room_code: str) -> None:
+    """Drop everything this process keeps about a room that was deleted"""
+    room_cache.invalidate(room_code)
+    room_notifier.forget(room_code)
+    for listener in _delete_listeners:
+        listener(room_code)
+
+
+def _committed(game: Game, store_version: Hashable) -> None:
+    """Cache a room state that is now in the store and tell everyone watching it"""
+    room_cache.put(game.room_code, store_version, game)
+    room_notifier.publish(game.room_code, game.version)
+    for listener in _commit_listeners:
+        listener(game)
+
+
+@_timed('save')
+def save_game_state(game: Game) -> None:
+    """Save game state to the room store"""
+    if game:
+        store = get_store()
+        game.version += 1
+        token = store.save(game.room_code, game_to_dict(game))
+        game.mark_saved()
+        _committed(game, token)
+
+
+@_timed('create')
+def create_game_state(game: Game) -> bool:
+    """Save a new room, returning False if its code is already taken"""
+    store = get_store()
+    game.version += 1
+    token = store.create(game.room_code, game_to_dict(game))
+    if token is None:
+        game.version -= 1
+        return False
+    game.mark_saved()
+    _committed(game, token)
+    return True
+
+
+def delete_game_state(room_code: str) -> None:
+    """Remove a room from the store and from the in-process cache"""
+    get_store().delete(room_code)
+    forget_room(room_code)
+
+
+class _PendingUpdate:
+    """One caller's mutation, waiting to go out in its room's next commit"""
+
+    __slots__ = ('mutate', 'key', 'wake', 'lead', 'done', 'result', 'error')
+
+    def __init__(self, mutate: Callable[[Game], Optional[bool]], key: Optional[str]):
+        self.mutate = mutate
+        self.key = key
+        self.wake = threading.Event()
+        self.lead = False  # this caller commits the next batch of its room
+        self.done = False
+        self.result: Optional[Game] = None
+        self.error: Optional[BaseException] = None
+
+    def finish(self, result: Optional[Game] = None, error: BaseException = None) -> None:
+        self.result, self.error, self.done = result, error, True
+        self.wake.set()
+
+
+_pending: Dict[str, List[_PendingUpdate]] = {}  # room -> updates waiting for its next commit
+_committing: set = set()  # rooms with a commit in flight in this process
+_pending_lock = threading.Lock()
+
+
+def _commit_batch(room_code: str, batch: List[_PendingUpdate], retries: int) -> None:
+    """Apply a batch of mutations to a freshly loaded room and save them in one compare-and-swap"""
+    store = get_store()
+    attempt = 0
+    while True:
+        game = load_game_state(room_code)
+        if game is None:
+            break
+        expected_version = game.version
+        phase, phase_started_at = game.phase, game.phase_started_at
+        forced = False
+        try:
+            for update in batch:
+                if update.key is not None and game.was_applied(update.key):
+                    continue  # a double click or replayed rerun
+                events = len(game.events)
+                outcome = update.mutate(game)
+                forced = forced or outcome is True
+                # A key is only worth a write when its update changed something
+                if update.key is not None and (outcome is True or len(game.events) > events):
+                    game.mark_applied(update.key)
+        except Exception as e:
+            # The game may be half-mutated: fail that caller and start over without it
+            update.finish(error=e)
+            batch = [other for other in batch if other is not update]
+            continue
+        if not game.dirty and not forced:
+            break  # nothing changed, so nothing to write
+        game.version += 1
+        token = store.compare_and_swap(room_code, expected_version, game_to_dict(game), game.events or None)
+        if token is not None:
+            game.mark_saved()
+            _committed(game, token)
+            if game.phase != phase:
+                metrics.PHASE_TRANSITIONS.inc(phase, game.phase)
+                if phase_started_at and game.phase_started_at:
+                    metrics.PHASE_DURATION.observe(game.phase_started_at - phase_started_at, phase)
+            if len(batch) > 1:
+                metrics.GROUPED_UPDATES.inc(amount=len(batch) - 1)
+            break
+        # Lost the race; back off a little before retrying on the newer state
+        metrics.UPDATE_RETRIES.inc()
+        attempt += 1
+        if attempt >= retries:
+            raise ConflictError(f"Room {room_code} is too busy, gave up after {retries} attempts")
+        time.sleep(random.uniform(0, 0.002 * 2 ** min(attempt, 6)))
+    for update in batch:
+        update.finish(game)
+
+
+@_timed('update')
+def update_game_state(room_code: str, mutate: Callable[[Game], Optional[bool]],
+                      retries: int = config.UPDATE_RETRIES, key: Optional[str] = None) -> Optional[Game]:
+    """Apply mutate to a freshly loaded room and save it with a compare-and-swap.
+
+    If another writer saved the room in between, the mutation is retried on
+    the newer state. Mutations that change nothing are not written; mutate may
+    return False to skip the write, or True to write even so. Updates of a
+    room made while this process is already committing it are grouped into
+    its next commit. An update with a key is applied at most once, as the room
+    remembers recent keys; a keyed update that changes nothing is neither
+    written nor remembered. Returns the updated game, or None if the room does
+    not exist.
+    """
+    update = _PendingUpdate(mutate, key)
+    with _pending_lock:
+        _pending.setdefault(room_code, []).append(update)
+        if room_code not in _committing:
+            _committing.add(room_code)
+            update.lead = True
+    if not update.lead:
+        update.wake.wait()  # committed along with someone else's update, or handed the next commit
+    if update.lead:
+        if config.GROUP_COMMIT_WINDOW:
+            time.sleep(config.GROUP_COMMIT_WINDOW)  # let more updates join the batch
+        with _pending_lock:
+            batch = _pending.pop(room_code)
+        try:
+            _commit_batch(room_code, batch, retries)
+        except BaseException as e:
+            for other in batch:
+                if not other.done:
+                    other.finish(error=e)
+        finally:
+            with _pending_lock:
+                queued = _pending.get(room_code)
+                if queued:
+                    queued[0].lead = True
+                    queued[0].wake.set()
+                else:
+                    _committing.discard(room_code)
+    if update.error is not None:
+        raise update.error
+    return update.result
+
+
+@_timed('load')
+def load_game_state(room_code: str) -> Optional[Game]:
+    """Load game state from the room store"""
+    data = get_store().load(room_code)
+    if data is None:
+        return None
+    return game_from_dict(data)
+
+
+@_timed('peek')
+def peek_game_state(room_code: str) -> Optional[RoomHeader]:
+    """Version and phase of a stored room, without loading the whole room where the store allows"""
+    return get_store().peek(room_code)
+
+
+@_timed('load_cached')
+def load_cached_game_state(room_code: str) -> Optional[Game]:
+    """Load game state, reusing the cached Game while the room version is unchanged"""
+    store = get_store()
+    version = store.version(room_code)
+    if version is None:
+        room_cache.invalidate(room_code)
+        return None
+    game = room_cache.get(room_code, version)
+    if game is None:
+        game = load_game_state(room_code)
+        if game is not None:
+            # Let local watchers know about saves made by other processes
+            _committed(game, version)
+    return game
@@ -0,0 +1,117 @@
+"""
+Stress test for concurrent vote submission.
+
+Many threads (and optionally processes) vote in the same room at the same
+time through storage.update_game_state; afterwards every vote must be in
+the stored room and the stored document must still parse.
+
+    python stress_votes.py --store json --voters 50 --rounds 20
+    python stress_votes.py --store sqlite --voters 50 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import storage
+from game_logic import Game, Player
+
+
+def use_store(backend: str, directory: str) -> None:
+    if backend == 'json':
+        storage.set_store(storage.JsonFileStore(directory))
+    elif backend == 'eventlog':
+        storage.set_store(storage.EventLogStore(directory))
+    elif backend == 'binary':
+        storage.set_store(storage.RoomFileStore(directory))
+    else:
+        storage.set_store(storage.SqliteStore(os.path.join(directory, 'rooms.db')))
+
+
+def make_voting_room(room_code: str, voters: int) -> None:
+    game = Game(room_code)
+    game.add_player(Player('voter0', is_host=True))
+    for i in range(1, voters):
+        game.add_player(Player(f'voter{i}'))
+    game.imposter = game.players[0]
+    game.phase = "voting"
+    storage.save_game_state(game)
+
+
+def vote_all(room_code: str, voter_names, barrier) -> None:
+    """Have every voter vote at once, one thread each"""
+    def vote(name):
+        barrier.wait()
+        storage.update_game_state(room_code, lambda g: g.submit_vote(name, 'voter0'))
+
+    threads = [threading.Thread(target=vote, args=(name,)) for name in voter_names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def process_worker(backend, directory, room_code, voter_names, barrier):
+    use_store(backend, directory)
+    vote_all(room_code, voter_names, threading.Barrier(len(voter_names)))
+    barrier.wait()
+
+
+def run_round(args, directory: str, round_number: int):
+    """Run one round of concurrent voting, returning the number of lost votes and of commits"""
+    room_code = f'S{round_number:03d}'
+    make_voting_room(room_code, args.voters)
+    names = [f'voter{i}' for i in range(args.voters)]
+
+    if args.processes > 1:
+        ctx = multiprocessing.get_context('spawn')
+        barrier = ctx.Barrier(args.processes)
+        workers = [
+            ctx.Process(target=process_worker,
+                        args=(args.store, directory, room_code, names[i::args.processes], barrier))
+            for i in range(args.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    else:
+        vote_all(room_code, names, threading.Barrier(len(names)))
+
+    # Reads the stored document, so a torn write would fail to parse here
+    stored = storage.load_game_state(room_code)
+    lost = args.voters - len(stored.votes)
+    # Votes that arrive while a commit is in flight share the next one
+    commits = stored.version - 1
+    if commits > args.voters:
+        print(f"room {room_code}: {args.voters} votes took {commits} commits")
+    return lost, commits
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--store', choices=['json', 'binary', 'sqlite', 'eventlog'], default='json')
+    parser.add_argument('--voters', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--processes', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_store(args.store, directory)
+        start = time.perf_counter()
+        results = [run_round(args, directory, i) for i in range(args.rounds)]
+        elapsed = time.perf_counter() - start
+
+    votes = args.voters * args.rounds
+    lost = sum(round_lost for round_lost, _ in results)
+    commits = sum(round_commits for _, round_commits in results)
+    print(f"{args.store}: {votes} votes in {elapsed:.2f}s ({votes / elapsed:.0f}/s) "
+          f"with {commits} commits, lost {lost}")
+    return 1 if lost else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Background expiry of idle rooms
+
+    python sweeper.py    # run one sweep and print the report
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import config
+import rooms
+import storage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SweepReport:
+    idle: int  # rooms past their TTL when the sweep started
+    reclaimed: int  # rooms archived and deleted
+    seconds: float
+    archive_path: Optional[str] = None
+
+
+class RoomSweeper:
+    """Archives rooms that sat idle past their phase's TTL and deletes them in bulk.
+
+    A room is only deleted if it is still at the version that was archived,
+    so rooms that get written to during a sweep are left alone.
+    """
+
+    def __init__(self, store: storage.RoomStore = None,
+                 ttls: Dict[str, float] = None,
+                 default_ttl: float = config.ROOM_TTL_DEFAULT,
+                 archive_dir: str = config.ARCHIVE_DIR):
+        self.store = store or storage.get_store()
+        self.ttls = config.ROOM_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.archive_dir = archive_dir
+        self.last_report: Optional[SweepReport] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sweep(self, now: float = None) -> SweepReport:
+        """Run one sweep"""
+        start = time.perf_counter()
+        now = time.time() if now is None else now
+        cutoffs = {phase: now - ttl for phase, ttl in self.ttls.items()}
+        idle = self.store.idle_rooms(cutoffs, now - self.default_ttl)
+
+        expired = {}
+        for room_code in idle:
+            try:
+                data = self.store.load(room_code)
+            except ValueError:
+                continue  # corrupt rooms are left for the admin tools
+            if data is not None:
+                expired[room_code] = data
+
+        # The event log store's audit trail goes into the archive with the final snapshot
+        histories = {}
+        if isinstance(self.store, storage.EventLogStore):
+            histories = {room_code: list(self.store.history(room_code)) for room_code in expired}
+        archive_path = self._archive(expired, histories, now) if expired else None
+        deleted = self.store.delete_unchanged(
+            {room_code: data.get('version', 0) for room_code, data in expired.items()}
+        )
+        for room_code in deleted:
+            storage.forget_room(room_code)
+        if self.store is storage.get_store():
+            rooms.get_allocator().return_codes(deleted)
+
+        report = SweepReport(len(idle), len(deleted), time.perf_counter() - start, archive_path)
+        logger.info("Room sweep reclaimed %d of %d idle rooms in %.3fs",
+                    report.reclaimed, report.idle, report.seconds)
+        self.last_report = report
+        return report
+
+    def _archive(self, rooms_data: Dict[str, Dict], histories: Dict[str, List[Dict]], now: float) -> str:
+        """Write the rooms, and their logged updates if any, to one compressed JSON-lines batch file"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime(now))
+        path = os.path.join(self.archive_dir, f'rooms-{stamp}-{os.getpid()}.jsonl.gz')
+        with gzip.open(path, 'at', encoding='utf-8') as f:
+            for room_code, data in rooms_data.items():
+                record = {'archived_at': now, 'room': data}
+                if histories.get(room_code):
+                    record['history'] = histories[room_code]
+                f.write(json.dumps(record) + '\n')
+        return path
+
+    def start(self, interval: float = config.SWEEP_INTERVAL) -> None:
+        """Sweep every interval seconds on a daemon thread"""
+        if interval <= 0 or self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception:
+                    logger.exception("Room sweep failed")
+
+        self._thread = threading.Thread(target=run, name='room-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == "__main__":
+    report = RoomSweeper().sweep()
+    print(f"Reclaimed {report.reclaimed} of {report.idle} idle rooms in {report.seconds:.3f}s"
+          + (f", archived to {report.archive_path}" if report.archive_path else ""))
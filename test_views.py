@@ -0,0 +1,26 @@
+import pytest
+
+import views
+from data import get_catalog
+from game_logic import Game, Player
+
+
+def room_in(phase: str) -> Game:
+    domain = next(iter(get_catalog().values()))
+    game = Game('TEST')
+    for name in ('host', 'ali', 'sara'):
+        game.add_player(Player(name, is_host=name == 'host'))
+    game.set_domain(domain.name)
+    game._apply('select_item', item=domain.items[0], imposter='sara')
+    game.phase = phase
+    return game
+
+
+@pytest.mark.parametrize('phase', views.ITEM_HIDDEN_PHASES)
+def test_non_member_view_hides_the_item(phase):
+    game = room_in(phase)
+    view = views.view_for(game, 'stranger')
+    assert view.role == views.SPECTATOR
+    assert view.item is None
+    assert views.view_for(game, 'ali').item == game.current_item
+    assert views.view_for(game, 'sara').item is None
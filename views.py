@@ -0,0 +1,149 @@
+"""
+Per-role view models of a room, built once per room version.
+
+A client session holds only the RoomView for its role, never the Game:
+
+    player     everything a regular player may see; the item, but not who the imposter is before the reveal
+    imposter   the same, but without the item until the round's scores are in
+    spectator  as the imposter: no item until the scores, no imposter before the reveal
+
+Who is host is part of every view, so host controls need no separate role.
+A player's view is their role's view plus their own vote; a name that isn't
+in the room gets the spectator's view. Views are immutable and memoized on
+the Game they were built from, which is the room cache's shared copy for
+that version, so every session in the process reuses them until the room
+changes.
+"""
+import random
+from dataclasses import dataclass, field, replace
+from typing import Dict, Optional, Tuple
+
+from game_logic import Game
+
+PLAYER = 'player'
+IMPOSTER = 'imposter'
+SPECTATOR = 'spectator'
+ROLES = (PLAYER, IMPOSTER, SPECTATOR)
+
+ITEM_HIDDEN_PHASES = ("discussion", "voting", "reveal", "imposter_guess")  # from the imposter and spectators
+IMPOSTER_REVEALED_PHASES = ("reveal", "imposter_guess", "scores")
+
+
+@dataclass(frozen=True)
+class PlayerRow:
+    name: str
+    score: int
+    is_host: bool
+    voted: bool
+    vote: Optional[str]  # only once the imposter is revealed
+    voted_correctly: bool
+
+
+@dataclass(frozen=True)
+class RoomView:
+    role: str
+    room_code: str
+    version: int
+    phase: str
+    min_players: int
+    domain: Optional[str]
+    item: Optional[str]
+    imposter: Optional[str]
+    imposter_guess: Optional[str]
+    players: Tuple[PlayerRow, ...]  # in joining order
+    ranking: Tuple[PlayerRow, ...]  # best score first
+    votes_cast: int
+    discussion_duration: float
+    discussion_end_time: Optional[float]
+    voting_end_time: Optional[float]
+    deadline: Optional[float]
+    guess_options: Tuple[str, ...]  # the imposter's choices while guessing
+    my_vote: Optional[str] = None  # the viewing player's own vote, in their view only
+    _by_name: Dict[str, PlayerRow] = field(default_factory=dict, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._by_name.update((row.name, row) for row in self.players)
+
+    def player(self, name: str) -> Optional[PlayerRow]:
+        return self._by_name.get(name)
+
+    def is_host(self, name: str) -> bool:
+        row = self._by_name.get(name)
+        return row is not None and row.is_host
+
+    @property
+    def all_votes_submitted(self) -> bool:
+        return self.votes_cast == len(self.players)
+
+    @property
+    def imposter_won(self) -> bool:
+        return self.item is not None and self.imposter_guess == self.item
+
+
+def role_of(game: Game, player_name: str) -> str:
+    """Someone not in the room only gets to spectate, whatever name they claim"""
+    if game.get_player(player_name) is None:
+        return SPECTATOR
+    return IMPOSTER if game.is_player_imposter(player_name) else PLAYER
+
+
+def _build(game: Game, role: str) -> RoomView:
+    revealed = game.phase in IMPOSTER_REVEALED_PHASES
+    hide_item = role != PLAYER and game.phase in ITEM_HIDDEN_PHASES
+    imposter_name = game.imposter.name if game.imposter else None
+    rows = {
+        player.name: PlayerRow(
+            player.name, player.score, player.is_host, player.name in game.votes,
+            game.votes.get(player.name) if revealed else None,
+            revealed and game.did_player_vote_correctly(player.name),
+        )
+        for player in game.players
+    }
+    guess_options = ()
+    if role == IMPOSTER and game.phase == "imposter_guess":
+        # Seeded by the round, so the options stay put across reruns, versions and processes
+        rng = random.Random(f'{game.room_code}:{game.phase_started_at}')
+        guess_options = tuple(game.get_guess_options(rng))
+    if role == IMPOSTER:
+        shown_imposter = imposter_name
+    else:
+        shown_imposter = imposter_name if revealed else None
+    return RoomView(
+        role=role,
+        room_code=game.room_code,
+        version=game.version,
+        phase=game.phase,
+        min_players=game.min_players,
+        domain=game.current_domain,
+        item=None if hide_item else game.current_item,
+        imposter=shown_imposter,
+        imposter_guess=game.imposter_guess if game.phase == "scores" else None,
+        players=tuple(rows.values()),
+        ranking=tuple(rows[player.name] for player in game.ranked_players()),
+        votes_cast=len(game.votes),
+        discussion_duration=game.discussion_duration,
+        discussion_end_time=game.discussion_end_time,
+        voting_end_time=game.voting_end_time,
+        deadline=game.phase_deadline(),
+        guess_options=guess_options,
+    )
+
+
+def project(game: Game, role: str) -> RoomView:
+    """The view of a room for a role, built at most once per room version"""
+    view = game.projections.get(role)
+    if view is None:
+        view = game.projections[role] = _build(game, role)
+    return view
+
+
+def view_for(game: Game, player_name: str) -> RoomView:
+    """The view a player of the room gets; someone not in the room gets the spectator's view"""
+    role_view = project(game, role_of(game, player_name))
+    my_vote = game.votes.get(player_name)
+    if my_vote is None:
+        return role_view
+    view = game.projections.get((role_view.role, player_name))
+    if view is None:
+        view = game.projections[(role_view.role, player_name)] = replace(role_view, my_vote=my_vote)
+    return view
@@ -0,0 +1,143 @@
+"""
+Warm start: preload active rooms and content indexes before taking traffic.
+
+After a deploy or restart every reconnecting client would otherwise load its
+room cold at once. The warm-up finds the rooms worth keeping warm (not past
+their phase's TTL, and no lobby idle for longer than WARMUP_LOBBY_IDLE),
+loads them into the room cache with their player and imposter views on a
+thread pool, and builds the content-pack catalog and the item image index. Loading a room also hands it to the commit
+listeners, so the phase scheduler picks up its deadline.
+
+Until it has finished, /ready on the metrics port answers 503.
+
+    python warmup.py    # cold vs warm first-load latency of every active room
+"""
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+import config
+import metrics
+import storage
+import views
+from assets import get_assets
+from data import get_catalog
+from room_cache import room_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WarmupReport:
+    rooms: int  # active rooms found
+    loaded: int  # rooms now in the room cache
+    failed: int  # rooms that didn't load
+    find_seconds: float
+    load_seconds: float
+    content_seconds: float
+    seconds: float
+
+
+def active_rooms(store: storage.RoomStore = None, now: float = None) -> List[str]:
+    """Rooms the sweeper wouldn't expire, minus lobbies abandoned for WARMUP_LOBBY_IDLE"""
+    store = store or storage.get_store()
+    now = time.time() if now is None else now
+    cutoffs = {phase: now - ttl for phase, ttl in config.ROOM_TTLS.items()}
+    cutoffs['lobby'] = max(cutoffs.get('lobby', now), now - config.WARMUP_LOBBY_IDLE)
+    idle = set(store.idle_rooms(cutoffs, now - config.ROOM_TTL_DEFAULT))
+    return [room_code for room_code in store.room_codes() if room_code not in idle]
+
+
+def _load(room_code: str) -> bool:
+    try:
+        game = storage.load_cached_game_state(room_code)
+        if game is None:
+            return False
+        for role in (views.PLAYER, views.IMPOSTER):
+            views.project(game, role)
+        return True
+    except (ValueError, KeyError, TypeError, AttributeError):
+        logger.warning("Room %s didn't load during warm-up", room_code, exc_info=True)
+        return False
+
+
+def _build_content() -> float:
+    start = time.perf_counter()
+    get_catalog()
+    get_assets()
+    return time.perf_counter() - start
+
+
+def warm_start(threads: int = config.WARMUP_THREADS) -> WarmupReport:
+    """Preload active rooms and content indexes; returns once everything is warm"""
+    start = time.perf_counter()
+    rooms = active_rooms()
+    found = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix='warmup') as pool:
+        content = pool.submit(_build_content)  # alongside the rooms
+        loaded = sum(pool.map(_load, rooms))
+        loaded_at = time.perf_counter()
+        content_seconds = content.result()
+    report = WarmupReport(len(rooms), loaded, len(rooms) - loaded, found - start, loaded_at - found,
+                          content_seconds, time.perf_counter() - start)
+    metrics.WARMUP.observe(report.seconds)
+    logger.info("Warm start: %d of %d active rooms loaded in %.3fs", report.loaded, report.rooms, report.seconds)
+    return report
+
+
+_report: Optional[WarmupReport] = None
+_report_lock = threading.Lock()
+
+
+def ensure_warm() -> WarmupReport:
+    """Run the warm-up once per process and mark the process ready; later callers get its report"""
+    global _report
+    with _report_lock:
+        if _report is None:
+            _report = warm_start() if config.WARMUP_ENABLED else WarmupReport(0, 0, 0, 0, 0, 0, 0)
+            metrics.READY.set()
+    return _report
+
+
+def _first_loads(room_codes: List[str]) -> List[float]:
+    """Time each room's first load the way a reconnecting session's first rerun does"""
+    times = []
+    for room_code in room_codes:
+        start = time.perf_counter()
+        game = storage.load_cached_game_state(room_code)
+        if game is not None and game.players:
+            views.view_for(game, game.players[-1].name)
+        times.append(time.perf_counter() - start)
+    return sorted(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the warm start against the configured room store")
+    parser.add_argument('--threads', type=int, default=config.WARMUP_THREADS)
+    args = parser.parse_args()
+    from simulator import percentile
+
+    rooms = active_rooms()
+    cold = _first_loads(rooms)
+    room_cache.clear()
+    report = warm_start(args.threads)
+    warm = _first_loads(rooms)
+
+    print(f"Warm start: {report.loaded} of {report.rooms} active rooms loaded ({report.failed} failed) "
+          f"in {report.seconds:.3f}s")
+    print(f"  finding rooms {report.find_seconds:.3f}s, loading rooms {report.load_seconds:.3f}s, "
+          f"content indexes {report.content_seconds:.3f}s alongside")
+    print(f"  {'first load (ms)':<20}{'p50':>10}{'p99':>10}{'max':>10}")
+    for label, times in (('cold', cold), ('warm', warm)):
+        if times:
+            print(f"  {label:<20}{percentile(times, 0.5) * 1000:>10.3f}{percentile(times, 0.99) * 1000:>10.3f}"
+                  f"{times[-1] * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()